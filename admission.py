@@ -0,0 +1,133 @@
+"""Contrôle d'admission de /verify : limites de débit et plafond de concurrence.
+
+Tout se décide avant le moindre travail coûteux (token, PTR, IPHub, Discord) :
+
+- seaux à jetons par IP cliente et par token présenté (liens rejoués par un
+  robot, tokens inventés en rafale) → 429 avec ``Retry-After`` ;
+- nombre de requêtes traitées en même temps plafonné, avec une courte file
+  d'attente ; file pleine ou attente trop longue → 503 avec ``Retry-After``.
+
+Les limites sont propres à chaque processus (voir WEB_WORKERS).
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Hashable, Optional, Tuple
+
+
+class RateLimiter:
+    """Seaux à jetons par clé (``rate`` jetons/s, capacité ``burst``), en nombre de clés borné (LRU)."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self.limited = 0
+
+    def hit(self, key: Hashable, cost: float = 1.0) -> float:
+        """Consomme ``cost`` jetons ; retourne 0 si la requête passe, sinon le délai d'attente en secondes."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now)
+            retry_after = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            self.limited += 1
+            retry_after = (cost - tokens) / self.rate
+        self._buckets.move_to_end(key)
+        # Un seau évincé repart plein : au pire une rafale de plus pour une clé inactive depuis longtemps
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"surcharge, réessayer dans {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Au plus ``max_active`` requêtes en cours ; au-delà, ``max_waiting`` attendent au plus ``wait_timeout``."""
+
+    def __init__(self, max_active: int = 64, max_waiting: int = 128, wait_timeout: float = 2.0,
+                 retry_after: float = 5.0):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_active)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise Overloaded(self.retry_after)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise Overloaded(self.retry_after)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+class AdmissionControl:
+    def __init__(self, per_ip: RateLimiter, per_token: RateLimiter, concurrency: ConcurrencyLimiter):
+        self.per_ip = per_ip
+        self.per_token = per_token
+        self.concurrency = concurrency
+
+    def check_rate(self, ip_key: Optional[Hashable], token: Optional[str]) -> Tuple[Optional[str], float]:
+        """Retourne (motif, délai) si la requête dépasse une limite, sinon (None, 0).
+
+        ``ip_key`` doit venir d'une adresse validée (voir ``client_ip``), jamais d'un en-tête brut.
+        """
+        if ip_key:
+            wait = self.per_ip.hit(ip_key)
+            if wait:
+                return 'ip', wait
+        if token:
+            wait = self.per_token.hit(token)
+            if wait:
+                return 'token', wait
+        return None, 0.0
+
+    def stats(self) -> dict:
+        return {
+            "active": self.concurrency.active,
+            "waiting": self.concurrency.waiting,
+            "limited_ip": self.per_ip.limited,
+            "limited_token": self.per_token.limited,
+            "rejected_busy": self.concurrency.rejected,
+            "timed_out": self.concurrency.timed_out,
+            "tracked_ips": len(self.per_ip),
+        }
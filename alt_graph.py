@@ -0,0 +1,196 @@
+"""Regroupement des comptes liés entre eux par des IP communes (union-find).
+
+Chaque vérification relie un compte à son IP (et, si activé, à son
+sous-réseau /24 ou /64). Deux comptes sont dans le même groupe dès qu'un
+chemin les relie, même à travers plusieurs IP successives. L'index est
+construit depuis ``verifications`` au démarrage, mis à jour à chaque nouvelle
+vérification et sauvegardé sur disque pour redémarrer sans tout rejouer :
+seules les lignes postérieures à la sauvegarde sont relues.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from storage import Storage
+
+# Les nœuds IP / sous-réseau sont des bytes préfixés pour ne pas se confondre
+# (l'adresse réseau d'un /24 a le même encodage qu'une IP en .0)
+_IP_TAG = b'i'
+_SUBNET_TAG = b's'
+
+Node = Union[int, bytes]
+
+# Les insertions concurrentes peuvent se terminer dans le désordre : on rejoue
+# une marge de lignes déjà couvertes par la sauvegarde (l'union est idempotente)
+REPLAY_MARGIN = 1000
+
+
+class AltClusterIndex:
+    def __init__(self, snapshot_path: Optional[str] = None, link_subnets: bool = False):
+        self.snapshot_path = snapshot_path
+        self.link_subnets = link_subnets
+        self._parent: Dict[Node, Node] = {}
+        # Membres de chaque groupe, tenus uniquement sur la racine : (comptes, nœuds IP/sous-réseau)
+        self._members: Dict[Node, Tuple[List[int], List[bytes]]] = {}
+        self.last_row_id = 0
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    # ------------------------------------------------------------------ union-find
+
+    def _find(self, node: Node) -> Node:
+        parent = self._parent
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        # Compression de chemin
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    def _ensure(self, node: Node):
+        if node not in self._parent:
+            self._parent[node] = node
+            if isinstance(node, int):
+                self._members[node] = ([node], [])
+            else:
+                self._members[node] = ([], [node])
+
+    def _union(self, a: Node, b: Node) -> Node:
+        ra, rb = self._find(a), self._find(b)
+        if ra == rb:
+            return ra
+        users_a, nets_a = self._members[ra]
+        users_b, nets_b = self._members[rb]
+        # Union par taille : la plus petite liste rejoint la plus grande
+        if len(users_a) + len(nets_a) < len(users_b) + len(nets_b):
+            ra, rb = rb, ra
+            users_a, nets_a, users_b, nets_b = users_b, nets_b, users_a, nets_a
+        self._parent[rb] = ra
+        users_a.extend(users_b)
+        nets_a.extend(nets_b)
+        del self._members[rb]
+        return ra
+
+    def add(self, user_id: int, ip_bin: bytes, ip_subnet: Optional[bytes] = None, row_id: Optional[int] = None):
+        """Enregistre une vérification (compte ↔ IP, et sous-réseau si activé)."""
+        user = int(user_id)
+        ip_node = _IP_TAG + bytes(ip_bin)
+        self._ensure(user)
+        self._ensure(ip_node)
+        self._union(user, ip_node)
+        if self.link_subnets and ip_subnet:
+            subnet_node = _SUBNET_TAG + bytes(ip_subnet)
+            self._ensure(subnet_node)
+            self._union(user, subnet_node)
+        if row_id is not None and row_id > self.last_row_id:
+            self.last_row_id = row_id
+        self.dirty = True
+
+    def cluster(self, user_id: int) -> Tuple[List[int], List[bytes], List[bytes]]:
+        """(comptes, IP binaires, sous-réseaux binaires) du groupe de ``user_id``."""
+        user = int(user_id)
+        if user not in self._parent:
+            return [user], [], []
+        users, nets = self._members[self._find(user)]
+        ips = [n[1:] for n in nets if n[:1] == _IP_TAG]
+        subnets = [n[1:] for n in nets if n[:1] == _SUBNET_TAG]
+        return list(users), ips, subnets
+
+    # ------------------------------------------------------------------ chargement
+
+    def _replay(self, rows: Iterable[Tuple[int, int, bytes, bytes]]) -> int:
+        count = 0
+        for row_id, user_id, ip_bin, ip_subnet in rows:
+            self.add(user_id, ip_bin, ip_subnet, row_id)
+            count += 1
+        return count
+
+    def load(self, storage: Storage) -> int:
+        """Charge la sauvegarde puis rejoue les vérifications plus récentes (synchrone, au démarrage)."""
+        started = time.perf_counter()
+        if self.load_snapshot():
+            max_id = storage.read_sync(lambda conn: conn.execute("SELECT COALESCE(MAX(id), 0) FROM verifications").fetchone()[0])
+            if self.last_row_id > max_id:
+                # Base remplacée ou purgée depuis la sauvegarde : reconstruction complète
+                logging.warning("Sauvegarde des groupes plus récente que la base, reconstruction complète")
+                self._parent.clear()
+                self._members.clear()
+                self.last_row_id = 0
+        rows = storage.read_sync(lambda conn: conn.execute(
+            "SELECT id, user_id, ip_bin, ip_subnet FROM verifications WHERE ip_bin IS NOT NULL AND id > ? ORDER BY id",
+            (max(0, self.last_row_id - REPLAY_MARGIN),)
+        ).fetchall())
+        replayed = self._replay(rows)
+        logging.info(
+            f"Index des groupes de comptes : {len(self)} groupes, {replayed} vérifications rejouées "
+            f"en {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return replayed
+
+    def load_snapshot(self) -> bool:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if bool(data.get('link_subnets')) != self.link_subnets:
+                logging.info("Sauvegarde des groupes ignorée (réglage des sous-réseaux modifié)")
+                return False
+            for users, nets in data.get('clusters', []):
+                nodes: List[Node] = list(users) + [bytes.fromhex(n) for n in nets]
+                for node in nodes:
+                    self._ensure(node)
+                for node in nodes[1:]:
+                    self._union(nodes[0], node)
+            self.last_row_id = data.get('last_row_id', 0)
+        except Exception:
+            logging.exception(f"Impossible de lire la sauvegarde des groupes de comptes ({self.snapshot_path})")
+            self._parent.clear()
+            self._members.clear()
+            self.last_row_id = 0
+            return False
+        self.dirty = False
+        return True
+
+    def _snapshot_data(self) -> dict:
+        return {
+            'link_subnets': self.link_subnets,
+            'last_row_id': self.last_row_id,
+            'clusters': [[list(users), [n.hex() for n in nets]] for users, nets in self._members.values()],
+        }
+
+    def _write_snapshot(self, data: dict):
+        os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.snapshot_path)
+
+    def save_snapshot(self):
+        """Écrit la sauvegarde (remplacement atomique du fichier)."""
+        if not self.snapshot_path:
+            return
+        self._write_snapshot(self._snapshot_data())
+        self.dirty = False
+
+    async def run(self, interval: float = 300):
+        """Tâche de fond : sauvegarde périodique si l'index a changé."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if not self.dirty or not self.snapshot_path:
+                continue
+            # Copie prise sur la boucle (cohérente), écriture JSON dans un thread
+            data = self._snapshot_data()
+            self.dirty = False
+            try:
+                await loop.run_in_executor(None, self._write_snapshot, data)
+            except Exception:
+                self.dirty = True
+                logging.exception(f"Impossible d'écrire la sauvegarde des groupes de comptes ({self.snapshot_path})")
@@ -0,0 +1,277 @@
+"""Micro-benchmarks des chemins chauds : détection, stockage, rendu.
+
+Chaque benchmark exécute ``--number`` opérations, ``--repeat`` fois ; on
+retient la médiane du temps par opération. Les étapes VPN utilisent des
+données enregistrées (``benchmarks/fixtures``) : noms PTR réels, réponses
+IPHub servies par un faux serveur local.
+
+Mode régression : ``--baseline ancien.json`` compare à un run précédent et
+termine en erreur (code 1) si un benchmark ralentit de plus de
+``--threshold`` (20 % par défaut).
+
+Usage :
+    python benchmarks/micro.py --save bench_output.txt
+    python benchmarks/micro.py --baseline bench_output.txt --filter alt_check
+"""
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+DISCORD_EPOCH_MS = 1420070400000
+
+Bench = Callable[[int], Awaitable[None]]
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--number", type=int, default=2000, help="opérations par mesure")
+    p.add_argument("--repeat", type=int, default=5, help="nombre de mesures par benchmark")
+    p.add_argument("--alt-rows", default="10000,1000000",
+                   help="tailles de la table verifications synthétique (ex. 10000,1000000,10000000)")
+    p.add_argument("--filter", default="", help="ne lance que les benchmarks dont le nom contient ce texte")
+    p.add_argument("--baseline", help="JSON d'un run précédent à comparer")
+    p.add_argument("--threshold", type=float, default=0.20, help="ralentissement toléré (0.20 = +20 %%)")
+    p.add_argument("--save", help="fichier où écrire le JSON des résultats")
+    return p.parse_args(argv)
+
+
+def load_lines(name: str) -> List[str]:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def load_json(name: str):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def start_fake_iphub(responses: Dict[str, dict]):
+    async def iphub(request: web.Request) -> web.Response:
+        ip = request.match_info["ip"]
+        return web.json_response(responses.get(ip, {"ip": ip, "countryCode": "FR", "asn": 0, "isp": "", "block": 0}))
+
+    app = web.Application()
+    app.router.add_get("/ip/{ip}", iphub)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}/ip/"
+
+
+def bench_user_id(n: int) -> int:
+    created_ms = int(time.time() * 1000) - 2 * 365 * 86400 * 1000 - DISCORD_EPOCH_MS
+    return (created_ms << 22) + n
+
+
+def build_verifications(bot_module, path: str, rows: int):
+    """Base synthétique : ``rows`` vérifications sur rows/3 IP, compteurs remplis par les triggers."""
+    from migrations import migrate
+    from storage import Storage
+
+    st = Storage(path)
+    with open(os.path.join(ROOT, "schema.sql"), encoding="utf-8") as f:
+        st.executescript_sync(f.read())
+    migrate(st)
+    distinct_ips = max(1, rows // 3)
+    base = int(ipaddress.IPv4Address("10.0.0.0"))
+    chunk = 50000
+    for start in range(0, rows, chunk):
+        batch = []
+        for i in range(start, min(rows, start + chunk)):
+            ip, ip_bin, ip_subnet = bot_module.ip_columns(str(ipaddress.IPv4Address(base + (i % distinct_ips))))
+            batch.append((bench_user_id(i), 1, ip, ip_bin, ip_subnet, "verified"))
+        st.write_sync(lambda conn, batch=batch: conn.executemany(
+            "INSERT INTO verifications (user_id, guild_id, ip_address, ip_bin, ip_subnet, verification_status) "
+            "VALUES (?, ?, ?, ?, ?, ?)", batch))
+    return st, distinct_ips
+
+
+async def measure(bench: Bench, number: int, repeat: int) -> Dict[str, float]:
+    await bench(min(number, 100))  # échauffement (caches, connexions)
+    per_op = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await bench(number)
+        per_op.append((time.perf_counter() - start) / number)
+    median = statistics.median(per_op)
+    return {
+        "median_us": round(median * 1e6, 3),
+        "min_us": round(min(per_op) * 1e6, 3),
+        "ops_per_sec": round(1 / median, 1) if median else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="micro_bench_")
+    recorded = {r["ip"]: r for r in load_json("iphub_responses.json")}
+    iphub_runner, iphub_url = await start_fake_iphub(recorded)
+    os.environ.update({
+        "DB_PATH": os.path.join(workdir, "bench.db"),
+        "CLUSTER_SNAPSHOT_PATH": os.path.join(workdir, "alt_clusters.json"),
+        "TOR_CACHE_PATH": os.path.join(workdir, "tor_exits.json"),
+        "IPHUB_API_URL": iphub_url,
+        "IPHUB_API_KEY": "bench",
+    })
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import bot as bot_module
+    from web_templates import render_html_with_delay
+
+    await bot_module.http_client.start()
+    names = load_lines("rdns_names.txt")
+    iphub_ips = list(recorded)
+    test_ips = [str(ipaddress.IPv4Address("198.18.0.0") + i) for i in range(1, 1025)]
+    bot_module.tor_exits._replace(test_ips[::7])
+
+    # Résolution PTR rejouée depuis le corpus : mesure l'étape, pas le réseau
+    ptr = {ip: names[i % len(names)] for i, ip in enumerate(test_ips)}
+
+    async def resolve(ip):
+        return ptr.get(ip)
+
+    bot_module.rdns_resolver.resolve = resolve
+
+    benches: Dict[str, Bench] = {}
+
+    def stage_bench(stage, ips):
+        async def bench(n):
+            for i in range(n):
+                await stage(ips[i % len(ips)], {"checks": [], "timings": {}})
+        return bench
+
+    benches["vpn_stage/tor"] = stage_bench(bot_module._stage_tor, test_ips)
+    benches["vpn_stage/rdns"] = stage_bench(bot_module._stage_rdns, test_ips)
+    benches["vpn_stage/asn"] = stage_bench(bot_module._stage_asn, test_ips)
+    benches["vpn_stage/iphub"] = stage_bench(bot_module._stage_iphub, iphub_ips)
+
+    async def full_check(n):
+        for i in range(n):
+            await bot_module.check_ip_vpn(iphub_ips[i % len(iphub_ips)])
+    benches["check_ip_vpn/fanout"] = full_check
+
+    async def keyword_match(n):
+        match = bot_module.keyword_matcher.match_hostname
+        for i in range(n):
+            match(names[i % len(names)])
+    benches["keywords/match_hostname"] = keyword_match
+
+    def token_bench(store):
+        async def bench(n):
+            for i in range(n):
+                token = await store.issue(bench_user_id(i), 1)
+                await store.consume(token)
+        return bench
+
+    from token_store import TokenStore
+    benches["tokens/issue_consume"] = token_bench(bot_module.token_store)
+    benches["tokens/issue_consume_signed"] = token_bench(TokenStore(bot_module.storage, secret="bench-secret"))
+
+    async def render(n):
+        for i in range(n):
+            render_html_with_delay("Vérification réussie", "✅ Vérification réussie!", "Vous avez maintenant accès au serveur.",
+                                   details=f"compte {i}", guild_name="Banc", guild_logo="https://example.invalid/a.png")
+    benches["render/html_with_delay"] = render
+
+    results: Dict[str, dict] = {}
+    for name, bench in benches.items():
+        if args.filter in name:
+            results[name] = await measure(bench, args.number, args.repeat)
+            print(f"{name:40s} {results[name]['median_us']:>12.1f} µs/op", file=sys.stderr)
+
+    # check_alt_accounts sur des tables synthétiques de tailles croissantes
+    original_storage = bot_module.storage
+    for size in (int(s) for s in args.alt_rows.split(",") if s.strip()):
+        prefix = f"alt_check/{size}"
+        if not any(args.filter in f"{prefix}/{kind}" for kind in ("miss", "hit")):
+            continue
+        st, distinct_ips = build_verifications(bot_module, os.path.join(workdir, f"alt_{size}.db"), size)
+        bot_module.storage = st
+        try:
+            async def miss(n):
+                for i in range(n):
+                    await bot_module.check_alt_accounts(f"172.16.{i % 250}.{i % 200 + 1}", bench_user_id(10**9 + i), 1)
+
+            async def hit(n):
+                base = ipaddress.IPv4Address("10.0.0.0")
+                for i in range(n):
+                    # IP déjà vue : décision positive + détail borné (la guild est introuvable : pas de kick)
+                    await bot_module.check_alt_accounts(str(base + (i % distinct_ips)), bench_user_id(10**9 + i), 1)
+
+            for kind, bench in (("miss", miss), ("hit", hit)):
+                name = f"{prefix}/{kind}"
+                if args.filter in name:
+                    results[name] = await measure(bench, args.number, args.repeat)
+                    print(f"{name:40s} {results[name]['median_us']:>12.1f} µs/op", file=sys.stderr)
+        finally:
+            bot_module.storage = original_storage
+            st.close()
+
+    await bot_module.http_client.close()
+    await iphub_runner.cleanup()
+    bot_module.rdns_resolver.close()
+    bot_module.storage.close()
+
+    try:
+        version = subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=ROOT, text=True).strip()
+    except Exception:
+        version = "inconnue"
+    return {
+        "benchmark": "micro",
+        "version": version,
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": sys.version.split()[0],
+        "params": {"number": args.number, "repeat": args.repeat, "alt_rows": args.alt_rows},
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """Benchmarks ralentis de plus de ``threshold`` par rapport à la référence."""
+    regressions = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("median_us"):
+            continue
+        ratio = current["median_us"] / previous["median_us"]
+        current["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(f"{name} : {previous['median_us']} → {current['median_us']} µs/op (x{ratio:.2f})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if regressions:
+        print("❌ Régressions détectées :\n  " + "\n  ".join(regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
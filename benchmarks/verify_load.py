@@ -0,0 +1,356 @@
+"""Test de charge de /verify avec des doublures locales de Discord et d'IPHub.
+
+Démarre l'``app`` aiohttp de bot.py sur une base SQLite temporaire, remplace
+les appels Discord du ``bot`` (utilisateurs, guild, membres, rôles, salons)
+par des objets locaux à latence configurable, sert de faux endpoints IPHub et
+Tor sur 127.0.0.1, puis enchaîne N cycles « émission du token + /verify »
+avec une concurrence donnée. Le résultat est un JSON comparable d'une version
+à l'autre (latences p50/p95/p99, débit, taux d'erreur).
+
+Usage :
+    python benchmarks/verify_load.py --requests 2000 --concurrency 50 --output bench_output.txt
+"""
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientSession, TCPConnector, web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DISCORD_EPOCH_MS = 1420070400000
+# 198.18.0.0/15 : plage réservée aux bancs de test (RFC 2544)
+BENCH_NETWORK = ipaddress.ip_network("198.18.0.0/15")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--requests", type=int, default=1000, help="nombre de cycles émission + /verify")
+    p.add_argument("--concurrency", type=int, default=50)
+    p.add_argument("--warmup", type=int, default=50, help="cycles exclus des statistiques")
+    p.add_argument("--iphub-latency", type=float, default=0.05, help="latence du faux IPHub (s)")
+    p.add_argument("--iphub-block-ratio", type=float, default=0.05, help="part des IP signalées par le faux IPHub")
+    p.add_argument("--rdns-latency", type=float, default=0.005, help="latence de la fausse résolution PTR (s)")
+    p.add_argument("--discord-latency", type=float, default=0.05, help="latence des faux appels REST Discord (s)")
+    p.add_argument("--tor-ratio", type=float, default=0.01, help="part des IP présentes dans la fausse liste Tor")
+    p.add_argument("--alt-ratio", type=float, default=0.0, help="part des cycles réutilisant l'IP d'un autre compte")
+    p.add_argument("--ip-pool", type=int, default=0, help="taille du pool d'IP (0 : une IP par cycle)")
+    p.add_argument("--signed-tokens", action="store_true", help="active le mode token signé (TOKEN_SECRET)")
+    p.add_argument("--output", help="fichier où écrire le JSON (en plus de la sortie standard)")
+    return p.parse_args(argv)
+
+
+# ---------------------------------------------------------------------- doublures Discord
+
+class FakeAsset:
+    def __init__(self, url: str):
+        self.url = url
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"bench{user_id % 100000}"
+        self.global_name = None
+        self.avatar = None
+        self.default_avatar = FakeAsset("https://cdn.discordapp.com/embed/avatars/0.png")
+        ms = (user_id >> 22) + DISCORD_EPOCH_MS
+        self.created_at = datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc)
+
+
+class FakeMember(FakeUser):
+    def __init__(self, user_id: int, guild: "FakeGuild"):
+        super().__init__(user_id)
+        self.guild = guild
+        self.roles: List[FakeRole] = []
+
+    async def add_roles(self, *roles, reason=None):
+        await asyncio.sleep(self.guild.latency)
+        self.guild.calls["add_roles"] += 1
+        self.roles.extend(r for r in roles if r not in self.roles)
+
+    async def kick(self, reason=None):
+        await asyncio.sleep(self.guild.latency)
+        self.guild.calls["kick"] += 1
+        self.guild.members.pop(self.id, None)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, latency: float, calls: Dict[str, int]):
+        self.id = channel_id
+        self.name = "logs"
+        self.latency = latency
+        self.calls = calls
+
+    async def send(self, content=None, embed=None, embeds=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.calls["channel_send"] += 1
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, latency: float):
+        self.id = guild_id
+        self.name = "Banc de charge"
+        self.latency = latency
+        self.calls: Dict[str, int] = {"add_roles": 0, "kick": 0, "channel_send": 0, "fetch_user": 0}
+        self.members: Dict[int, FakeMember] = {}
+        self.roles = [FakeRole(1, "Vérifié")]
+        self.text_channels = [FakeChannel(2, latency, self.calls)]
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        member = self.members.get(user_id)
+        if member is None:
+            member = self.members[user_id] = FakeMember(user_id, self)
+        return member
+
+    async def fetch_member(self, user_id: int) -> FakeMember:
+        await asyncio.sleep(self.latency)
+        return self.get_member(user_id)
+
+
+def install_discord_doubles(bot_module, guild: FakeGuild, rdns_latency: float):
+    bot = bot_module.bot
+    channel = guild.text_channels[0]
+
+    async def wait_until_ready():
+        return None
+
+    async def fetch_user(user_id):
+        await asyncio.sleep(guild.latency)
+        guild.calls["fetch_user"] += 1
+        return FakeUser(user_id)
+
+    async def fetch_channel(channel_id):
+        await asyncio.sleep(guild.latency)
+        return channel
+
+    bot.wait_until_ready = wait_until_ready
+    bot.get_user = lambda user_id: None
+    bot.fetch_user = fetch_user
+    bot.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+    bot.get_channel = lambda channel_id: channel
+    bot.fetch_channel = fetch_channel
+    # Les logs passent par le salon factice, pas par un webhook
+    bot_module.log_dispatcher.webhook_url = None
+
+    # Résolution PTR locale : pas de requête DNS réelle pendant le banc
+    async def resolve(ip):
+        await asyncio.sleep(rdns_latency)
+        return None
+
+    bot_module.rdns_resolver.resolve = resolve
+
+
+# ---------------------------------------------------------------------- faux IPHub / Tor
+
+def make_upstream_app(args, tor_ips: List[str]) -> web.Application:
+    app = web.Application()
+    rng = random.Random(1)
+    blocked = {}
+
+    async def iphub(request: web.Request) -> web.Response:
+        await asyncio.sleep(args.iphub_latency)
+        ip = request.match_info["ip"]
+        if ip not in blocked:
+            blocked[ip] = 1 if rng.random() < args.iphub_block_ratio else 0
+        return web.json_response({"ip": ip, "countryCode": "FR", "asn": 64500, "isp": "BENCH", "block": blocked[ip]})
+
+    async def tor(request: web.Request) -> web.Response:
+        lines = []
+        for ip in tor_ips:
+            lines += [f"ExitNode {abs(hash(ip)):040X}", f"ExitAddress {ip} 2024-01-01 00:00:00"]
+        return web.Response(text="\n".join(lines) + "\n")
+
+    app.router.add_get("/ip/{ip}", iphub)
+    app.router.add_get("/exit-addresses", tor)
+    return app
+
+
+async def start_site(app: web.Application):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+# ---------------------------------------------------------------------- mesures
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentile par rang le plus proche."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p95": round(percentile(values, 95) * 1000, 2),
+        "p99": round(percentile(values, 99) * 1000, 2),
+        "max": round((values[-1] if values else 0) * 1000, 2),
+        "mean": round((sum(values) / len(values) if values else 0) * 1000, 2),
+    }
+
+
+def git_version() -> str:
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "inconnue"
+
+
+def bench_user_id(n: int) -> int:
+    # Compte créé il y a environ deux ans : passe le contrôle d'âge minimum
+    created_ms = int(time.time() * 1000) - 2 * 365 * 86400 * 1000 - DISCORD_EPOCH_MS
+    return (created_ms << 22) + n
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="verify_bench_")
+    hosts = BENCH_NETWORK.hosts()
+    total = args.warmup + args.requests
+    pool_size = args.ip_pool or total
+    ips = [str(next(hosts)) for _ in range(pool_size)]
+    rng = random.Random(42)
+    tor_ips = [ip for ip in ips if rng.random() < args.tor_ratio]
+
+    upstream = make_upstream_app(args, tor_ips)
+    upstream_runner, upstream_url = await start_site(upstream)
+
+    os.environ.update({
+        "DB_PATH": os.path.join(workdir, "bench.db"),
+        "CLUSTER_SNAPSHOT_PATH": os.path.join(workdir, "alt_clusters.json"),
+        "TOR_CACHE_PATH": os.path.join(workdir, "tor_exits.json"),
+        "TOR_EXIT_URL": f"{upstream_url}/exit-addresses",
+        "IPHUB_API_URL": f"{upstream_url}/ip/",
+        "IPHUB_API_KEY": "bench",
+        "SLOW_REQUEST_MS": os.environ.get("SLOW_REQUEST_MS", "5000"),
+    })
+    if args.signed_tokens:
+        os.environ["TOKEN_SECRET"] = "bench-secret"
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import bot as bot_module
+
+    guild = FakeGuild(424242, args.discord_latency)
+    install_discord_doubles(bot_module, guild, args.rdns_latency)
+
+    await bot_module.http_client.start()
+    await bot_module.tor_exits.refresh()
+    background = [
+        asyncio.create_task(bot_module.log_dispatcher.run()),
+        asyncio.create_task(bot_module.job_queue.run(bot_module.bot)),
+    ]
+    runner, base_url = await start_site(bot_module.app)
+
+    results: List[Optional[dict]] = [None] * total
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def cycle(i: int, session: ClientSession):
+        async with semaphore:
+            user_id = bench_user_id(i)
+            if i and rng.random() < args.alt_ratio:
+                ip = ips[rng.randrange(min(i, pool_size))]
+            else:
+                ip = ips[i % pool_size]
+            start = time.perf_counter()
+            try:
+                # Même chemin que le bouton « Vérifier » : token + profil mis en cache
+                token = await bot_module.token_store.issue(user_id, guild.id)
+                bot_module.profile_cache.remember(FakeUser(user_id))
+                issued = time.perf_counter()
+                async with session.get(f"{base_url}/verify", params={"token": token},
+                                       headers={"X-Forwarded-For": ip}) as resp:
+                    await resp.read()
+                    status = resp.status
+                end = time.perf_counter()
+                results[i] = {"status": status, "issue": issued - start, "verify": end - issued, "total": end - start}
+            except Exception as e:
+                results[i] = {"status": None, "error": type(e).__name__, "total": time.perf_counter() - start}
+
+    connector = TCPConnector(limit=args.concurrency)
+    async with ClientSession(connector=connector) as session:
+        await asyncio.gather(*(cycle(i, session) for i in range(args.warmup)))
+        started = time.perf_counter()
+        await asyncio.gather(*(cycle(i, session) for i in range(args.warmup, total)))
+        elapsed = time.perf_counter() - started
+
+    measured = [r for r in results[args.warmup:] if r is not None]
+    statuses: Dict[str, int] = {}
+    for r in measured:
+        key = str(r["status"]) if r["status"] is not None else r.get("error", "error")
+        statuses[key] = statuses.get(key, 0) + 1
+    errors = sum(1 for r in measured if r["status"] is None or r["status"] >= 500)
+    ok = [r for r in measured if r["status"] is not None]
+
+    # Laisse le worker vider la file avant de relever les appels Discord
+    for _ in range(50):
+        if not bot_module.job_queue.depth:
+            break
+        await asyncio.sleep(0.1)
+
+    report = {
+        "benchmark": "verify_load",
+        "version": git_version(),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": sys.version.split()[0],
+        "params": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": {
+            "requests": len(measured),
+            "duration_s": round(elapsed, 3),
+            "throughput_rps": round(len(measured) / elapsed, 1) if elapsed else 0.0,
+            "error_rate": round(errors / len(measured), 4) if measured else 0.0,
+            "status_counts": statuses,
+            "latency_ms": {
+                "total": summarize([r["total"] for r in ok]),
+                "token_issue": summarize([r["issue"] for r in ok]),
+                "verify": summarize([r["verify"] for r in ok]),
+            },
+            "outcomes": {k[0]: v for k, v in bot_module.VERIFY_OUTCOMES._values.items()},
+            "discord_calls": dict(guild.calls),
+            "pending_jobs": bot_module.job_queue.depth,
+        },
+    }
+
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await runner.cleanup()
+    await upstream_runner.cleanup()
+    await bot_module.http_client.close()
+    bot_module.rdns_resolver.close()
+    bot_module.storage.close()
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
 import ipaddress
 import os
 import asyncio
-import secrets
 import logging
-import sqlite3
 import datetime
+import functools
+import io
+import signal
+import sys
+import tempfile
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import json
-from typing import Dict, Tuple, Optional, List
+from typing import Awaitable, Callable, Dict, Tuple, Optional, List
 from dotenv import load_dotenv
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
@@ -15,14 +19,33 @@ import aiohttp
 from aiohttp import request, web
 import discord
 from discord.ext import commands
+from admission import AdmissionControl, ConcurrencyLimiter, Overloaded, RateLimiter, retry_after_header
+from alt_graph import AltClusterIndex
 from bot_setup import setup_bot
-import socket
+from discord_jobs import PRIORITY_GRANT, PRIORITY_KICK, PRIORITY_LOG, Job, JobDropped, JobQueue
+from gateway_ipc import GatewayClient, GatewayServer, GatewayUnavailable
+from http_client import CircuitBreaker, HttpClient
+from iputils import canonical_ip, ip_columns, normalize_ip, subnet_prefix, unpack_ip
+from ip_list_io import export_entries, import_entries, open_text
+from ip_trie import IPListIndex, format_list_entry, parse_list_entry
+from keyword_matcher import KeywordMatcher, build_suspect_asns
+from log_dispatcher import LogDispatcher
+from metrics import REGISTRY, LogRecordCounter, MetricsAggregator, metrics_handler
+from migrations import migrate
+from profiling import ProfilerBusy, cpu_profile, memory_profile
+from profile_cache import DEFAULT_AVATAR_URL, Profile, ProfileCache, snowflake_created_at
+from rdns import ReverseResolver
+from storage import Storage
+from web_templates import (
+    compression_middleware, handle_static, prerender_page, prerendered_response, render_html_with_delay,
+)
+from token_store import TokenStore
+from tracing import Tracer, annotate, span
+from tor_list import TorExitList
+from verdict_cache import VerdictCache
+from web_workers import WorkerSupervisor, worker_id
 import time
-try:
-    import geoip2.database
-    GEOIP_AVAILABLE = True
-except Exception:
-    GEOIP_AVAILABLE = False
+from geoip_reader import GeoIPDatabase, watch_databases
 
 logging.basicConfig(level=logging.INFO)
 
@@ -38,55 +61,96 @@ WEB_PORT = int(os.getenv("WEB_PORT", "8080"))
 DB_PATH = os.getenv("DB_PATH", "verifications.db")
 MIN_ACCOUNT_AGE_DAYS = int(os.getenv("MIN_ACCOUNT_AGE_DAYS", "180"))  
 MAX_ACCOUNTS_PER_IP = int(os.getenv("MAX_ACCOUNTS_PER_IP", "1"))  
+# 'global' : un compte vérifié sur n'importe quelle guild compte ; 'guild' : seulement sur la même guild
+ALT_DETECTION_SCOPE = os.getenv("ALT_DETECTION_SCOPE", "global").lower()
+ALT_DETAIL_LIMIT = int(os.getenv("ALT_DETAIL_LIMIT", "10"))
 
 if not DISCORD_TOKEN:
     logging.warning("DISCORD_TOKEN non défini. Le bot ne pourra pas se connecter tant que la variable d'environnement n'est pas définie.")
 
 
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+
+# Mode multi-processus : WEB_WORKERS processus servent /verify (SO_REUSEPORT) et délèguent
+# les actions Discord à ce processus-ci (gateway) par un socket Unix. 0 = tout dans un seul processus.
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))
+GATEWAY_SOCKET = os.getenv("GATEWAY_SOCKET", "data/gateway.sock")
+WEB_WORKER_ID = worker_id()
+IS_WEB_WORKER = WEB_WORKER_ID is not None
+# Métriques : chaque processus web pousse les siennes à la gateway, qui sert l'ensemble sur son propre port
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+GATEWAY_METRICS_PORT = int(os.getenv("GATEWAY_METRICS_PORT", str(WEB_PORT + 1)))
+METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", "15"))
+if WEB_WORKERS > 0:
+    REGISTRY.set_const_labels(worker=str(WEB_WORKER_ID) if IS_WEB_WORKER else "gateway")
+
+# Opérations exécutées par la gateway : appel direct en mono-processus, via l'IPC depuis un processus web
+GATEWAY_OPS: Dict[str, Callable[..., Awaitable]] = {}
+gateway_server = GatewayServer(GATEWAY_SOCKET, GATEWAY_OPS) if WEB_WORKERS > 0 and not IS_WEB_WORKER else None
+gateway_client = GatewayClient(
+    GATEWAY_SOCKET,
+    timeout=float(os.getenv("GATEWAY_IPC_TIMEOUT", "10")),
+    on_connect=lambda: asyncio.create_task(reload_ip_lists()),
+) if IS_WEB_WORKER else None
+metrics_aggregator = MetricsAggregator(max_age=3 * METRICS_PUSH_INTERVAL) if gateway_server is not None else None
+web_supervisor: Optional[WorkerSupervisor] = None
+
+
+def gateway_op(name: str):
+    def decorator(fn):
+        GATEWAY_OPS[name] = fn
+        return fn
+    return decorator
+
+
+async def call_gateway(op: str, **args):
+    """Exécute une opération Discord ; les arguments et le résultat doivent être sérialisables en JSON."""
+    if gateway_client is None:
+        return await GATEWAY_OPS[op](**args)
+    return await gateway_client.call(op, **args)
+
+storage = Storage(DB_PATH, readers=DB_READERS)
+
+
 def init_db():
     with open('schema.sql', 'r', encoding='utf-8') as f:
         schema = f.read()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.executescript(schema)
+    storage.executescript_sync(schema)
+    migrate(storage)
     logging.info(f"Base de données initialisée : {DB_PATH}")
 
-init_db()
+# Les processus web sont lancés par la gateway après ses migrations
+if not IS_WEB_WORKER:
+    init_db()
 
 
-with sqlite3.connect(DB_PATH) as _conn:
-    _conn.execute("""
-    CREATE TABLE IF NOT EXISTS pending_tokens (
-        token TEXT PRIMARY KEY,
-        user_id INTEGER NOT NULL,
-        guild_id INTEGER,
-        created_at TEXT NOT NULL
-    )
-    """)
-
-
-def save_pending_token_db(token: str, user_id: int, guild_id: Optional[int]):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO pending_tokens (token, user_id, guild_id, created_at) VALUES (?, ?, ?, ?)",
-            (token, user_id, guild_id, datetime.datetime.utcnow().isoformat() + "Z")
-        )
-
+verdict_cache = VerdictCache(
+    storage,
+    max_size=int(os.getenv("VERDICT_CACHE_SIZE", "10000")),
+    ttl_positive=float(os.getenv("VERDICT_TTL_POSITIVE", str(24 * 3600))),
+    ttl_negative=float(os.getenv("VERDICT_TTL_NEGATIVE", str(6 * 3600))),
+    ttl_error=float(os.getenv("VERDICT_TTL_ERROR", "300")),
+)
+verdict_cache.load()
 
-def pop_pending_token_db(token: str) -> Optional[Tuple[int, Optional[int]]]:
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.execute("SELECT user_id, guild_id FROM pending_tokens WHERE token = ?", (token,))
-        row = cur.fetchone()
-        if not row:
-            return None
-        conn.execute("DELETE FROM pending_tokens WHERE token = ?", (token,))
-        return row[0], row[1]
+alt_graph = AltClusterIndex(
+    snapshot_path=os.getenv("CLUSTER_SNAPSHOT_PATH", "data/alt_clusters.json"),
+    link_subnets=os.getenv("CLUSTER_LINK_SUBNETS", "false").lower() in ("1", "true", "yes"),
+)
+if not IS_WEB_WORKER:
+    alt_graph.load(storage)
 
 
-def load_pending_tokens_from_db() -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        rows = conn.execute("SELECT token, user_id, guild_id FROM pending_tokens").fetchall()
-    for t, u, g in rows:
-        pending_tokens[t] = (u, g)
+TOKEN_TTL = int(os.getenv("TOKEN_TTL", "1800"))
+token_store = TokenStore(
+    storage,
+    ttl=TOKEN_TTL,
+    max_memory=int(os.getenv("TOKEN_MAX_MEMORY", "10000")),
+    sweep_interval=float(os.getenv("TOKEN_SWEEP_INTERVAL", "300")),
+    secret=os.getenv("TOKEN_SECRET") or None,
+)
+token_store.load()
+TOKEN_EXPIRY_FOOTER = f"Ce lien est personnel et expirera dans {TOKEN_TTL // 60} minutes."
 
 
 def add_ip_to_config(list_type: str, ip: str, reason: str, added_by: int):
@@ -109,10 +173,101 @@ def add_ip_to_config(list_type: str, ip: str, reason: str, added_by: int):
 
 
 
-pending_tokens: Dict[str, Tuple[int, Optional[int]]] = {}
+ip_list_index = IPListIndex()
+
+
+def _build_ip_list_index(conn) -> IPListIndex:
+    index = IPListIndex()
+    cur = conn.execute("SELECT ip_address, list_type, added_by, reason FROM ip_lists")
+    for row in cur:
+        parsed = parse_list_entry(row['ip_address'])
+        if parsed is None:
+            logging.warning(f"Entrée ip_lists invalide ignorée : {row['ip_address']!r}")
+            continue
+        index.add(*parsed, {
+            'entry': row['ip_address'],
+            'list_type': row['list_type'],
+            'added_by': row['added_by'],
+            'reason': row['reason'],
+        })
+    return index
+
+
+def load_ip_lists() -> None:
+    """(Re)construit l'index mémoire (trie CIDR + ASN) à partir de la table ip_lists."""
+    global ip_list_index
+    ip_list_index = storage.read_sync(_build_ip_list_index)
+    logging.info(f"Listes IP chargées : {len(ip_list_index)} entrées")
+
+
+async def reload_ip_lists() -> None:
+    """Comme ``load_ip_lists``, mais construit l'index dans un thread lecteur (après un import en masse)."""
+    global ip_list_index
+    ip_list_index = await storage.read(_build_ip_list_index)
+    logging.info(f"Listes IP rechargées : {len(ip_list_index)} entrées")
+
+
+def _on_ip_list_add(entry: str, list_type: str, added_by: int, reason: str):
+    """Processus web : applique un ajout fait depuis la gateway (commande admin)."""
+    parsed = parse_list_entry(entry)
+    if parsed is not None:
+        ip_list_index.add(*parsed, {'entry': entry, 'list_type': list_type, 'added_by': added_by, 'reason': reason})
+
+
+if gateway_client is not None:
+    gateway_client.on_event("ip_list_add", _on_ip_list_add)
+    gateway_client.on_event("ip_lists_reload", lambda: asyncio.create_task(reload_ip_lists()))
+
+
+def lookup_ip_list(ip: str) -> Optional[dict]:
+    """Entrée whitelist/blacklist la plus précise pour ``ip`` (recherche en mémoire)."""
+    asn = None
+    if ip_list_index.has_asn_entries and geoip_asn.available:
+        asn = geoip_asn.asn(ip)[0]
+    return ip_list_index.lookup(ip, asn)
+
+
+async def fetch_ip_report(ip: str):
+    """Retourne (statut liste, derniers comptes, nb de comptes du même sous-réseau) pour une IP valide."""
+    _, ip_bin, ip_subnet = ip_columns(ip)
+    status = lookup_ip_list(ip)
+
+    def _report(conn):
+        accounts = conn.execute("""
+            SELECT user_id, guild_id, created_at, verification_status
+            FROM verifications WHERE ip_bin = ?
+            ORDER BY created_at DESC LIMIT 10
+        """, (ip_bin,)).fetchall()
+        subnet_accounts = conn.execute(
+            "SELECT COUNT(DISTINCT user_id) FROM verifications WHERE ip_subnet = ?",
+            (ip_subnet,)
+        ).fetchone()[0]
+        return accounts, subnet_accounts
+    accounts, subnet_accounts = await storage.read(_report)
+    return status, accounts, subnet_accounts
+
+
+async def set_ip_list(entry: str, list_type: str, added_by: int, reason: str) -> Optional[str]:
+    """Ajoute une IP, une plage CIDR ou un ASN à une liste. Retourne l'entrée canonique (None si invalide)."""
+    parsed = parse_list_entry(entry)
+    if parsed is None:
+        return None
+    entry = format_list_entry(*parsed)
+    cols = ip_columns(entry)
+    await storage.execute(
+        "INSERT OR REPLACE INTO ip_lists (ip_address, ip_bin, list_type, added_by, reason) VALUES (?, ?, ?, ?, ?)",
+        (entry, cols[1] if cols else None, list_type, added_by, reason)
+    )
+    ip_list_index.add(*parsed, {'entry': entry, 'list_type': list_type, 'added_by': added_by, 'reason': reason})
+    if gateway_server is not None:
+        gateway_server.broadcast("ip_list_add", entry=entry, list_type=list_type, added_by=added_by, reason=reason)
+    return entry
+
+
+profile_cache = ProfileCache(ttl=float(os.getenv("PROFILE_CACHE_TTL", str(6 * 3600))))
 
 
-load_pending_tokens_from_db()
+load_ip_lists()
 
 
 
@@ -148,9 +303,8 @@ class UniversalVerifyView(discord.ui.View):
     async def verify_button(self, interaction_button: discord.Interaction, button: discord.ui.Button):
         user = interaction_button.user
         guild_id = interaction_button.guild_id or (interaction_button.user.guild.id if hasattr(interaction_button.user, 'guild') else None)
-        token = secrets.token_urlsafe(16)
-        pending_tokens[token] = (user.id, interaction_button.guild_id)
-        save_pending_token_db(token, user.id, interaction_button.guild_id)
+        token = await token_store.issue(user.id, interaction_button.guild_id)
+        profile_cache.remember(user)
         verify_link = f"{BASE_URL}/verify?token={token}"
 
         private_embed = discord.Embed(
@@ -160,7 +314,7 @@ class UniversalVerifyView(discord.ui.View):
             color=0x3498DB,
         )
         private_embed.add_field(name="Lien de vérification (privé)", value=f"[Ouvrir le lien]({verify_link})", inline=False)
-        private_embed.set_footer(text="Ce lien est personnel et expirera si vous ne l'utilisez pas.")
+        private_embed.set_footer(text=TOKEN_EXPIRY_FOOTER)
         try:
             await interaction_button.response.send_message(embed=private_embed, ephemeral=True)
         except Exception:
@@ -172,122 +326,34 @@ class UniversalVerifyView(discord.ui.View):
 
 
 
-def render_html_page(
-    title: str,
-    heading: str,
-    message: str,
-    details: Optional[str] = None,
-    guild_name: str = "Serveur Discord",
-    guild_logo: str = "https://i.imgur.com/8Km9tLL.png",
-    accent_color: str = "#2ECC71"
-) -> str:
-    """Page statique moderne et responsive avec thème dynamique."""
-    safe_details = f"<p class='details'>{details}</p>" if details else ""
-
-    html = f"""
-    <!doctype html>
-    <html lang="fr">
-    <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width,initial-scale=1">
-        <title>{title}</title>
-        <style>
-            :root {{
-                color-scheme: light dark;
-                --accent: {accent_color};
-                --bg-dark: #0f1724;
-                --bg-light: #f3f4f6;
-                --text-dark: #e6eef8;
-                --text-light: #1e293b;
-            }}
-            @media (prefers-color-scheme: light) {{
-                body {{ background: var(--bg-light); color: var(--text-light); }}
-                .card {{ background: white; color: var(--text-light); }}
-                .btn {{ background: var(--accent); color: white; }}
-            }}
-            @media (prefers-color-scheme: dark) {{
-                body {{ background: var(--bg-dark); color: var(--text-dark); }}
-                .card {{ background: rgba(255,255,255,0.05); color: var(--text-dark); }}
-                .btn {{ background: var(--accent); color: #07203a; }}
-            }}
-            body {{
-                font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial;
-                display:flex; align-items:center; justify-content:center;
-                margin:0; padding:0; min-height:100vh;
-            }}
-            .card {{
-                border-radius:18px;
-                padding:32px;
-                width:95%; max-width:720px;
-                text-align:center;
-                box-shadow:0 6px 30px rgba(0,0,0,0.3);
-                animation: fadeIn 1s ease-in-out;
-            }}
-            @keyframes fadeIn {{
-                from {{ opacity:0; transform:translateY(20px); }}
-                to {{ opacity:1; transform:none; }}
-            }}
-            img.logo {{
-                width:90px; height:90px; border-radius:50%;
-                margin-bottom:12px;
-                box-shadow:0 0 12px var(--accent);
-            }}
-            h1 {{ font-size:24px; color: var(--accent); margin:8px 0; }}
-            p {{ line-height:1.5; margin:8px 0; }}
-            .details {{ font-size:13px; color:#9fb7d3; }}
-            .btn {{
-                display:inline-block;
-                margin-top:16px;
-                padding:12px 18px;
-                border-radius:10px;
-                text-decoration:none;
-                font-weight:600;
-                transition: all 0.2s ease;
-            }}
-            .btn:hover {{
-                transform:scale(1.05);
-                filter:brightness(1.1);
-            }}
-            footer {{ margin-top:16px; font-size:13px; color:#9fb7d3; }}
-        </style>
-    </head>
-    <body>
-        <div class="card">
-            <img src="{guild_logo}" class="logo" alt="Logo serveur">
-            <h1>{heading}</h1>
-            <p>{message}</p>
-            {safe_details}
-            <a class="btn" href="/">Retour</a>
-            <footer>{guild_name} — {datetime.datetime.utcnow().isoformat()}Z</footer>
-        </div>
-    </body>
-    </html>
-    """
-    return html
+async def fetch_profile(user_id: int) -> Profile:
+    """Profil Discord ; un processus web le demande à la gateway et le garde dans son propre cache."""
+    if gateway_client is None:
+        return await profile_cache.fetch(bot, user_id)
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        username, avatar_url = await gateway_client.call("user_profile", user_id=user_id)
+        profile = Profile(username, avatar_url, snowflake_created_at(user_id))
+        profile_cache.put(user_id, profile)
+    return profile
+
 
 async def get_user_avatar_url(user_id: int) -> str:
     """Retourne l'URL de l'avatar Discord (ou une image par défaut)."""
     try:
-        user = await bot.fetch_user(user_id)
-        
-        if user.avatar:
-            return user.avatar.url
-        else:
-            return user.default_avatar.url
+        return (await fetch_profile(user_id)).avatar_url
     except Exception as e:
         logging.warning(f"Impossible de récupérer l'avatar pour {user_id}: {e}")
-        return "https://cdn.discordapp.com/embed/avatars/0.png"
+        return DEFAULT_AVATAR_URL
 
 async def get_user_profile(user_id: int) -> Tuple[str, str]:
-    """Retourne (avatar_url, username)"""
+    """Retourne (avatar_url, username) — depuis le cache, sans appel REST dans le cas courant."""
     try:
-        user = await bot.fetch_user(user_id)
-        avatar_url = user.avatar.url if user.avatar else user.default_avatar.url
-        username = user.global_name or user.name  
-        return avatar_url, username
+        profile = await fetch_profile(user_id)
+        return profile.avatar_url, profile.username
     except Exception as e:
         logging.warning(f"Impossible de récupérer le profil Discord pour {user_id}: {e}")
-        return "https://cdn.discordapp.com/embed/avatars/0.png", "Utilisateur inconnu"
+        return DEFAULT_AVATAR_URL, "Utilisateur inconnu"
 
 
 
@@ -333,99 +399,6 @@ async def update_rich_presence():
 
 
 
-def render_html_with_delay(
-    title: str,
-    heading: str,
-    message: str,
-    details: Optional[str] = None,
-    delay_ms: int = 6000,
-    guild_name: str = "Serveur Discord",
-    guild_logo: str = "https://i.imgur.com/8Km9tLL.png",
-    accent_color: str = "#2ECC71"
-) -> str:
-    """Page dynamique avec spinner + transition douce du résultat."""
-    safe_details = f"<p class='details'>{details}</p>" if details else ""
-
-    html = f"""
-    <!doctype html>
-    <html lang="fr">
-    <head>
-      <meta charset="utf-8">
-      <meta name="viewport" content="width=device-width,initial-scale=1">
-      <title>{title}</title>
-      <style>
-        :root {{
-          color-scheme: light dark;
-          --accent: {accent_color};
-          --bg-dark: #0f1724;
-          --bg-light: #f3f4f6;
-          --text-dark: #e6eef8;
-          --text-light: #1e293b;
-        }}
-        body {{
-          font-family:'Inter', system-ui, sans-serif;
-          display:flex; align-items:center; justify-content:center;
-          margin:0; padding:0; min-height:100vh;
-          background:var(--bg-dark); color:var(--text-dark);
-        }}
-        @media (prefers-color-scheme: light) {{
-          body {{ background:var(--bg-light); color:var(--text-light); }}
-        }}
-        .card {{
-          background: rgba(255,255,255,0.05);
-          border-radius:18px; padding:32px;
-          max-width:720px; width:95%;
-          text-align:center;
-          box-shadow:0 6px 30px rgba(0,0,0,0.3);
-        }}
-        img.logo {{
-          width:90px; height:90px; border-radius:50%;
-          margin-bottom:10px;
-          box-shadow:0 0 12px var(--accent);
-        }}
-        h1 {{ font-size:22px; color:var(--accent); margin:10px 0; }}
-        p {{ margin:8px 0; line-height:1.6; }}
-        .details {{ font-size:13px; color:#9fb7d3; }}
-        .btn {{ display:inline-block; margin-top:16px; background:var(--accent); color:#07203a; padding:12px 18px; border-radius:10px; text-decoration:none; font-weight:600; }}
-        .spinner {{ width:64px; height:64px; margin:20px auto; border-radius:50%; border:6px solid rgba(255,255,255,0.12); border-top-color:var(--accent); animation:spin 1s linear infinite; }}
-        @keyframes spin {{ to {{ transform:rotate(360deg); }} }}
-        .fadeIn {{ animation: fadeIn 0.8s ease-in-out; }}
-        @keyframes fadeIn {{ from {{ opacity:0; }} to {{ opacity:1; }} }}
-        footer {{ margin-top:16px; font-size:13px; color:#9fb7d3; }}
-      </style>
-    </head>
-    <body>
-      <div class="card">
-        <div id="analysis" class="fadeIn">
-          <img src="{guild_logo}" class="logo" alt="Logo serveur">
-          <h1>Analyse en cours...</h1>
-          <div class="spinner"></div>
-          <p class="muted">Le système vérifie votre identité, cela prend quelques secondes...</p>
-        </div>
-
-        <div id="result" style="display:none" class="fadeIn">
-          <img src="{guild_logo}" class="logo" alt="Logo serveur">
-          <h1>{heading}</h1>
-          <p>{message}</p>
-          {safe_details}
-          <a class="btn" href="/">Retour</a>
-          <footer>{guild_name} — {datetime.datetime.utcnow().isoformat()}Z</footer>
-        </div>
-      </div>
-
-      <script>
-        setTimeout(() => {{
-          document.getElementById('analysis').style.display = 'none';
-          document.getElementById('result').style.display = 'block';
-        }}, {delay_ms});
-      </script>
-    </body>
-    </html>
-    """
-    return html
-
-
-
 intents = discord.Intents.default()
 intents.members = True  
 intents.message_content = True  
@@ -458,15 +431,238 @@ class VerificationBot(commands.Bot):
         except Exception as e:
             logging.exception("Erreur lors de la synchronisation des commandes slash")
 
-bot = VerificationBot()
+        self.geoip_watch_task, self.tor_refresh_task = await start_detection_services()
+        self.log_dispatcher_task = asyncio.create_task(log_dispatcher.run())
+        self.job_worker_task = asyncio.create_task(job_queue.run(self))
+        self.token_sweep_task = asyncio.create_task(token_store.run(also=(verdict_cache.purge_expired,)))
+        self.cluster_snapshot_task = asyncio.create_task(alt_graph.run(float(os.getenv("CLUSTER_SNAPSHOT_INTERVAL", "300"))))
 
+    async def close(self):
+        await super().close()
+        await http_client.close()
 
-pending_tokens: Dict[str, Tuple[int, Optional[int]]] = {}
+bot = VerificationBot()
 
 
 VERIF_CHANNEL_ID = int(os.getenv('VERIF_CHANNEL_ID', '1098926833665331241'))
 LOGS_CHANNEL_ID = 1435232123475853413
 
+log_dispatcher = LogDispatcher(
+    bot,
+    LOGS_CHANNEL_ID,
+    webhook_url=os.getenv("LOGS_WEBHOOK_URL") or None,
+    http_session_factory=lambda: http_client.session,
+    flood_threshold=int(os.getenv("LOGS_FLOOD_THRESHOLD", "15")),
+    summary_window=float(os.getenv("LOGS_SUMMARY_WINDOW", "60")),
+)
+
+
+VERIFIED_ROLE_NAME = "Vérifié"
+
+
+def _on_job_give_up(job: Job, error: BaseException):
+    """Signale dans #logs une action Discord définitivement abandonnée."""
+    action = {"grant_role": "attribution du rôle", "kick": "kick"}.get(job.kind, job.kind)
+    log_dispatcher.post_text(
+        f"⚠️ Échec définitif ({action}) pour <@{job.user_id}> dans la guild {job.guild_id} : {error}",
+        category='jobs'
+    )
+
+
+job_queue = JobQueue(
+    storage,
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "8")),
+    guild_interval=float(os.getenv("JOB_GUILD_INTERVAL", "0.5")),
+    on_give_up=_on_job_give_up,
+)
+
+
+async def _job_grant_role(job: Job):
+    """Attribue le rôle Vérifié (créé au besoin) ; sans effet si le membre l'a déjà."""
+    guild = bot.get_guild(job.guild_id)
+    if guild is None:
+        raise JobDropped(f"guild {job.guild_id} inconnue")
+    member = guild.get_member(job.user_id)
+    if member is None:
+        try:
+            member = await guild.fetch_member(job.user_id)
+        except discord.NotFound:
+            raise JobDropped(f"membre {job.user_id} absent de la guild")
+    role = discord.utils.get(guild.roles, name=VERIFIED_ROLE_NAME)
+    if role is None:
+        logging.warning(f"Rôle '{VERIFIED_ROLE_NAME}' introuvable dans la guild {guild.name}. Tentative de création...")
+        role = await guild.create_role(name=VERIFIED_ROLE_NAME, reason="Création rôle Vérifié pour vérification")
+        logging.info(f"Rôle '{VERIFIED_ROLE_NAME}' créé dans la guild {guild.name}.")
+    if role in member.roles:
+        return
+    with _stage('role_grant'):
+        await member.add_roles(role, reason="Vérification réussie (IP + âge compte OK)")
+    logging.info(f"Rôle '{VERIFIED_ROLE_NAME}' ajouté à {member}.")
+
+
+async def _job_kick(job: Job):
+    guild = bot.get_guild(job.guild_id)
+    if guild is None:
+        raise JobDropped(f"guild {job.guild_id} inconnue")
+    member = guild.get_member(job.user_id)
+    if member is None:
+        raise JobDropped(f"membre {job.user_id} déjà parti")
+    await member.kick(reason=job.payload.get("reason", "Double compte détecté"))
+    logging.info(f"👢 {member} kick : {job.payload.get('reason')}")
+    if job.payload.get("notice_channel_id"):
+        await job_queue.enqueue("log", job.guild_id, job.user_id, {
+            "channel_id": job.payload["notice_channel_id"],
+            "text": f"👢 <@{job.user_id}> a été kick (double compte).",
+            "category": "alt",
+        })
+
+
+async def _job_log(job: Job):
+    log_dispatcher.post_text(job.payload["text"], category=job.payload.get("category", "general"),
+                             channel=job.payload.get("channel_id"))
+
+
+@gateway_op("guild_member")
+async def _op_guild_member(guild_id: int, user_id: int) -> dict:
+    """Guild (nom, salon #logs) et présence du membre, depuis le cache de la gateway."""
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        return {"guild_name": None, "member": False, "logs_channel_id": None}
+    log_channel = discord.utils.get(guild.text_channels, name="logs")
+    return {
+        "guild_name": guild.name,
+        "member": guild.get_member(user_id) is not None,
+        "logs_channel_id": log_channel.id if log_channel else None,
+    }
+
+
+@gateway_op("user_profile")
+async def _op_user_profile(user_id: int) -> List[str]:
+    profile = await profile_cache.fetch(bot, user_id)
+    return [profile.username, profile.avatar_url]
+
+
+@gateway_op("enqueue_job")
+async def _op_enqueue_job(kind: str, guild_id: int, user_id: int, payload: Optional[dict] = None,
+                          dedup_key: Optional[str] = None) -> bool:
+    return await job_queue.enqueue(kind, guild_id, user_id, payload, dedup_key=dedup_key)
+
+
+@gateway_op("post_log")
+async def _op_post_log(embed: dict, category: str = 'general', channel_id: Optional[int] = None):
+    log_dispatcher.post(discord.Embed.from_dict(embed), category=category, channel=channel_id)
+
+
+@gateway_op("cluster_add")
+async def _op_cluster_add(user_id: int, ip_bin: str, ip_subnet: Optional[str], row_id: int):
+    alt_graph.add(user_id, bytes.fromhex(ip_bin), bytes.fromhex(ip_subnet) if ip_subnet else None, row_id)
+
+
+@gateway_op("metrics_push")
+async def _op_metrics_push(worker: int, families: list):
+    if metrics_aggregator is not None:
+        metrics_aggregator.push(str(worker), families)
+
+
+async def push_metrics():
+    """Processus web : envoie périodiquement ses métriques à la gateway (perdues si elle est déconnectée)."""
+    while True:
+        await asyncio.sleep(METRICS_PUSH_INTERVAL)
+        gateway_client.notify("metrics_push", worker=WEB_WORKER_ID, families=REGISTRY.collect())
+
+
+def post_log(embed: discord.Embed, category: str = 'general', channel_id: Optional[int] = None):
+    """Met un embed en file pour les logs Discord, sans attendre (même depuis un processus web)."""
+    if gateway_client is None:
+        log_dispatcher.post(embed, category=category, channel=channel_id)
+    else:
+        gateway_client.notify("post_log", embed=embed.to_dict(), category=category, channel_id=channel_id)
+
+
+def record_cluster_link(user_id: int, ip_bin: bytes, ip_subnet: Optional[bytes], row_id: int):
+    if gateway_client is None:
+        alt_graph.add(user_id, ip_bin, ip_subnet, row_id)
+    else:
+        gateway_client.notify("cluster_add", user_id=user_id, ip_bin=ip_bin.hex(),
+                              ip_subnet=ip_subnet.hex() if ip_subnet else None, row_id=row_id)
+
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "stage_seconds", "Durée des étapes de la vérification (secondes)", ("stage",)
+)
+
+
+@contextmanager
+def _stage(name: str):
+    """Étape de /verify : histogramme Prometheus + span de la trace courante."""
+    with STAGE_SECONDS.time(stage=name), span(name):
+        yield
+
+
+tracer = Tracer(
+    slow_ms=float(os.getenv("SLOW_REQUEST_MS", "1000")),
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0")),
+)
+VERIFY_OUTCOMES = REGISTRY.counter("verify_outcomes_total", "Issues des requêtes /verify", ("outcome",))
+VPN_REASONS = REGISTRY.counter("vpn_block_reasons_total", "Motifs des blocages VPN/proxy", ("reason",))
+# Les 429 gérés en interne par discord.py ne sont visibles que dans ses logs
+discord_http_429 = LogRecordCounter("rate limited")
+logging.getLogger("discord.http").addHandler(discord_http_429)
+
+
+def _ratio(hits: int, misses: int) -> float:
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+REGISTRY.gauge("cache_hit_ratio", "Taux de hit des caches", lambda: {
+    ("verdicts",): verdict_cache.stats()['hit_ratio'],
+    ("profiles",): _ratio(profile_cache.hits, profile_cache.misses),
+    ("rdns",): _ratio(rdns_resolver.hits, rdns_resolver.misses),
+}, ("cache",))
+REGISTRY.gauge("queue_depth", "Éléments en attente par file", lambda: {
+    ("logs",): log_dispatcher.depth,
+    ("discord_jobs",): job_queue.depth,
+}, ("queue",))
+REGISTRY.gauge("tokens_in_memory", "Tokens de vérification indexés en mémoire", lambda: len(token_store))
+REGISTRY.counter_func("tokens_total", "Tokens de vérification par événement", lambda: {
+    (event,): token_store.stats()[event] for event in ("issued", "consumed", "expired", "swept", "replayed", "forged")
+}, ("event",))
+REGISTRY.counter_func("discord_rate_limited_total", "Réponses 429 de l'API Discord", lambda: {
+    ("log_dispatcher",): log_dispatcher.rate_limited,
+    ("discord_jobs",): job_queue.rate_limited,
+    ("discord.py",): discord_http_429.count,
+}, ("source",))
+REGISTRY.counter_func("discord_jobs_total", "Travaux Discord par résultat", lambda: {
+    ("done",): job_queue.done, ("retried",): job_queue.retried, ("failed",): job_queue.failed,
+}, ("result",))
+REGISTRY.gauge("iphub_breaker_open", "Disjoncteur IPHub ouvert (1) ou fermé (0)",
+               lambda: 1 if iphub_breaker.state == 'open' else 0)
+REGISTRY.gauge("verify_in_flight", "Requêtes /verify en cours ou en attente d'admission", lambda: {
+    ("active",): admission.concurrency.active, ("waiting",): admission.concurrency.waiting,
+}, ("state",))
+REGISTRY.counter_func("verify_rejected_total", "Requêtes /verify refusées par le contrôle d'admission", lambda: {
+    ("rate_ip",): admission.per_ip.limited,
+    ("rate_token",): admission.per_token.limited,
+    ("queue_full",): admission.concurrency.rejected,
+    ("queue_timeout",): admission.concurrency.timed_out,
+}, ("reason",))
+# Séries propres à la gateway en mode multi-processus (vides sinon)
+REGISTRY.counter_func("gateway_ipc_requests_total", "Opérations reçues des processus web par l'IPC", lambda: {
+    ("ok",): gateway_server.requests - gateway_server.errors, ("error",): gateway_server.errors,
+} if gateway_server is not None else {}, ("result",))
+REGISTRY.gauge("web_workers", "Processus web lancés par la gateway", lambda: {
+    ("configured",): web_supervisor.count, ("alive",): web_supervisor.stats()['alive'],
+} if web_supervisor is not None else {}, ("state",))
+REGISTRY.counter_func("web_worker_restarts_total", "Relances de processus web",
+                      lambda: web_supervisor.restarts if web_supervisor is not None else None)
+
+
+job_queue.register("grant_role", _job_grant_role, PRIORITY_GRANT)
+job_queue.register("kick", _job_kick, PRIORITY_KICK)
+job_queue.register("log", _job_log, PRIORITY_LOG)
+if not IS_WEB_WORKER:
+    job_queue.load()
+
 
 @bot.tree.command(name="verifier", description="Lance la vérification de votre compte")
 async def verifier(interaction: discord.Interaction):
@@ -488,9 +684,8 @@ async def verifier(interaction: discord.Interaction):
             
             user = interaction_button.user
             guild_id = interaction_button.guild_id or interaction_button.user.guild.id if hasattr(interaction_button.user, 'guild') else None
-            token = secrets.token_urlsafe(16)
-            pending_tokens[token] = (user.id, interaction_button.guild_id)
-            save_pending_token_db(token, user.id, interaction_button.guild_id)
+            token = await token_store.issue(user.id, interaction_button.guild_id)
+            profile_cache.remember(user)
             verify_link = f"{BASE_URL}/verify?token={token}"
 
            
@@ -501,7 +696,7 @@ async def verifier(interaction: discord.Interaction):
                 color=0x3498DB,
             )
             private_embed.add_field(name="Lien de vérification (privé)", value=f"[Ouvrir le lien]({verify_link})", inline=False)
-            private_embed.set_footer(text="Ce lien est personnel et expirera si vous ne l'utilisez pas.")
+            private_embed.set_footer(text=TOKEN_EXPIRY_FOOTER)
 
             try:
                 await interaction_button.response.send_message(embed=private_embed, ephemeral=True)
@@ -542,9 +737,8 @@ async def token_cmd(interaction: discord.Interaction):
     guild_id = interaction.guild_id
 
     
-    token = secrets.token_urlsafe(16)
-    pending_tokens[token] = (user.id, guild_id)
-    save_pending_token_db(token, user.id, guild_id)
+    token = await token_store.issue(user.id, guild_id)
+    profile_cache.remember(user)
     verify_link = f"{BASE_URL}/verify?token={token}"
 
     private_embed = discord.Embed(
@@ -554,7 +748,7 @@ async def token_cmd(interaction: discord.Interaction):
         color=0x3498DB,
     )
     private_embed.add_field(name="Lien de vérification (privé)", value=f"[Ouvrir le lien]({verify_link})", inline=False)
-    private_embed.set_footer(text="Ce lien est personnel et expirera si vous ne l'utilisez pas.")
+    private_embed.set_footer(text=TOKEN_EXPIRY_FOOTER)
 
     
     dm_sent = False
@@ -597,19 +791,13 @@ async def check_ip(interaction: discord.Interaction, ip: str):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
         return
+
+    ip = canonical_ip(ip)
+    if ip is None:
+        await interaction.response.send_message("❌ Adresse IP invalide.", ephemeral=True)
+        return
         
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        status = conn.execute(
-            "SELECT list_type, added_by, reason FROM ip_lists WHERE ip_address = ?",
-            (ip,)
-        ).fetchone()
-        
-        accounts = conn.execute("""
-            SELECT user_id, guild_id, created_at, verification_status
-            FROM verifications WHERE ip_address = ?
-            ORDER BY created_at DESC LIMIT 10
-        """, (ip,)).fetchall()
+    status, accounts, subnet_accounts = await fetch_ip_report(ip)
     
     embed = discord.Embed(title=f"🔍 Vérification de l'IP {ip}", color=0x00ff00)
     
@@ -617,7 +805,7 @@ async def check_ip(interaction: discord.Interaction, ip: str):
         status_text = "✅ Whitelist" if status['list_type'] == 'whitelist' else "⛔ Blacklist"
         embed.add_field(
             name="Statut", 
-            value=f"{status_text}\nRaison: {status['reason']}\nPar: <@{status['added_by']}>",
+            value=f"{status_text} ({status['entry']})\nRaison: {status['reason']}\nPar: <@{status['added_by']}>",
             inline=False
         )
     
@@ -630,12 +818,46 @@ async def check_ip(interaction: discord.Interaction, ip: str):
         embed.add_field(name=f"Comptes associés ({len(accounts)})", value=accounts_text, inline=False)
     else:
         embed.add_field(name="Comptes associés", value="Aucun compte trouvé", inline=False)
+    embed.add_field(name="Comptes du même sous-réseau (/24 ou /64)", value=str(subnet_accounts), inline=False)
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@bot.tree.command(name="cluster", description="Affiche le groupe de comptes liés à un utilisateur")
+@discord.app_commands.describe(user="L'utilisateur dont on veut le groupe de comptes liés")
+async def cluster_cmd(interaction: discord.Interaction, user: discord.User):
+    """Comptes reliés à l'utilisateur par une chaîne d'IP communes (index en mémoire)."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
+        return
+
+    started = time.perf_counter()
+    users, ips, subnets = alt_graph.cluster(user.id)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    others = [u for u in users if u != user.id]
+    embed = discord.Embed(
+        title=f"🕸️ Groupe de comptes de {user}",
+        description=f"{len(users)} compte(s), {len(ips)} IP" + (f", {len(subnets)} sous-réseau(x)" if subnets else ""),
+        color=0xE67E22 if others else 0x00ff00
+    )
+    if others:
+        shown = " ".join(f"<@{u}>" for u in others[:40])
+        if len(others) > 40:
+            shown += f" … (+{len(others) - 40})"
+        embed.add_field(name=f"Comptes liés ({len(others)})", value=shown, inline=False)
+    else:
+        embed.add_field(name="Comptes liés", value="Aucun compte lié trouvé", inline=False)
+    if ips:
+        shown = "\n".join(unpack_ip(ip) for ip in ips[:15])
+        if len(ips) > 15:
+            shown += f"\n… (+{len(ips) - 15})"
+        embed.add_field(name="IP du groupe", value=shown, inline=False)
+    embed.set_footer(text=f"Calculé en {elapsed_ms:.2f} ms")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.tree.command(name="blacklist", description="Ajoute une IP à la blacklist")
 @discord.app_commands.describe(
-    ip="L'adresse IP à blacklister",
+    ip="IP, plage CIDR (ex: 203.0.113.0/24) ou ASN (ex: AS16276) à blacklister",
     reason="Raison du blacklist (optionnel)"
 )
 async def blacklist(interaction: discord.Interaction, ip: str, reason: str = "Non spécifiée"):
@@ -643,12 +865,12 @@ async def blacklist(interaction: discord.Interaction, ip: str, reason: str = "No
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
         return
-        
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO ip_lists (ip_address, list_type, added_by, reason) VALUES (?, 'blacklist', ?, ?)",
-            (ip, interaction.user.id, reason)
-        )
+
+    entry = await set_ip_list(ip, 'blacklist', interaction.user.id, reason)
+    if entry is None:
+        await interaction.response.send_message("❌ Entrée invalide : IP, plage CIDR ou ASN (ASxxxx) attendu.", ephemeral=True)
+        return
+    ip = entry
     
     try:
         add_ip_to_config('blacklist', ip, reason, interaction.user.id)
@@ -661,7 +883,7 @@ async def blacklist(interaction: discord.Interaction, ip: str, reason: str = "No
 
 @bot.tree.command(name="whitelist", description="Ajoute une IP à la whitelist")
 @discord.app_commands.describe(
-    ip="L'adresse IP à whitelister",
+    ip="IP, plage CIDR (ex: 203.0.113.0/24) ou ASN (ex: AS16276) à whitelister",
     reason="Raison du whitelist (optionnel)"
 )
 async def whitelist(interaction: discord.Interaction, ip: str, reason: str = "Non spécifiée"):
@@ -669,12 +891,12 @@ async def whitelist(interaction: discord.Interaction, ip: str, reason: str = "No
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
         return
-        
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO ip_lists (ip_address, list_type, added_by, reason) VALUES (?, 'whitelist', ?, ?)",
-            (ip, interaction.user.id, reason)
-        )
+
+    entry = await set_ip_list(ip, 'whitelist', interaction.user.id, reason)
+    if entry is None:
+        await interaction.response.send_message("❌ Entrée invalide : IP, plage CIDR ou ASN (ASxxxx) attendu.", ephemeral=True)
+        return
+    ip = entry
     try:
         add_ip_to_config('whitelist', ip, reason, interaction.user.id)
     except Exception:
@@ -685,26 +907,210 @@ async def whitelist(interaction: discord.Interaction, ip: str, reason: str = "No
     )
 
 
-TOR_EXIT_URL = "https://check.torproject.org/exit-addresses"
-_tor_cache = {"ips": set(), "updated": 0}
-TOR_CACHE_TTL = 60 * 60  # 1 heure
+# Répertoire d'échange des listes : fichiers à importer par nom, exports trop gros pour Discord
+IP_LIST_DIR = os.getenv("IP_LIST_DIR", "data/ip_lists")
+ip_list_import_lock = asyncio.Lock()
+LIST_TYPE_CHOICES = [
+    discord.app_commands.Choice(name="blacklist", value="blacklist"),
+    discord.app_commands.Choice(name="whitelist", value="whitelist"),
+]
+
+
+def _ip_list_file(name: str) -> Optional[str]:
+    """Chemin d'un fichier de IP_LIST_DIR ; None s'il n'existe pas ou sort du répertoire."""
+    base = os.path.realpath(IP_LIST_DIR)
+    path = os.path.realpath(os.path.join(base, name))
+    if os.path.commonpath([base, path]) != base or not os.path.isfile(path):
+        return None
+    return path
 
-async def _refresh_tor_list():
+
+async def _ip_lists_changed():
+    """Reconstruit l'index ici et dans les processus web après une modification en masse."""
+    await reload_ip_lists()
+    if gateway_server is not None:
+        gateway_server.broadcast("ip_lists_reload")
+
+
+@bot.tree.command(name="importlist", description="Importe en masse une liste d'IP (fichier joint ou fichier local)")
+@discord.app_commands.describe(
+    list_type="Liste de destination",
+    fichier="Texte ou CSV : une IP, plage CIDR ou ASN par ligne (.gz accepté)",
+    chemin="Ou : nom d'un fichier déjà déposé dans le répertoire des listes du bot",
+    reason="Raison appliquée aux lignes qui n'en précisent pas"
+)
+@discord.app_commands.choices(list_type=LIST_TYPE_CHOICES)
+async def import_list_cmd(interaction: discord.Interaction, list_type: str, fichier: Optional[discord.Attachment] = None,
+                          chemin: Optional[str] = None, reason: str = "Import en masse"):
+    """Import par paquets (une transaction par paquet), index mémoire reconstruit une seule fois à la fin."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
+        return
+    if (fichier is None) == (chemin is None):
+        await interaction.response.send_message("❌ Indiquez soit un fichier joint, soit un chemin.", ephemeral=True)
+        return
+    if ip_list_import_lock.locked():
+        await interaction.response.send_message("⏳ Un import est déjà en cours, réessayez plus tard.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    async with ip_list_import_lock:
+        tmp_path = None
+        started = False
+        try:
+            if fichier is not None:
+                fd, tmp_path = tempfile.mkstemp(suffix='.gz' if fichier.filename.endswith('.gz') else '.txt')
+                os.close(fd)
+                await fichier.save(tmp_path)
+                path, label = tmp_path, fichier.filename
+            else:
+                path, label = _ip_list_file(chemin), chemin
+                if path is None:
+                    await interaction.followup.send(f"❌ Fichier `{chemin}` introuvable dans `{IP_LIST_DIR}`.", ephemeral=True)
+                    return
+            status = await interaction.followup.send(f"📥 Import de `{label}` dans la {list_type}…", ephemeral=True, wait=True)
+
+            async def report(result):
+                await status.edit(content=f"📥 Import de `{label}` dans la {list_type}… {result.lines} lignes lues, "
+                                          f"{result.imported} importées, {result.invalid} invalides")
+
+            started = True
+            with open_text(path) as f:
+                result = await import_entries(storage, f, list_type, interaction.user.id, reason, progress=report)
+            started = False
+            await _ip_lists_changed()
+            await status.edit(content=f"✅ Import de `{label}` terminé ({list_type}) : {result.summary()}\n"
+                                      f"Index : {len(ip_list_index)} entrées.")
+        except Exception as e:
+            logging.exception("Erreur lors de l'import en masse d'une liste d'IP")
+            await interaction.followup.send(f"❌ Import interrompu : {e}", ephemeral=True)
+        finally:
+            if started:
+                # Import partiel : les paquets déjà écrits doivent quand même être pris en compte
+                await _ip_lists_changed()
+            if tmp_path:
+                os.unlink(tmp_path)
+
+
+@bot.tree.command(name="exportlist", description="Exporte les listes d'IP en CSV (gzip)")
+@discord.app_commands.describe(list_type="Liste à exporter (les deux par défaut)")
+@discord.app_commands.choices(list_type=LIST_TYPE_CHOICES)
+async def export_list_cmd(interaction: discord.Interaction, list_type: Optional[str] = None):
+    """Export au fil de l'eau ; réimportable avec /importlist, une liste à la fois (colonne list_type respectée)."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    filename = f"{list_type or 'ip_lists'}_{datetime.datetime.utcnow():%Y%m%d_%H%M%S}.csv.gz"
+    fd, path = tempfile.mkstemp(suffix='.csv.gz')
+    os.close(fd)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(TOR_EXIT_URL, timeout=10) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    ips = set()
-                    for line in text.splitlines():
-                        if line.startswith('ExitAddress'):
-                            parts = line.split()
-                            if len(parts) >= 2:
-                                ips.add(parts[1].strip())
-                    _tor_cache['ips'] = ips
-                    _tor_cache['updated'] = time.time()
-    except Exception:
-        logging.exception("Impossible de rafraîchir la liste Tor (ignorer)")
+        def _export(conn):
+            with open_text(path, 'wt') as out:
+                return export_entries(conn, out, list_type)
+
+        count = await storage.read(_export)
+        limit = interaction.guild.filesize_limit if interaction.guild else 8 * 1024 * 1024
+        if os.path.getsize(path) > limit:
+            # Trop gros pour une pièce jointe : le fichier reste sur le serveur du bot
+            os.makedirs(IP_LIST_DIR, exist_ok=True)
+            target = os.path.join(IP_LIST_DIR, filename)
+            os.replace(path, target)
+            await interaction.followup.send(f"📤 {count} entrées exportées dans `{target}` (trop volumineux pour Discord).", ephemeral=True)
+            return
+        await interaction.followup.send(f"📤 {count} entrées exportées.", file=discord.File(path, filename=filename), ephemeral=True)
+    except Exception as e:
+        logging.exception("Erreur lors de l'export des listes d'IP")
+        await interaction.followup.send(f"❌ Export impossible : {e}", ephemeral=True)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+@bot.tree.command(name="cachestats", description="Statistiques du cache de verdicts VPN")
+async def cache_stats(interaction: discord.Interaction):
+    """Affiche les compteurs du cache de verdicts IP."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
+        return
+
+    stats = verdict_cache.stats()
+    embed = discord.Embed(title="📦 Cache de verdicts IP", color=0x3498DB)
+    embed.add_field(name="Entrées en mémoire", value=str(stats['size']), inline=True)
+    embed.add_field(name="Hits / Misses", value=f"{stats['hits']} / {stats['misses']}", inline=True)
+    embed.add_field(name="Taux de hit", value=f"{stats['hit_ratio']:.1%}", inline=True)
+    embed.add_field(name="Relus depuis SQLite", value=str(stats['db_hits']), inline=True)
+    embed.add_field(name="Appels IPHub évités", value=str(stats['iphub_saved']), inline=True)
+    tokens = token_store.stats()
+    embed.add_field(
+        name="Tokens",
+        value=f"{tokens['issued']} émis · {tokens['consumed']} utilisés · {tokens['expired']} expirés · "
+              f"{tokens['swept']} purgés · {tokens['in_memory']} en mémoire · "
+              f"{tokens['replayed']} rejoués · {tokens['forged']} invalides",
+        inline=False
+    )
+    if not WEB_WORKERS:  # sinon /verify tourne dans les processus web
+        limits = admission.stats()
+        embed.add_field(
+            name="Admission /verify",
+            value=f"{limits['active']} en cours · {limits['waiting']} en attente · "
+                  f"{limits['limited_ip']} limités (IP) · {limits['limited_token']} limités (token) · "
+                  f"{limits['rejected_busy'] + limits['timed_out']} refusés (surcharge)",
+            inline=False
+        )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@bot.tree.command(name="profile", description="Capture un profil CPU ou mémoire du bot pendant quelques secondes")
+@discord.app_commands.describe(mode="cpu (cProfile) ou memory (tracemalloc)", seconds="Durée de la capture (1-60 s)")
+@discord.app_commands.choices(mode=[
+    discord.app_commands.Choice(name="cpu", value="cpu"),
+    discord.app_commands.Choice(name="memory", value="memory"),
+])
+async def profile_cmd(interaction: discord.Interaction, mode: str = "cpu", seconds: int = 10):
+    """Profilage à la demande ; le résultat est envoyé en pièce jointe."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        report = await (memory_profile(seconds) if mode == "memory" else cpu_profile(seconds))
+    except ProfilerBusy:
+        await interaction.followup.send("⏳ Une capture est déjà en cours, réessayez plus tard.", ephemeral=True)
+        return
+    report += f"\n\nRequêtes lentes (> {tracer.slow_ms:.0f} ms) depuis le démarrage : {tracer.slow_count}\n"
+    report += "\n\n".join(trace.format() for trace in list(tracer.recent_slow)[-3:])
+    await interaction.followup.send(
+        f"📈 Profil {mode} sur {seconds}s",
+        file=discord.File(io.BytesIO(report.encode('utf-8')), filename=f"profile_{mode}.txt"),
+        ephemeral=True
+    )
+
+
+http_client = HttpClient(
+    limit=int(os.getenv("HTTP_POOL_LIMIT", "100")),
+    limit_per_host=int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "8")),
+)
+iphub_breaker = CircuitBreaker(
+    "iphub",
+    failure_threshold=int(os.getenv("IPHUB_BREAKER_THRESHOLD", "5")),
+    cooldown=float(os.getenv("IPHUB_BREAKER_COOLDOWN", "120")),
+)
+# Un peu sous le délai de l'étape pour que le disjoncteur voie l'échec avant l'annulation
+IPHUB_HTTP_TIMEOUT = float(os.getenv("IPHUB_HTTP_TIMEOUT", "2.5"))
+IPHUB_API_URL = os.getenv("IPHUB_API_URL", "http://v2.api.iphub.info/ip/")
+
+TOR_EXIT_URL = os.getenv("TOR_EXIT_URL", "https://check.torproject.org/exit-addresses")
+TOR_CACHE_TTL = int(os.getenv("TOR_REFRESH_INTERVAL", str(60 * 60)))  # 1 heure
+tor_exits = TorExitList(
+    TOR_EXIT_URL,
+    http_client,
+    cache_path=os.getenv("TOR_CACHE_PATH", "data/tor_exits.json"),
+    interval=TOR_CACHE_TTL,
+)
+tor_exits.load_cache()
 
 
 SUSPECT_KEYWORDS = (
@@ -718,85 +1124,227 @@ SUSPECT_KEYWORDS = (
     'surfshark', 'cyberghost', 'privateinternetaccess', 'ipvanish',
     'proton', 'protonvpn'
 )
+# Mots génériques : ne comptent que s'ils forment un mot entier ('aws' ≠ 'laws', 'host' ≠ 'ghost')
+STRICT_KEYWORDS = (
+    'aws', 'host', 'server', 'vps', 'cloud', 'proxy', 'vpn', 'ibm', 'ovh', 'packet',
+    'keystone', 'turnkey', 'proton', 'oracle', 'amazon', 'google', 'microsoft', 'azure',
+)
+# Suffixes reverse DNS des grands hébergeurs
+SUSPECT_DOMAIN_SUFFIXES = (
+    'amazonaws.com', 'googleusercontent.com', 'cloudapp.net', 'cloudapp.azure.com',
+    'linodeusercontent.com', 'linode.com', 'vultrusercontent.com', 'vultr.com', 'choopa.net',
+    'digitalocean.com', 'your-server.de', 'hetzner.com', 'ovh.net', 'ovh.ca', 'kimsufi.com',
+    'contaboserver.net', 'contabo.net', 'leaseweb.net', 'leaseweb.com', 'scaleway.com',
+    'poneytelecom.eu', 'upcloud.host', 'oraclecloud.com', 'cloudfront.net', 'm247.com',
+    'datapacket.com', 'netcup.net', 'buyvm.net', 'frantech.ca',
+)
 
+keyword_matcher = KeywordMatcher(SUSPECT_KEYWORDS, strict=STRICT_KEYWORDS, suffixes=SUSPECT_DOMAIN_SUFFIXES)
+# ASN → organisation, construit une fois à partir de la base GeoLite2 (vide tant que non construit)
+suspect_asns: Dict[int, str] = {}
 
-async def check_ip_vpn(ip: str) -> Tuple[bool, dict]:
-    """Détecte les VPN / proxies en combinant IPHub + heuristiques locales."""
-    details = {"checks": []}
 
-    # 1️⃣ Vérif liste Tor
+def rebuild_suspect_asns(db: GeoIPDatabase = None) -> int:
+    """Parcourt la base ASN et précalcule les ASN dont l'organisation est suspecte (bloquant)."""
+    global suspect_asns
+    db = db or geoip_asn
+    if not db.available:
+        return 0
+    start = time.perf_counter()
     try:
-        if time.time() - _tor_cache.get('updated', 0) > TOR_CACHE_TTL:
-            await _refresh_tor_list()
-        if ip in _tor_cache.get('ips', set()):
-            details['checks'].append('tor_exit')
-            return True, details
+        suspect_asns = build_suspect_asns(db.iter_asn_records(), keyword_matcher)
     except Exception:
-        logging.exception('Erreur lors du check Tor')
+        logging.exception("Impossible de construire la table des ASN suspects")
+        return 0
+    logging.info(f"Table des ASN suspects construite : {len(suspect_asns)} ASN en {time.perf_counter() - start:.1f}s")
+    return len(suspect_asns)
+
+
+def _on_geoip_reload(db: GeoIPDatabase):
+    if db is geoip_asn:
+        asyncio.get_running_loop().run_in_executor(None, rebuild_suspect_asns)
+
+
+VPN_STAGE_TIMEOUTS = {
+    'tor': float(os.getenv("VPN_TIMEOUT_TOR", "2")),
+    'rdns': float(os.getenv("VPN_TIMEOUT_RDNS", "2")),
+    'asn': float(os.getenv("VPN_TIMEOUT_ASN", "1")),
+    'iphub': float(os.getenv("VPN_TIMEOUT_IPHUB", "3")),
+}
+# Politique si une étape dépasse son délai sans verdict positif : 'allow', 'deny' ou 'flag'
+VPN_DEGRADED_POLICY = os.getenv("VPN_DEGRADED_POLICY", "flag").lower()
+
+
+async def _stage_tor(ip: str, details: dict) -> Optional[str]:
+    """1️⃣ Vérif liste Tor (rafraîchie en tâche de fond, simple recherche en mémoire)"""
+    if ip in tor_exits:
+        return 'tor_exit'
+    return None
+
 
-    # 2️⃣ Vérif reverse DNS (hébergeur connu)
+rdns_resolver = ReverseResolver(
+    max_concurrency=int(os.getenv("RDNS_MAX_CONCURRENCY", "16")),
+    timeout=float(os.getenv("RDNS_TIMEOUT", "1.5")),
+    forward_confirm=os.getenv("RDNS_FORWARD_CONFIRM", "0") == "1",
+)
+
+
+async def _stage_rdns(ip: str, details: dict) -> Optional[str]:
+    """2️⃣ Vérif reverse DNS (hébergeur connu)"""
+    rdns = await rdns_resolver.resolve(ip)
+    if rdns:
+        details['rdns'] = rdns
+        kw = keyword_matcher.match_hostname(rdns)
+        if kw:
+            return f'rdns_match:{kw}'
+    return None
+
+
+GEOIP_ASN_DB_PATH = os.getenv("GEOIP_ASN_DB_PATH", 'data/GeoLite2-ASN.mmdb')
+GEOIP_COUNTRY_DB_PATH = os.getenv("GEOIP_COUNTRY_DB_PATH", 'data/GeoLite2-Country.mmdb')
+# Codes ISO séparés par des virgules, ex: "RU,CN" (nécessite une base Country ou City)
+BLOCKED_COUNTRIES = {c.strip().upper() for c in os.getenv("BLOCKED_COUNTRIES", "").split(",") if c.strip()}
+
+geoip_asn = GeoIPDatabase(GEOIP_ASN_DB_PATH)
+geoip_country = GeoIPDatabase(GEOIP_COUNTRY_DB_PATH)
+geoip_asn.reload()
+geoip_country.reload()
+
+
+async def _stage_asn(ip: str, details: dict) -> Optional[str]:
+    """3️⃣ Vérif ASN (et pays) via GeoLite2 — lecteurs mmap partagés, sans ouverture de fichier"""
+    if geoip_country.available:
+        country = geoip_country.country(ip)
+        if country:
+            details['country'] = country
+            if country in BLOCKED_COUNTRIES:
+                return f'country_blocked:{country}'
+    if not geoip_asn.available:
+        return None
+    asn, asn_org = geoip_asn.asn(ip)
+    if asn or asn_org:
+        details['asn'] = asn
+        details['asn_org'] = (asn_org or '').lower() if asn_org else ''
+        if suspect_asns:
+            if asn in suspect_asns:
+                return f'asn_org_match:{asn_org}'
+        elif keyword_matcher.match_text(asn_org):
+            # Table pas encore construite : repli sur l'expression compilée
+            return f'asn_org_match:{asn_org}'
+    return None
+
+
+async def _stage_iphub(ip: str, details: dict) -> Optional[str]:
+    """4️⃣ Vérif via IPHub API (si clé dispo)"""
+    api_key = os.getenv("IPHUB_API_KEY")
+    if not iphub_breaker.allow():
+        details['iphub_skipped'] = 'circuit_open'
+        details.setdefault('errors', []).append('iphub_circuit_open')
+        return None
+    tripped = False
     try:
-        loop = asyncio.get_running_loop()
-        def _rdns_lookup(a):
-            try:
-                return socket.gethostbyaddr(a)[0]
-            except Exception:
-                return None
-
-        rdns = await loop.run_in_executor(None, _rdns_lookup, ip)
-        if rdns:
-            details['rdns'] = rdns
-            lower = rdns.lower()
-            for kw in SUSPECT_KEYWORDS:
-                if kw in lower:
-                    details['checks'].append(f'rdns_match:{kw}')
-                    return True, details
-    except Exception:
-        logging.exception('Erreur lors du reverse DNS')
-        
-        
+        async with http_client.session.get(
+            f"{IPHUB_API_URL}{ip}",
+            headers={"X-Key": api_key},
+            timeout=aiohttp.ClientTimeout(total=IPHUB_HTTP_TIMEOUT),
+        ) as resp:
+            if resp.status == 429:
+                retry_after = resp.headers.get("Retry-After", "")
+                iphub_breaker.trip(float(retry_after) if retry_after.isdigit() else None)
+                tripped = True
+                raise RuntimeError("IPHub HTTP 429 (quota atteint)")
+            if resp.status != 200:
+                raise RuntimeError(f"IPHub HTTP {resp.status}")
+            data = await resp.json()
+    except asyncio.CancelledError:
+        # Annulée par le fan-out (autre étape positive) ou par le délai de l'étape : l'essai semi-ouvert
+        # éventuel doit être libéré, sinon allow() refuserait IPHub jusqu'au redémarrage
+        iphub_breaker.abandon()
+        raise
+    except BaseException:
+        # Toute autre issue (HTTP, réseau, JSON invalide…) est un échec
+        if not tripped:
+            iphub_breaker.record_failure()
+        raise
+    iphub_breaker.record_success()
+    details['iphub'] = data
+    if data.get("block", 0) == 1:
+        return f"iphub_block:{data}"
+    elif data.get("block", 0) == 2:
+        return f"iphub_warn:{data}"
+    return None
+
 
-    # 3️⃣ Vérif ASN via GeoLite2
+async def check_ip_vpn(ip: str) -> Tuple[bool, dict]:
+    """Détecte les VPN / proxies en combinant IPHub + heuristiques locales.
+
+    Les étapes sont lancées en parallèle, chacune avec son propre délai ; le
+    premier verdict positif l'emporte et annule les autres. Les durées de
+    chaque étape sont reportées dans ``details['timings']`` (ms).
+    """
+    details = {"checks": [], "timings": {}}
+    stages = {'tor': _stage_tor, 'rdns': _stage_rdns, 'asn': _stage_asn}
+    if os.getenv("IPHUB_API_KEY"):
+        stages['iphub'] = _stage_iphub
+
+    async def _run(name, stage):
+        start = time.perf_counter()
+        with span(f"vpn_{name}") as s:
+            try:
+                hit = await asyncio.wait_for(stage(ip, details), VPN_STAGE_TIMEOUTS[name])
+                if hit:
+                    annotate(hit=hit)
+                return hit
+            except asyncio.TimeoutError:
+                logging.warning(f"Étape VPN '{name}' hors délai pour {ip}")
+                details.setdefault('timeouts', []).append(name)
+                details.setdefault('errors', []).append(name)
+                annotate(timeout=True)
+            except Exception as e:
+                logging.exception(f"Erreur lors de l'étape VPN '{name}'")
+                details.setdefault('errors', []).append(name)
+                if s is not None:
+                    s.error = type(e).__name__
+            finally:
+                elapsed = time.perf_counter() - start
+                details['timings'][name] = round(elapsed * 1000, 1)
+                STAGE_SECONDS.observe(elapsed, stage=f"vpn_{name}")
+        return None
+
+    tasks = {name: asyncio.create_task(_run(name, stage)) for name, stage in stages.items()}
     try:
-        geo_db_path = 'data/GeoLite2-ASN.mmdb'
-        if GEOIP_AVAILABLE and os.path.exists(geo_db_path):
-            def _geoip_lookup(a):
-                try:
-                    with geoip2.database.Reader(geo_db_path) as reader:
-                        rec = reader.asn(a)
-                        return rec.autonomous_system_number, rec.autonomous_system_organization
-                except Exception:
-                    return None, None
-
-            asn, asn_org = await loop.run_in_executor(None, _geoip_lookup, ip)
-            if asn or asn_org:
-                details['asn'] = asn
-                details['asn_org'] = (asn_org or '').lower() if asn_org else ''
-                if any(kw in (asn_org or '').lower() for kw in SUSPECT_KEYWORDS):
-                    details['checks'].append(f'asn_org_match:{asn_org}')
-                    return True, details
-    except Exception:
-        logging.exception('Erreur lors du GeoIP ASN check')
+        for fut in asyncio.as_completed(tasks.values()):
+            hit = await fut
+            if hit:
+                details['checks'].append(hit)
+                return True, details
+    finally:
+        pending = {name: t for name, t in tasks.items() if not t.done()}
+        for t in pending.values():
+            t.cancel()
+        if pending:
+            details['cancelled'] = list(pending)
+            await asyncio.gather(*pending.values(), return_exceptions=True)
+
+    timeouts = details.get('timeouts')
+    if timeouts:
+        if VPN_DEGRADED_POLICY == 'deny':
+            details['checks'].append(f"degraded_deny:{','.join(timeouts)}")
+            return True, details
+        if VPN_DEGRADED_POLICY == 'flag':
+            details['degraded'] = True
+            details['checks'].append(f"degraded_flag:{','.join(timeouts)}")
+    return False, details
 
-    # 4️⃣ Vérif via IPHub API (si clé dispo)
-    api_key = os.getenv("IPHUB_API_KEY")
-    if api_key:
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"http://v2.api.iphub.info/ip/{ip}", headers={"X-Key": api_key}) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        details['iphub'] = data
-                        if data.get("block", 0) == 1:
-                            details['checks'].append(f"iphub_block:{data}")
-                            return True, details
-                        elif data.get("block", 0) == 2:
-                            details['checks'].append(f"iphub_warn:{data}")
-                            return True, details
-        except Exception as e:
-            logging.warning(f"Erreur IPHub: {e}")
 
 
+async def start_detection_services() -> Tuple[asyncio.Task, asyncio.Task]:
+    """Tâches de fond de la détection VPN/proxy (gateway et processus web)."""
+    geoip_task = asyncio.create_task(watch_databases(geoip_asn, geoip_country, on_reload=_on_geoip_reload))
+    asyncio.get_running_loop().run_in_executor(None, rebuild_suspect_asns)
+    await http_client.start()
+    return geoip_task, asyncio.create_task(tor_exits.run())
+
 
 def is_admin():
     """Vérifie si l'utilisateur est admin du serveur."""
@@ -858,11 +1406,11 @@ async def on_ready():
 @is_admin()
 async def whitelist(ctx, ip: str, *, reason: str = "Non spécifiée"):
     """Ajoute une IP à la whitelist."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO ip_lists (ip_address, list_type, added_by, reason) VALUES (?, 'whitelist', ?, ?)",
-            (ip, ctx.author.id, reason)
-        )
+    entry = await set_ip_list(ip, 'whitelist', ctx.author.id, reason)
+    if entry is None:
+        await ctx.send("❌ Entrée invalide : IP, plage CIDR ou ASN (ASxxxx) attendu.")
+        return
+    ip = entry
     try:
         add_ip_to_config('whitelist', ip, reason, ctx.author.id)
     except Exception:
@@ -873,11 +1421,11 @@ async def whitelist(ctx, ip: str, *, reason: str = "Non spécifiée"):
 @is_admin()
 async def blacklist(ctx, ip: str, *, reason: str = "Non spécifiée"):
     """Ajoute une IP à la blacklist."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO ip_lists (ip_address, list_type, added_by, reason) VALUES (?, 'blacklist', ?, ?)",
-            (ip, ctx.author.id, reason)
-        )
+    entry = await set_ip_list(ip, 'blacklist', ctx.author.id, reason)
+    if entry is None:
+        await ctx.send("❌ Entrée invalide : IP, plage CIDR ou ASN (ASxxxx) attendu.")
+        return
+    ip = entry
     try:
         add_ip_to_config('blacklist', ip, reason, ctx.author.id)
     except Exception:
@@ -887,9 +1435,8 @@ async def blacklist(ctx, ip: str, *, reason: str = "Non spécifiée"):
 @bot.command()
 async def verifier(ctx):
     """Version texte: poster le message de vérification dans le canal configuré."""
-    token = secrets.token_urlsafe(16)
-    pending_tokens[token] = (ctx.author.id, ctx.guild.id)
-    save_pending_token_db(token, ctx.author.id, ctx.guild.id)
+    token = await token_store.issue(ctx.author.id, ctx.guild.id)
+    profile_cache.remember(ctx.author)
     verify_link = f"{BASE_URL}/verify?token={token}"
 
     embed = discord.Embed(
@@ -922,18 +1469,11 @@ async def verifier(ctx):
 @is_admin()
 async def check_ip(ctx, ip: str):
     """Affiche les comptes associés à une IP."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        status = conn.execute(
-            "SELECT list_type, added_by, reason FROM ip_lists WHERE ip_address = ?",
-            (ip,)
-        ).fetchone()
-        
-        accounts = conn.execute("""
-            SELECT user_id, guild_id, created_at, verification_status
-            FROM verifications WHERE ip_address = ?
-            ORDER BY created_at DESC LIMIT 10
-        """, (ip,)).fetchall()
+    ip = canonical_ip(ip)
+    if ip is None:
+        await ctx.send("❌ Adresse IP invalide.")
+        return
+    status, accounts, subnet_accounts = await fetch_ip_report(ip)
     
     embed = discord.Embed(title=f"Vérification de l'IP {ip}", color=0x00ff00)
     
@@ -941,7 +1481,7 @@ async def check_ip(ctx, ip: str):
         status_text = "✅ Whitelist" if status['list_type'] == 'whitelist' else "⛔ Blacklist"
         embed.add_field(
             name="Statut", 
-            value=f"{status_text}\nRaison: {status['reason']}\nPar: <@{status['added_by']}>",
+            value=f"{status_text} ({status['entry']})\nRaison: {status['reason']}\nPar: <@{status['added_by']}>",
             inline=False
         )
     
@@ -954,6 +1494,7 @@ async def check_ip(ctx, ip: str):
         embed.add_field(name=f"Comptes associés ({len(accounts)})", value=accounts_text, inline=False)
     else:
         embed.add_field(name="Comptes associés", value="Aucun compte trouvé", inline=False)
+    embed.add_field(name="Comptes du même sous-réseau (/24 ou /64)", value=str(subnet_accounts), inline=False)
     
     await ctx.send(embed=embed)
 
@@ -966,148 +1507,257 @@ async def on_member_join(member: discord.Member):
 
 
 
-app = web.Application()
+app = web.Application(middlewares=[compression_middleware])
 
 
 async def check_alt_accounts(ip: str, user_id: int, guild_id: int) -> Tuple[bool, str, List[dict]]:
     """Vérifie si l'IP est associée à d'autres comptes."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        
-        alts = conn.execute("""
+    _, ip_bin, _ = ip_columns(ip)
+    scope = guild_id if ALT_DETECTION_SCOPE == 'guild' else 0
+
+    def _lookup(conn):
+        # Lecture ponctuelle du compteur (maintenu par trigger), puis détail borné seulement si nécessaire
+        row = conn.execute("""
+            SELECT c.accounts,
+                   EXISTS(SELECT 1 FROM ip_accounts a WHERE a.ip_bin = c.ip_bin AND a.guild_id = c.guild_id AND a.user_id = ?)
+            FROM ip_account_counts c
+            WHERE c.ip_bin = ? AND c.guild_id = ?
+        """, (user_id, ip_bin, scope)).fetchone()
+        others = (row[0] - row[1]) if row else 0
+        if others < MAX_ACCOUNTS_PER_IP:
+            return others, []
+        sql = """
             SELECT user_id, guild_id, created_at, verification_status
-            FROM verifications 
-            WHERE ip_address = ? AND user_id != ? 
+            FROM verifications
+            WHERE ip_bin = ? AND user_id != ?{}
             ORDER BY created_at DESC
-        """, (ip, user_id)).fetchall()
+            LIMIT ?
+        """
+        if scope:
+            return others, conn.execute(sql.format(" AND guild_id = ?"), (ip_bin, user_id, scope, ALT_DETAIL_LIMIT)).fetchall()
+        return others, conn.execute(sql.format(""), (ip_bin, user_id, ALT_DETAIL_LIMIT)).fetchall()
+
+    with span("alt_lookup"):
+        others, alts = await storage.read(_lookup)
+        annotate(others=others)
+
+    if others >= MAX_ACCOUNTS_PER_IP:
+        alt_info = [dict(row) for row in alts]
         
-        if len(alts) >= MAX_ACCOUNTS_PER_IP:
-            alt_info = [dict(row) for row in alts]
+        guild = await call_gateway("guild_member", guild_id=guild_id, user_id=user_id)
+        if guild["guild_name"] is not None:
+            embed = discord.Embed(
+                title="🚨 Double Compte Détecté!",
+                description=f"Un utilisateur a tenté de vérifier avec une IP déjà utilisée.",
+                color=0xFF0000
+            )
+            embed.add_field(
+                name="Détails",
+                value=f"IP: {ip}\nUtilisateur: <@{user_id}>\nComptes existants: " + 
+                      ", ".join(f"<@{alt['user_id']}>" for alt in alt_info[:5])
+            )
             
-            guild = bot.get_guild(guild_id)
-            if guild:
-                embed = discord.Embed(
-                    title="🚨 Double Compte Détecté!",
-                    description=f"Un utilisateur a tenté de vérifier avec une IP déjà utilisée.",
-                    color=0xFF0000
-                )
-                embed.add_field(
-                    name="Détails",
-                    value=f"IP: {ip}\nUtilisateur: <@{user_id}>\nComptes existants: " + 
-                          ", ".join(f"<@{alt['user_id']}>" for alt in alt_info[:5])
-                )
-                
-                
-                log_channel = discord.utils.get(guild.text_channels, name="logs")
-                if log_channel:
-                    try:
-                        await log_channel.send(embed=embed)
-                    except:
-                        pass  
-                
-                
-                try:
-                    member = guild.get_member(user_id)
-                    if member:
-                        await member.kick(reason="Double compte détecté")
-                        if log_channel:
-                            await log_channel.send(f"👢 <@{user_id}> a été kick (double compte).")
-                except:
-                    pass  
             
-            return True, f"Trop de comptes détectés sur cette IP ({len(alts)})", alt_info
-        return False, "", []
+            if guild["logs_channel_id"]:
+                post_log(embed, category='alt', channel_id=guild["logs_channel_id"])
+            
+            
+            await call_gateway("enqueue_job", kind="kick", guild_id=guild_id, user_id=user_id, payload={
+                "reason": "Double compte détecté",
+                "notice_channel_id": guild["logs_channel_id"],
+            }, dedup_key=f"kick:{guild_id}:{user_id}")
+        
+        return True, f"Trop de comptes détectés sur cette IP ({others})", alt_info
+    return False, "", []
+
+def _gateway_errors(handler):
+    """Page 503 si la gateway Discord est injoignable depuis un processus web."""
+    @functools.wraps(handler)
+    async def wrapper(request: web.Request) -> web.Response:
+        try:
+            return await handler(request)
+        except GatewayUnavailable as e:
+            logging.error(f"❌ Gateway injoignable pendant /verify : {e}")
+            html = render_html_with_delay("Erreur serveur", "Service momentanément indisponible",
+                                          "La vérification n'a pas pu aboutir. Demandez un nouveau lien dans quelques instants.")
+            VERIFY_OUTCOMES.inc(outcome='gateway_unavailable')
+            return web.Response(text=html, content_type='text/html', status=503)
+    return wrapper
+
+
+admission = AdmissionControl(
+    per_ip=RateLimiter(
+        rate=float(os.getenv("VERIFY_IP_RATE", "0.2")),     # jetons/seconde (0 = pas de limite)
+        burst=float(os.getenv("VERIFY_IP_BURST", "5")),
+    ),
+    per_token=RateLimiter(
+        rate=float(os.getenv("VERIFY_TOKEN_RATE", "0.1")),
+        burst=float(os.getenv("VERIFY_TOKEN_BURST", "3")),
+    ),
+    concurrency=ConcurrencyLimiter(
+        max_active=int(os.getenv("VERIFY_MAX_CONCURRENT", "64")),
+        max_waiting=int(os.getenv("VERIFY_MAX_WAITING", "128")),
+        wait_timeout=float(os.getenv("VERIFY_QUEUE_TIMEOUT", "2")),
+    ),
+)
+# Pages de rejet rendues et compressées une fois pour toutes
+RATE_LIMITED_PAGE = prerender_page(
+    "rate_limited.html", "Trop de tentatives", "Trop de tentatives",
+    "Vous avez fait trop de demandes de vérification. Patientez un instant avant de réessayer.",
+)
+OVERLOADED_PAGE = prerender_page(
+    "overloaded.html", "Service surchargé", "Service momentanément surchargé",
+    "Trop de vérifications sont en cours. Réessayez dans quelques secondes avec le même lien.",
+)
+
+
+# Reverse proxies dont on accepte X-Forwarded-For (par défaut : un proxy ou tunnel sur la même machine)
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(net.strip(), strict=False)
+    for net in os.getenv("TRUSTED_PROXIES", "127.0.0.0/8,::1/128").split(",") if net.strip()
+]
+
+
+def _is_trusted_proxy(addr) -> bool:
+    return any(addr in net for net in TRUSTED_PROXIES if net.version == addr.version)
+
+
+def client_ip(request: web.Request) -> Optional[str]:
+    """IP du client, normalisée : l'adresse du pair, sauf si c'est un proxy de confiance.
 
+    Dans ce cas on remonte X-Forwarded-For depuis la droite jusqu'au premier saut qui n'est pas un
+    proxy de confiance : les valeurs plus à gauche sont fournies par le client et ne sont pas lues.
+    """
+    addr = normalize_ip(request.remote)
+    if addr is None or not _is_trusted_proxy(addr):
+        return addr.compressed if addr is not None else None
+    hops = ",".join(request.headers.getall("X-Forwarded-For", [])).split(",")
+    for hop in reversed(hops):
+        hop_addr = normalize_ip(hop)
+        if hop_addr is None:
+            break  # valeur invalide : on s'arrête au dernier saut sûr
+        addr = hop_addr
+        if not _is_trusted_proxy(hop_addr):
+            break
+    return addr.compressed
+
+
+def rate_limit_key(ip: Optional[str]) -> Optional[bytes]:
+    """Clé du seau par IP : l'adresse en IPv4, le /64 en IPv6 (un client en dispose en général d'un entier)."""
+    addr = normalize_ip(ip)
+    if addr is None:
+        return None
+    return addr.packed if addr.version == 4 else subnet_prefix(addr)
+
+
+def _admission_control(handler):
+    """Limites de débit et de concurrence appliquées avant tout travail coûteux (429 / 503 + Retry-After)."""
+    @functools.wraps(handler)
+    async def wrapper(request: web.Request) -> web.Response:
+        reason, wait = admission.check_rate(rate_limit_key(client_ip(request)), request.query.get('token', '')[:64])
+        if reason:
+            VERIFY_OUTCOMES.inc(outcome=f'rate_limited_{reason}')
+            return prerendered_response(request, RATE_LIMITED_PAGE, status=429,
+                                        headers={'Retry-After': retry_after_header(wait)})
+        try:
+            async with admission.concurrency.slot():
+                return await handler(request)
+        except Overloaded as e:
+            VERIFY_OUTCOMES.inc(outcome='overloaded')
+            return prerendered_response(request, OVERLOADED_PAGE, status=503,
+                                        headers={'Retry-After': retry_after_header(e.retry_after)})
+    return wrapper
+
+
+@_admission_control
+@tracer.traced("verify")
+@_gateway_errors
 async def handle_verify(request: web.Request) -> web.Response:
     """Endpoint pour /verify?token=...
     Vérifie l'IP (VPN + alts) et les critères du compte Discord.
     """
     token = request.query.get('token')
     if not token:
-        html = render_html_with_delay("Token manquant", "Token manquant", "Le lien de vérification est invalide.",
-                                      guild_logo=user_avatar,
-                                        guild_name=user_name
-)
+        html = render_html_with_delay("Token manquant", "Token manquant", "Le lien de vérification est invalide.")
+        VERIFY_OUTCOMES.inc(outcome='missing_token')
         return web.Response(text=html, content_type='text/html', status=400)
 
     
-    entry = pending_tokens.pop(token, None)
+    with _stage('token_redeem'):
+        entry = await token_store.consume(token)
     if not entry:
-        db_entry = pop_pending_token_db(token)
-        if db_entry:
-            entry = db_entry
-    if not entry:
-        html = render_html_with_delay("Token invalide", "Token invalide ou expiré", "Le lien de vérification est invalide ou a expiré.",
-                guild_logo=user_avatar,
-                guild_name=user_name
-)
+        html = render_html_with_delay("Token invalide", "Token invalide ou expiré", "Le lien de vérification est invalide ou a expiré.")
+        VERIFY_OUTCOMES.inc(outcome='invalid_token')
         return web.Response(text=html, content_type='text/html', status=404)
 
     user_id, guild_id = entry
     
     
-    user_avatar, user_name = await get_user_profile(user_id)
+    with _stage('profile_fetch'):
+        user_avatar, user_name = await get_user_profile(user_id)
 
 
     
-    ip = request.headers.get("X-Forwarded-For", request.remote)
-    if ip and "," in ip:
-        ip = ip.split(",")[0].strip()
+    ip = client_ip(request)
 
     logging.info(f"Vérification du token {token} pour l'utilisateur {user_id} depuis IP {ip}")
 
+    ip_cols = ip_columns(ip)
+    if ip_cols is None:
+        logging.warning(f"Adresse IP invalide pour le token {token} : {ip!r}")
+        html = render_html_with_delay("Adresse IP invalide", "Adresse IP invalide", "Impossible de déterminer votre adresse IP. Réessayez plus tard.",
+                                     guild_logo=user_avatar,
+                                     guild_name=user_name
+                                     )
+        VERIFY_OUTCOMES.inc(outcome='invalid_ip')
+        return web.Response(text=html, content_type='text/html', status=400)
+    ip, ip_bin, ip_subnet = ip_cols
+
     
-    with sqlite3.connect(DB_PATH) as conn:
-        ip_status = conn.execute(
-            "SELECT list_type FROM ip_lists WHERE ip_address = ?", 
-            (ip,)
-        ).fetchone()
-        if ip_status and ip_status[0] == 'blacklist':
-            html = render_html_with_delay(
-                "✅ Vérification réussie",
-                "Vérification réussie !",
-                "Vous avez maintenant accès au serveur.",
-                guild_logo=user_avatar,
-                guild_name=user_name
+    with _stage('list_lookup'):
+        ip_status = lookup_ip_list(ip)
+    if ip_status and ip_status['list_type'] == 'blacklist':
+        html = render_html_with_delay(
+            "✅ Vérification réussie",
+            "Vérification réussie !",
+            "Vous avez maintenant accès au serveur.",
+            guild_logo=user_avatar,
+            guild_name=user_name
 )
-            return web.Response(text=html, content_type='text/html', status=403)
+        VERIFY_OUTCOMES.inc(outcome='blacklist')
+        return web.Response(text=html, content_type='text/html', status=403)
 
 
     
-    if not (ip_status and ip_status[0] == 'whitelist'):
+    degraded = False
+    if not (ip_status and ip_status['list_type'] == 'whitelist'):
         try:
-            is_vpn, raw = await check_ip_vpn(ip)
+            with _stage('vpn_check'):
+                is_vpn, raw = await verdict_cache.get_or_check(ip, check_ip_vpn)
+            degraded = bool(raw.get('degraded'))
+            if degraded:
+                logging.warning(f"Vérification VPN dégradée pour {ip} (étapes hors délai) : {raw.get('checks')}")
             if is_vpn:
                 logging.info(f"IP {ip} marquée comme VPN/proxy. details={raw}")
+                for check in raw.get('checks', []):
+                    VPN_REASONS.inc(reason=str(check).split(':', 1)[0])
                 
                 try:
-                    
-                    logs_channel = bot.get_channel(LOGS_CHANNEL_ID)
-                    if logs_channel is None:
-                        try:
-                            logs_channel = await bot.fetch_channel(LOGS_CHANNEL_ID)
-                        except Exception:
-                            logs_channel = None
-
-                    if logs_channel:
-                        guild_obj = bot.get_guild(guild_id)
-                        embed = discord.Embed(
-                            title="🚨 Blocage: VPN/Proxy détecté",
-                            description=f"Une vérification a été bloquée par la détection VPN/Proxy.",
-                            color=0xFF0000,
-                            timestamp=datetime.datetime.utcnow()
-                        )
-                        embed.add_field(name="Utilisateur", value="<@{}> ({})".format(user_id, user_id), inline=False)
-                        embed.add_field(name="Guild", value="{} ({})".format(guild_obj.name if guild_obj else guild_id, guild_id), inline=False)
-                        embed.add_field(name="IP", value=str(ip), inline=True)
-                        embed.add_field(name="Checks", value=str(raw), inline=False)
-                        embed.add_field(name="Token", value=str(token), inline=True)
-                        try:
-                            await logs_channel.send(embed=embed)
-                        except Exception:
-                            logging.exception("Impossible d'envoyer le log détaillé dans le salon #logs verif")
+                    guild_info = await call_gateway("guild_member", guild_id=guild_id, user_id=user_id)
+                    embed = discord.Embed(
+                        title="🚨 Blocage: VPN/Proxy détecté",
+                        description=f"Une vérification a été bloquée par la détection VPN/Proxy.",
+                        color=0xFF0000,
+                        timestamp=datetime.datetime.utcnow()
+                    )
+                    embed.add_field(name="Utilisateur", value="<@{}> ({})".format(user_id, user_id), inline=False)
+                    embed.add_field(name="Guild", value="{} ({})".format(guild_info["guild_name"] or guild_id, guild_id), inline=False)
+                    embed.add_field(name="IP", value=str(ip), inline=True)
+                    embed.add_field(name="Checks", value=str(raw)[:1000], inline=False)
+                    embed.add_field(name="Token", value=str(token), inline=True)
+                    post_log(embed, category='vpn_block')
                 except Exception:
-                    logging.exception("Erreur lors de l'envoi du log détaillé (continuer)")
+                    logging.exception("Erreur lors de la préparation du log détaillé (continuer)")
 
                 html = render_html_with_delay(
                     "Accès refusé",
@@ -1116,12 +1766,14 @@ async def handle_verify(request: web.Request) -> web.Response:
                 guild_logo=user_avatar,
                 guild_name=user_name
                 )
+                VERIFY_OUTCOMES.inc(outcome='vpn')
                 return web.Response(text=html, content_type='text/html', status=403)
         except Exception:
             logging.exception("Erreur lors de la vérification VPN locale (continuer la vérification)")
 
     
-    is_alt, alt_message, alt_accounts = await check_alt_accounts(ip, user_id, guild_id)
+    with _stage('alt_check'):
+        is_alt, alt_message, alt_accounts = await check_alt_accounts(ip, user_id, guild_id)
     if is_alt:
         logging.warning(f"Double compte détecté pour {user_id}: {alt_message}")
         html = render_html_with_delay("Vérification échouée", "Double compte détecté", f"{alt_message}. Un modérateur vérifiera votre cas.",
@@ -1136,34 +1788,35 @@ async def handle_verify(request: web.Request) -> web.Response:
         extra=json.dumps(alt_accounts, indent=2),
         token=token
     )
+        VERIFY_OUTCOMES.inc(outcome='alt')
         return web.Response(text=html, content_type='text/html', status=403)
     
 
 
 
-    guild = bot.get_guild(guild_id)
-    if not guild:
+    guild = await call_gateway("guild_member", guild_id=guild_id, user_id=user_id)
+    if guild["guild_name"] is None:
         logging.warning(f"Guild {guild_id} non trouvée dans le cache du bot.")
         
         html = render_html_with_delay("Erreur serveur", "Guild non trouvée", "La vérification a échoué (guild non trouvée). Réessayez plus tard.",
                                      guild_logo=user_avatar,
                                      guild_name=user_name
                                      )
+        VERIFY_OUTCOMES.inc(outcome='guild_not_found')
         return web.Response(text=html, content_type='text/html')
 
-    member = guild.get_member(user_id)
-    if not member:
+    if not guild["member"]:
         logging.warning(f"Membre {user_id} non trouvé dans la guild {guild_id} (peut-être quitté).")
         html = render_html_with_delay("Membre introuvable", "Membre introuvable", "Impossible de trouver votre compte sur le serveur. Avez-vous quitté ?",
                                      guild_logo=user_avatar,
                                      guild_name=user_name
                                      )
+        VERIFY_OUTCOMES.inc(outcome='member_not_found')
         return web.Response(text=html, content_type='text/html')
 
 
-    # On récupère la vraie date de création du compte (pas juste l'entrée sur le serveur)
-    user = await bot.fetch_user(user_id)
-    created_at = user.created_at.replace(tzinfo=datetime.timezone.utc)
+    # Vraie date de création du compte (pas juste l'entrée sur le serveur), lue dans le snowflake : aucun appel REST
+    created_at = snowflake_created_at(user_id)
     now_utc = datetime.datetime.now(datetime.timezone.utc)
     account_age = (now_utc - created_at).days
 
@@ -1182,112 +1835,104 @@ async def handle_verify(request: web.Request) -> web.Response:
             guild_logo=user_avatar,
             guild_name=user_name
         )
-        logging.info(f"Âge du compte pour {user}: {account_age} jours (minimum requis: {MIN_ACCOUNT_AGE_DAYS})")
+        logging.info(f"Âge du compte pour {user_id}: {account_age} jours (minimum requis: {MIN_ACCOUNT_AGE_DAYS})")
+        VERIFY_OUTCOMES.inc(outcome='account_too_young')
         return web.Response(text=html, content_type='text/html', status=403)
 
 
 
 
     
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
+    with _stage('db_insert'):
+        row_id = await storage.execute("""
             INSERT INTO verifications (
-                user_id, guild_id, ip_address, account_created_at,
+                user_id, guild_id, ip_address, ip_bin, ip_subnet, account_created_at,
                 is_vpn, verification_status
-            ) VALUES (?, ?, ?, ?, ?, ?)
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (
-            user_id, guild_id, ip, member.created_at,
-            False, 'verified'
+            user_id, guild_id, ip, ip_bin, ip_subnet, created_at,
+            False, 'verified_flagged' if degraded else 'verified'
         ))
+    record_cluster_link(user_id, ip_bin, ip_subnet, row_id)
 
-    
-    role_name = "Vérifié"
-    role = discord.utils.get(guild.roles, name=role_name)
-    if role:
-        try:
-            await member.add_roles(role, reason="Vérification réussie (IP + âge compte OK)")
-            logging.info(f"Rôle '{role_name}' ajouté à {member}.")
-        except Exception:
-            logging.exception("Impossible d'ajouter le rôle au membre.")
-            html = render_html_with_delay(
-                "Vérification partielle",
-                "Rôle non attribué",
-                "Vérification réussie mais le rôle n'a pas pu être attribué (permissions). Contactez un admin.",
-                guild_logo=user_avatar,
-                guild_name=user_name
-            )
-            return web.Response(text=html, content_type='text/html')
-    else:
-        logging.warning(
-            f"Rôle '{role_name}' introuvable dans la guild {guild.name}. Tentative de création..."
-        )
-        
-        try:
-            new_role = await guild.create_role(name=role_name, reason="Création rôle Vérifié pour vérification")
-            logging.info(f"Rôle '{role_name}' créé dans la guild {guild.name}.")
-            try:
-                await member.add_roles(new_role, reason="Vérification réussie (rôle créé)")
-                logging.info(f"Rôle '{role_name}' ajouté à {member} après création.")
-            except Exception:
-                logging.exception("Impossible d'ajouter le rôle nouvellement créé au membre.")
-                html = render_html_with_delay(
-                    "Vérification partielle",
-                    "Rôle non attribué",
-                    "Vérification réussie mais le rôle n'a pas pu être attribué (permissions). Contactez un admin.",
-                    guild_logo=user_avatar,
-                    guild_name=user_name
-                )
-                return web.Response(text=html, content_type='text/html')
-        except Exception:
-            logging.exception("Impossible de créer le rôle 'Vérifié' (permissions manquantes?).")
-            html = render_html_with_delay(
-                "Vérification partielle",
-                "Rôle introuvable",
-                "Vérification réussie mais le rôle introuvable et la création a échoué (permissions). Contactez un admin.",
-                guild_logo=user_avatar,
-                guild_name=user_name
-            )
-            return web.Response(text=html, content_type='text/html')
+
+    # Le rôle est attribué en tâche de fond : la page répond dès que le verdict est enregistré
+    await call_gateway("enqueue_job", kind="grant_role", guild_id=guild_id, user_id=user_id,
+                       dedup_key=f"grant_role:{guild_id}:{user_id}")
 
     html = render_html_with_delay("Vérification réussie", "✅ Vérification réussie!", "Vous avez maintenant accès au serveur.",
                                     guild_logo=user_avatar,
                                     guild_name=user_name
                                     )
+    VERIFY_OUTCOMES.inc(outcome='verified_flagged' if degraded else 'verified')
     return web.Response(text=html, content_type='text/html')
 
 
 app.router.add_get('/verify', handle_verify)
+app.router.add_get('/static/{name}', handle_static)
+app.router.add_get('/metrics', metrics_handler(REGISTRY, token=METRICS_TOKEN))
+
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+
+
+def _check_debug_token(request: web.Request):
+    # Sans DEBUG_TOKEN, les routes de diagnostic n'existent pas
+    if not DEBUG_TOKEN:
+        raise web.HTTPNotFound()
+    if request.headers.get('Authorization') != f"Bearer {DEBUG_TOKEN}":
+        raise web.HTTPUnauthorized()
+
+
+async def handle_debug_profile(request: web.Request) -> web.Response:
+    """/debug/profile?mode=cpu|memory&seconds=10&top=30"""
+    _check_debug_token(request)
+    try:
+        seconds = float(request.query.get('seconds', '10'))
+        top = int(request.query.get('top', '30'))
+    except ValueError:
+        raise web.HTTPBadRequest(text="seconds / top invalides")
+    try:
+        if request.query.get('mode') == 'memory':
+            report = await memory_profile(seconds, top)
+        else:
+            report = await cpu_profile(seconds, top, sort=request.query.get('sort', 'cumulative'))
+    except ProfilerBusy:
+        raise web.HTTPConflict(text="Une capture est déjà en cours")
+    return web.Response(text=report, content_type='text/plain')
+
+
+async def handle_debug_traces(request: web.Request) -> web.Response:
+    """Dernières traces lentes de /verify."""
+    _check_debug_token(request)
+    body = "\n\n".join(trace.format() for trace in reversed(tracer.recent_slow)) or "Aucune requête lente enregistrée."
+    return web.Response(text=body, content_type='text/plain')
+
+
+app.router.add_get('/debug/profile', handle_debug_profile)
+app.router.add_get('/debug/traces', handle_debug_traces)
 
 
 
 async def log_verification_refus(reason: str, user_id: int, guild_id: int, ip: str, extra: str = "", token: str = ""):
-        """Envoie un log détaillé dans le salon #logs en cas de refus de vérification."""
+        """Met en file un log détaillé pour le salon #logs en cas de refus de vérification (non bloquant)."""
         try:
-            logs_channel = bot.get_channel(LOGS_CHANNEL_ID)
-            if logs_channel is None:
-                try:
-                    logs_channel = await bot.fetch_channel(LOGS_CHANNEL_ID)
-                except Exception:
-                    logs_channel = None
-
-            if logs_channel:
-                guild_obj = bot.get_guild(guild_id)
-                embed = discord.Embed(
-                    title="🚫 Vérification refusée",
-                    description=f"**Raison :** {reason}",
-                    color=0xFF0000,
-                    timestamp=datetime.datetime.utcnow()
-                )
-                embed.add_field(name="Utilisateur", value=f"<@{user_id}> ({user_id})", inline=False)
-                embed.add_field(name="IP", value=ip or "Inconnue", inline=True)
-                embed.add_field(name="Guild", value=f"{guild_obj.name if guild_obj else guild_id}", inline=False)
-                if token:
-                    embed.add_field(name="Token", value=token, inline=False)
-                if extra:
-                    embed.add_field(name="Détails", value=extra[:1000], inline=False)
-                await logs_channel.send(embed=embed)
+            guild_info = await call_gateway("guild_member", guild_id=guild_id, user_id=user_id)
+            embed = discord.Embed(
+                title="🚫 Vérification refusée",
+                description=f"**Raison :** {reason}",
+                color=0xFF0000,
+                timestamp=datetime.datetime.utcnow()
+            )
+            embed.add_field(name="Utilisateur", value=f"<@{user_id}> ({user_id})", inline=False)
+            embed.add_field(name="IP", value=ip or "Inconnue", inline=True)
+            embed.add_field(name="Guild", value=f"{guild_info['guild_name'] or guild_id}", inline=False)
+            if token:
+                embed.add_field(name="Token", value=token, inline=False)
+            if extra:
+                embed.add_field(name="Détails", value=extra[:1000], inline=False)
+            post_log(embed, category='refus')
         except Exception:
-            logging.exception("Erreur lors de l'envoi du log de refus de vérification")
+            logging.exception("Erreur lors de la préparation du log de refus de vérification")
 
 
 
@@ -1329,29 +1974,77 @@ async def periodic_post_verification():
         await asyncio.sleep(interval)
 
 
-async def start_web_server():
+async def start_web_server(reuse_port: bool = False):
 	runner = web.AppRunner(app)
 	await runner.setup()
-	site = web.TCPSite(runner, '0.0.0.0', WEB_PORT)
+	site = web.TCPSite(runner, '0.0.0.0', WEB_PORT, reuse_port=reuse_port)
 	await site.start()
 	logging.info(f"Serveur web démarré sur le port {WEB_PORT} (BASE_URL={BASE_URL})")
 
 
+async def start_gateway_metrics_server():
+    """Mode multi-processus : /metrics de la gateway, avec les métriques poussées par les processus web."""
+    metrics_app = web.Application()
+    metrics_app.router.add_get('/metrics', metrics_handler(REGISTRY, token=METRICS_TOKEN, aggregator=metrics_aggregator))
+    runner = web.AppRunner(metrics_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', GATEWAY_METRICS_PORT).start()
+    logging.info(f"📈 Métriques agrégées de la gateway sur le port {GATEWAY_METRICS_PORT}")
+
+
+async def run_web_worker():
+    """Processus web : sert /verify et délègue les actions Discord à la gateway par l'IPC."""
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    await start_detection_services()
+    try:
+        await gateway_client.connect()
+    except GatewayUnavailable as e:
+        logging.warning(f"Gateway pas encore joignable ({e}) : nouvelle tentative à la première requête")
+    await start_web_server(reuse_port=True)
+    push_task = asyncio.create_task(push_metrics())
+    logging.info(f"Processus web {WEB_WORKER_ID} prêt (pid {os.getpid()})")
+    await stop.wait()
+    push_task.cancel()
+    await gateway_client.close()
+    await http_client.close()
+
+
 async def main():
-    
-    await start_web_server()
-    
-    
-    if not DISCORD_TOKEN:
-        logging.error("DISCORD_TOKEN non défini. Définissez la variable d'environnement DISCORD_TOKEN avant de lancer le bot.")
-        logging.error("En PowerShell: $env:DISCORD_TOKEN = 'votre_token' ; python bot.py")
+    if IS_WEB_WORKER:
+        await run_web_worker()
         return
 
+    global web_supervisor
+    supervisor = None
+    if WEB_WORKERS > 0:
+        await gateway_server.start()
+        await start_gateway_metrics_server()
+        supervisor = web_supervisor = WorkerSupervisor(WEB_WORKERS, [sys.executable, os.path.abspath(__file__)])
+        supervisor_task = asyncio.create_task(supervisor.run())
+        logging.info(f"Mode multi-processus : {WEB_WORKERS} processus web sur le port {WEB_PORT}")
+    else:
+        await start_web_server()
+    
     try:
-        await bot.start(DISCORD_TOKEN)
-    except discord.LoginFailure:
-        logging.error("Impossible de se connecter à Discord. Le token fourni est invalide. Regénérez le token dans le Developer Portal et mettez à jour DISCORD_TOKEN.")
-        return
+        if not DISCORD_TOKEN:
+            logging.error("DISCORD_TOKEN non défini. Définissez la variable d'environnement DISCORD_TOKEN avant de lancer le bot.")
+            logging.error("En PowerShell: $env:DISCORD_TOKEN = 'votre_token' ; python bot.py")
+            return
+
+        try:
+            await bot.start(DISCORD_TOKEN)
+        except discord.LoginFailure:
+            logging.error("Impossible de se connecter à Discord. Le token fourni est invalide. Regénérez le token dans le Developer Portal et mettez à jour DISCORD_TOKEN.")
+            return
+        finally:
+            if not bot.is_closed():
+                await bot.close()
+    finally:
+        if supervisor is not None:
+            await supervisor.stop()
+            supervisor_task.cancel()
+            await gateway_server.close()
 
 
 if __name__ == '__main__':
@@ -1361,9 +2054,13 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         logging.info("Arrêt demandé par l'utilisateur.")
     finally:
-        try:
-            
-            if hasattr(bot, 'http_session') and bot.http_session:
-                asyncio.get_event_loop().run_until_complete(bot.http_session.close())
-        except Exception:
-            pass
+        rdns_resolver.close()
+        # L'index des groupes n'est tenu que par la gateway
+        if not IS_WEB_WORKER:
+            try:
+                alt_graph.save_snapshot()
+            except Exception:
+                logging.exception("Impossible de sauvegarder l'index des groupes de comptes")
+        geoip_asn.close()
+        geoip_country.close()
+        storage.close()
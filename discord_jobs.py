@@ -0,0 +1,236 @@
+"""File de travaux Discord persistante (attribution de rôles, kicks, logs).
+
+Les actions Discord lentes ou soumises au rate-limit ne sont plus attendues
+par /verify : elles sont enregistrées dans la table ``discord_jobs`` puis
+exécutées par une tâche de fond. Les travaux prêts sont traités par priorité
+(rôles, puis kicks, puis logs), avec un espacement minimal par guild, une
+reprise à délai exponentiel et une clé d'idempotence qui empêche de mettre
+deux fois le même travail en file.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+from storage import Storage
+
+
+PRIORITY_GRANT = 0
+PRIORITY_KICK = 1
+PRIORITY_LOG = 2
+
+
+class Job:
+    __slots__ = ('id', 'kind', 'guild_id', 'user_id', 'payload', 'priority', 'attempts', 'next_run_at')
+
+    def __init__(self, id: int, kind: str, guild_id: Optional[int], user_id: Optional[int],
+                 payload: dict, priority: int, attempts: int = 0, next_run_at: float = 0.0):
+        self.id = id
+        self.kind = kind
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.payload = payload
+        self.priority = priority
+        self.attempts = attempts
+        self.next_run_at = next_run_at
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} guild={self.guild_id} user={self.user_id} essai={self.attempts}>"
+
+
+class JobDropped(Exception):
+    """Levée par un gestionnaire quand le travail n'a plus de sens (membre parti, guild inconnue...)."""
+
+
+Handler = Callable[[Job], Awaitable[None]]
+
+
+class JobQueue:
+    def __init__(
+        self,
+        storage: Storage,
+        max_attempts: int = 8,
+        base_delay: float = 2.0,
+        max_delay: float = 600.0,
+        guild_interval: float = 0.5,
+        on_give_up: Optional[Callable[[Job, BaseException], None]] = None,
+    ):
+        self.storage = storage
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.guild_interval = guild_interval
+        self.on_give_up = on_give_up
+        self._handlers: Dict[str, Tuple[Handler, int]] = {}
+        # Travaux prêts, triés par (priorité, ordre d'arrivée)
+        self._ready: List[Tuple[int, int, Job]] = []
+        # Travaux différés (reprise ou espacement par guild), triés par échéance
+        self._delayed: List[Tuple[float, int, Job]] = []
+        self._seq = itertools.count()
+        self._guild_next: Dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    def register(self, kind: str, handler: Handler, priority: int):
+        self._handlers[kind] = (handler, priority)
+
+    @property
+    def depth(self) -> int:
+        return len(self._ready) + len(self._delayed)
+
+    # ------------------------------------------------------------------ file
+
+    def load(self) -> int:
+        """Recharge les travaux restés en attente (synchrone, au démarrage)."""
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT id, kind, guild_id, user_id, payload, priority, attempts, next_run_at FROM discord_jobs ORDER BY id"
+        ).fetchall())
+        for row in rows:
+            self._schedule(Job(row["id"], row["kind"], row["guild_id"], row["user_id"],
+                               json.loads(row["payload"] or "{}"), row["priority"], row["attempts"], row["next_run_at"]))
+        if rows:
+            logging.info(f"📋 {len(rows)} travaux Discord en attente rechargés")
+        return len(rows)
+
+    def _schedule(self, job: Job):
+        if job.next_run_at > time.time():
+            heapq.heappush(self._delayed, (job.next_run_at, next(self._seq), job))
+        else:
+            heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+        self._wakeup.set()
+
+    async def enqueue(self, kind: str, guild_id: Optional[int] = None, user_id: Optional[int] = None,
+                      payload: Optional[dict] = None, dedup_key: Optional[str] = None) -> bool:
+        """Persiste puis met en file un travail. Retourne False si un travail de même clé est déjà en attente."""
+        if kind not in self._handlers:
+            raise ValueError(f"Type de travail inconnu : {kind}")
+        priority = self._handlers[kind][1]
+        payload = payload or {}
+        now = time.time()
+
+        def _insert(conn):
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO discord_jobs (kind, guild_id, user_id, payload, priority, next_run_at, dedup_key, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, guild_id, user_id, json.dumps(payload), priority, now, dedup_key, now)
+            )
+            # rowcount vaut 0 si la clé d'idempotence existe déjà
+            return cur.lastrowid if cur.rowcount else None
+
+        job_id = await self.storage.write(_insert)
+        if job_id is None:
+            logging.info(f"Travail {dedup_key} déjà en attente, ignoré")
+            return False
+        self._schedule(Job(job_id, kind, guild_id, user_id, payload, priority, 0, now))
+        return True
+
+    # ------------------------------------------------------------------ exécution
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _next_job(self) -> Tuple[Optional[Job], Optional[float]]:
+        """Prochain travail exécutable, ou délai à attendre avant d'en avoir un."""
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            job = heapq.heappop(self._delayed)[2]
+            heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+        while self._ready:
+            job = heapq.heappop(self._ready)[2]
+            allowed = self._guild_next.get(job.guild_id, 0)
+            if job.guild_id is not None and allowed > now:
+                # Guild encore en période d'espacement : on décale sans consommer d'essai
+                job.next_run_at = allowed
+                heapq.heappush(self._delayed, (allowed, next(self._seq), job))
+                continue
+            return job, None
+        if self._delayed:
+            return None, max(0.0, self._delayed[0][0] - now)
+        return None, None
+
+    async def _finish(self, job: Job):
+        await self.storage.execute("DELETE FROM discord_jobs WHERE id = ?", (job.id,))
+
+    async def _run_one(self, job: Job):
+        handler = self._handlers.get(job.kind, (None, 0))[0]
+        if handler is None:
+            logging.error(f"Aucun gestionnaire pour {job!r}, travail supprimé")
+            await self._finish(job)
+            return
+        if job.guild_id is not None:
+            self._guild_next[job.guild_id] = time.time() + self.guild_interval
+        try:
+            await handler(job)
+        except JobDropped as e:
+            logging.info(f"Travail {job!r} abandonné : {e}")
+            await self._finish(job)
+            return
+        except (discord.Forbidden, discord.NotFound) as e:
+            # Permissions manquantes ou cible disparue : réessayer ne changera rien
+            self.failed += 1
+            logging.warning(f"❌ Échec définitif de {job!r} : {e}")
+            await self._finish(job)
+            self._give_up(job, e)
+            return
+        except Exception as e:
+            job.attempts += 1
+            if job.attempts >= self.max_attempts:
+                self.failed += 1
+                logging.exception(f"❌ {job!r} abandonné après {job.attempts} essais")
+                await self._finish(job)
+                self._give_up(job, e)
+                return
+            delay = self._backoff(job.attempts)
+            retry_after = getattr(e, 'retry_after', None)
+            if isinstance(e, discord.HTTPException) and e.status == 429:
+                self.rate_limited += 1
+            if isinstance(e, discord.HTTPException) and e.status == 429 and retry_after:
+                delay = max(delay, retry_after)
+                if job.guild_id is not None:
+                    self._guild_next[job.guild_id] = time.time() + retry_after
+            self.retried += 1
+            job.next_run_at = time.time() + delay
+            logging.warning(f"⚠️ {job!r} en échec ({e!r}), nouvel essai dans {delay:.1f}s")
+            await self.storage.execute(
+                "UPDATE discord_jobs SET attempts = ?, next_run_at = ?, last_error = ? WHERE id = ?",
+                (job.attempts, job.next_run_at, repr(e)[:500], job.id)
+            )
+            self._schedule(job)
+            return
+        self.done += 1
+        await self._finish(job)
+
+    def _give_up(self, job: Job, error: BaseException):
+        if self.on_give_up is None:
+            return
+        try:
+            self.on_give_up(job, error)
+        except Exception:
+            logging.exception(f"Erreur dans le rappel d'abandon de {job!r}")
+
+    async def run(self, bot):
+        """Tâche de fond : exécute les travaux dès que le bot est prêt."""
+        await bot.wait_until_ready()
+        while True:
+            job, wait = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_one(job)
+            except Exception:
+                logging.exception(f"Erreur inattendue lors de l'exécution de {job!r}")
@@ -0,0 +1,232 @@
+"""Canal IPC entre les processus web et le processus gateway Discord.
+
+Protocole : une ligne JSON par message sur un socket Unix.
+
+- requête   ``{"id": 3, "op": "guild_member", "args": {...}}``
+- réponse   ``{"id": 3, "ok": true, "result": ...}`` ou ``{"id": 3, "ok": false, "error": "..."}``
+- notification (sans réponse) : requête sans ``id``
+- événement poussé par la gateway : ``{"event": "ip_list_add", "args": {...}}``
+
+Les requêtes sont traitées en parallèle côté gateway ; le client multiplexe ses
+appels sur une seule connexion et se reconnecte au besoin.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+MAX_LINE = 1024 * 1024
+
+Handler = Callable[..., Awaitable[object]]
+
+
+class GatewayUnavailable(Exception):
+    """La gateway est injoignable ou n'a pas répondu à temps."""
+
+
+class GatewayError(Exception):
+    """L'opération a échoué côté gateway."""
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+class GatewayServer:
+    def __init__(self, path: str, handlers: Dict[str, Handler]):
+        self.path = path
+        self.handlers = handlers
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self.requests = 0
+        self.errors = 0
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # socket laissé par un arrêt brutal
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=MAX_LINE)
+        os.chmod(self.path, 0o600)
+        logging.info(f"🔌 IPC gateway en écoute sur {self.path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def broadcast(self, event: str, **args):
+        """Pousse un événement à tous les processus web connectés (sans attendre)."""
+        line = _encode({"event": event, "args": args})
+        for writer in list(self._clients):
+            if not writer.is_closing():
+                writer.write(line)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients.add(writer)
+        tasks: Set[asyncio.Task] = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    logging.warning("IPC : message illisible ignoré")
+                    continue
+                task = asyncio.create_task(self._dispatch(message, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass  # client parti, ou serveur en cours d'arrêt
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, message: dict, writer: asyncio.StreamWriter):
+        self.requests += 1
+        request_id = message.get("id")
+        handler = self.handlers.get(message.get("op"))
+        try:
+            if handler is None:
+                raise GatewayError(f"opération inconnue : {message.get('op')!r}")
+            result = await handler(**(message.get("args") or {}))
+            reply = {"id": request_id, "ok": True, "result": result}
+        except Exception as e:
+            self.errors += 1
+            if not isinstance(e, GatewayError):
+                logging.exception(f"IPC : erreur dans l'opération {message.get('op')}")
+            reply = {"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        if request_id is not None and not writer.is_closing():
+            writer.write(_encode(reply))
+
+    def stats(self) -> dict:
+        return {"clients": len(self._clients), "requests": self.requests, "errors": self.errors}
+
+
+class GatewayClient:
+    def __init__(self, path: str, timeout: float = 10.0, on_connect: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.timeout = timeout
+        self.on_connect = on_connect
+        self._events: Dict[str, Callable[..., None]] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.dropped_notifications = 0
+
+    def on_event(self, event: str, callback: Callable[..., None]):
+        self._events[event] = callback
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self.connected:
+                return
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path, limit=MAX_LINE)
+            except OSError as e:
+                raise GatewayUnavailable(f"connexion à {self.path} impossible : {e}") from e
+            self._reader_task = asyncio.create_task(self._read_loop(reader, self._writer))
+            logging.info(f"🔌 Connecté à la gateway ({self.path})")
+            if self.on_connect is not None:
+                self.on_connect()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        self._fail_pending(GatewayUnavailable("client fermé"))
+
+    async def call(self, op: str, **args):
+        """Appelle ``op`` dans le processus gateway et retourne son résultat."""
+        if not self.connected:
+            await self.connect()
+        self.calls += 1
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(_encode({"id": request_id, "op": op, "args": args}))
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.failures += 1
+            raise GatewayUnavailable(f"pas de réponse de la gateway pour {op} ({self.timeout:.0f}s)")
+        except GatewayUnavailable:
+            self.failures += 1
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    def notify(self, op: str, **args) -> bool:
+        """Envoie ``op`` sans attendre de réponse ; abandonné si la gateway est déconnectée."""
+        if not self.connected:
+            self.dropped_notifications += 1
+            return False
+        self._writer.write(_encode({"op": op, "args": args}))
+        return True
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "event" in message:
+                    callback = self._events.get(message["event"])
+                    if callback is not None:
+                        try:
+                            callback(**(message.get("args") or {}))
+                        except Exception:
+                            logging.exception(f"IPC : erreur dans le traitement de l'événement {message['event']}")
+                    continue
+                future = self._pending.get(message.get("id"))
+                if future is None or future.done():
+                    continue
+                if message.get("ok"):
+                    future.set_result(message.get("result"))
+                else:
+                    future.set_exception(GatewayError(message.get("error")))
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            logging.warning(f"IPC : connexion à la gateway interrompue ({e})")
+        finally:
+            logging.warning("🔌 Déconnecté de la gateway")
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+            self._fail_pending(GatewayUnavailable("connexion à la gateway perdue"))
+
+    def _fail_pending(self, error: Exception):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "in_flight": len(self._pending),
+            "calls": self.calls,
+            "failures": self.failures,
+            "dropped_notifications": self.dropped_notifications,
+        }
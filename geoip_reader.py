@@ -0,0 +1,118 @@
+"""Lecteurs GeoLite2 partagés, ouverts une seule fois en mode mmap.
+
+Chaque base est rechargée à chaud lorsque le fichier ``.mmdb`` change sur le
+disque : le nouveau lecteur remplace l'ancien d'un seul coup (affectation
+atomique), l'ancien n'est fermé qu'au rechargement suivant pour ne pas couper
+une recherche en cours dans un autre thread.
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Callable, Iterator, Optional, Tuple
+
+try:
+    import geoip2.database
+    import geoip2.errors
+    import maxminddb
+    GEOIP_AVAILABLE = True
+except Exception:
+    GEOIP_AVAILABLE = False
+
+
+class GeoIPDatabase:
+    def __init__(self, path: str):
+        self.path = path
+        self._reader = None
+        self._retired = None
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self.is_city = False
+
+    @property
+    def available(self) -> bool:
+        return self._reader is not None
+
+    def reload(self) -> bool:
+        """(Re)ouvre la base si le fichier a changé. Retourne True si un nouveau lecteur est actif."""
+        if not GEOIP_AVAILABLE:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            try:
+                reader = geoip2.database.Reader(self.path, mode=geoip2.database.MODE_MMAP)
+            except Exception:
+                logging.exception(f"Impossible d'ouvrir la base GeoIP {self.path}")
+                return False
+            if self._retired is not None:
+                try:
+                    self._retired.close()
+                except Exception:
+                    pass
+            self._retired = self._reader
+            self.is_city = 'City' in reader.metadata().database_type
+            self._reader = reader
+            self._mtime = mtime
+        logging.info(f"Base GeoIP chargée : {self.path}")
+        return True
+
+    def asn(self, ip: str) -> Tuple[Optional[int], Optional[str]]:
+        reader = self._reader
+        if reader is None:
+            return None, None
+        try:
+            rec = reader.asn(ip)
+        except (geoip2.errors.AddressNotFoundError, ValueError):
+            return None, None
+        return rec.autonomous_system_number, rec.autonomous_system_organization
+
+    def country(self, ip: str) -> Optional[str]:
+        """Code ISO du pays (base Country ou City)."""
+        reader = self._reader
+        if reader is None:
+            return None
+        try:
+            rec = reader.city(ip) if self.is_city else reader.country(ip)
+        except (geoip2.errors.AddressNotFoundError, ValueError):
+            return None
+        return rec.country.iso_code
+
+    def iter_asn_records(self) -> Iterator[Tuple[int, str]]:
+        """Parcourt toute la base ASN : (numéro, organisation) pour chaque réseau."""
+        if not GEOIP_AVAILABLE:
+            return
+        with maxminddb.open_database(self.path, maxminddb.MODE_MMAP) as reader:
+            for _, record in reader:
+                if record and record.get('autonomous_system_number'):
+                    yield record['autonomous_system_number'], record.get('autonomous_system_organization') or ''
+
+    def close(self):
+        with self._lock:
+            for reader in (self._reader, self._retired):
+                if reader is not None:
+                    try:
+                        reader.close()
+                    except Exception:
+                        pass
+            self._reader = self._retired = None
+            self._mtime = None
+
+
+async def watch_databases(*dbs: GeoIPDatabase, interval: float = 60, on_reload: Optional[Callable[[GeoIPDatabase], None]] = None):
+    """Tâche de fond : recharge les bases dont le fichier a été remplacé."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        for db in dbs:
+            try:
+                if await loop.run_in_executor(None, db.reload) and on_reload is not None:
+                    on_reload(db)
+            except Exception:
+                logging.exception(f"Erreur lors du rechargement de {db.path}")
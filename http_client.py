@@ -0,0 +1,91 @@
+"""Client HTTP partagé (pool de connexions aiohttp) et disjoncteur pour les API externes."""
+import logging
+import time
+from typing import Optional
+
+import aiohttp
+
+
+class CircuitBreaker:
+    """Disjoncteur simple : fermé → ouvert après N échecs → semi-ouvert après le délai de refroidissement."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_until = 0.0
+        self._half_open_trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_until == 0:
+            return "closed"
+        return "open" if time.monotonic() < self.opened_until else "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._half_open_trial:
+            # Un seul appel d'essai à la fois après le refroidissement
+            self._half_open_trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_until = 0.0
+        self._half_open_trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._half_open_trial or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def abandon(self):
+        """Appel interrompu sans résultat (annulation) : s'il s'agissait de l'essai semi-ouvert, il compte comme un échec."""
+        if self._half_open_trial:
+            self.record_failure()
+
+    def trip(self, cooldown: Optional[float] = None):
+        cooldown = self.cooldown if cooldown is None else cooldown
+        self.opened_until = time.monotonic() + cooldown
+        self._half_open_trial = False
+        logging.warning(f"Disjoncteur '{self.name}' ouvert pour {cooldown:.0f}s ({self.failures} échecs)")
+
+
+class HttpClient:
+    """Une seule ``aiohttp.ClientSession`` pour toute l'application (keep-alive, limites par hôte)."""
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 8, keepalive_timeout: float = 30, timeout: float = 10):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            self._session = self._new_session()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Création paresseuse : le serveur web peut recevoir des requêtes avant setup_hook.
+        if self._session is None or self._session.closed:
+            self._session = self._new_session()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
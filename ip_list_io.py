@@ -0,0 +1,201 @@
+"""Import / export en masse des listes d'IP (blacklist / whitelist).
+
+Les fichiers (texte brut ou CSV, éventuellement gzippés) sont lus ligne à
+ligne et écrits par paquets : un ``executemany`` par paquet, chacun dans sa
+propre transaction. L'index mémoire n'est reconstruit qu'une fois, à la fin.
+L'export parcourt la table avec ``fetchmany`` et écrit le CSV au fil de l'eau.
+
+Formats acceptés à l'import, une entrée par ligne :
+
+- ``203.0.113.7``, ``198.51.100.0/24``, ``AS16276`` ;
+- ``203.0.113.7:8080`` ou ``http://203.0.113.7:3128`` (listes de proxies : le port est ignoré) ;
+- CSV ``entrée,raison[,…]`` (ligne d'en-tête facultative), donc aussi les exports de ce module.
+
+Si l'en-tête nomme les colonnes ``list_type``, ``added_by`` ou ``added_at``
+(cas des exports), elles sont respectées : les lignes d'une autre liste que
+celle visée sont ignorées et comptées, l'auteur et la date d'ajout d'origine
+sont conservés. Un export des deux listes se réimporte donc en deux fois.
+
+Les lignes vides et les commentaires (``#``, ``;``, ``//``) sont ignorés.
+"""
+import asyncio
+import csv
+import gzip
+import io
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from iputils import ip_columns
+from ip_trie import format_list_entry, parse_list_entry
+
+CHUNK_SIZE = 5000
+MAX_INVALID_SAMPLES = 5
+EXPORT_COLUMNS = ('ip', 'reason', 'list_type', 'added_by', 'added_at')
+META_COLUMNS = ('list_type', 'added_by', 'added_at')
+
+IMPORT_SQL = (
+    "INSERT OR REPLACE INTO ip_lists (ip_address, ip_bin, list_type, added_by, added_at, reason) "
+    "VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)"
+)
+
+Progress = Callable[['ImportResult'], Awaitable[None]]
+
+
+def open_text(path: str, mode: str = 'rt') -> TextIO:
+    """Ouvre un fichier texte, gzippé si son nom se termine par ``.gz``."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8', errors='replace', newline='')
+    return open(path, mode, encoding='utf-8', errors='replace', newline='')
+
+
+def _strip_entry(field: str) -> str:
+    field = field.strip().strip('"\'')
+    if '://' in field:
+        field = field.split('://', 1)[1].split('/', 1)[0]
+    if field.startswith('['):  # [2001:db8::1]:8080
+        return field[1:].split(']', 1)[0]
+    if field.count(':') == 1 and '.' in field:  # 203.0.113.7:8080
+        return field.split(':', 1)[0]
+    return field
+
+
+def _split_fields(line: str) -> List[str]:
+    if '"' in line:
+        return next(csv.reader([line]), [''])
+    if ',' in line:
+        return line.split(',')
+    return line.split(None, 1)
+
+
+def _field(fields: List[str], index: Optional[int]) -> Optional[str]:
+    if index is None or index >= len(fields):
+        return None
+    return fields[index].strip() or None
+
+
+def iter_entries(lines: Iterable[str]) -> Iterator[Tuple[str, Optional[str], Optional[str], Dict[str, str]]]:
+    """(ligne brute, entrée canonique ou None si invalide, raison, colonnes META_COLUMNS présentes) par ligne utile."""
+    first = True
+    columns: Dict[str, int] = {'reason': 1}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(('#', ';', '//')):
+            continue
+        fields = _split_fields(line)
+        text = _strip_entry(fields[0] if fields else '')
+        parsed = parse_list_entry(text)
+        if parsed is None and first and text.replace('_', '').isalpha():
+            first = False  # en-tête CSV (ip,reason,...) : il indique où trouver les autres colonnes
+            names = [name.strip().lower() for name in fields]
+            columns = {name: i for i, name in enumerate(names) if i and (name == 'reason' or name in META_COLUMNS)}
+            continue
+        first = False
+        meta = {}
+        for name in META_COLUMNS:
+            value = _field(fields, columns.get(name))
+            if value is not None:
+                meta[name] = value
+        yield line, (format_list_entry(*parsed) if parsed else None), _field(fields, columns.get('reason')), meta
+
+
+class ImportResult:
+    def __init__(self):
+        self.lines = 0
+        self.imported = 0
+        self.invalid = 0
+        self.other_list = 0
+        self.invalid_samples: List[str] = []
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def summary(self) -> str:
+        rate = self.lines / self.elapsed if self.elapsed else 0
+        text = (f"{self.imported} entrées importées · {self.invalid} lignes invalides · "
+                f"{self.lines} lignes lues en {self.elapsed:.1f}s ({rate:.0f} lignes/s)")
+        if self.other_list:
+            text += f"\n{self.other_list} lignes d'une autre liste ignorées (colonne list_type)"
+        if self.invalid_samples:
+            text += "\nExemples de lignes invalides : " + ", ".join(f"`{s[:60]}`" for s in self.invalid_samples)
+        return text
+
+
+def _next_chunk(entries: Iterator, size: int, list_type: str, added_by: int, default_reason: str, result: 'ImportResult'):
+    """Analyse jusqu'à ``size`` lignes (exécuté dans un thread : la boucle reste disponible)."""
+    rows = []
+    for raw, entry, reason, meta in itertools.islice(entries, size):
+        result.lines += 1
+        if entry is None:
+            result.invalid += 1
+            if len(result.invalid_samples) < MAX_INVALID_SAMPLES:
+                result.invalid_samples.append(raw)
+            continue
+        if meta.get('list_type', list_type).lower() != list_type:
+            result.other_list += 1
+            continue
+        author = meta.get('added_by')
+        cols = ip_columns(entry)
+        rows.append((entry, cols[1] if cols else None, list_type,
+                     int(author) if author and author.isdigit() else added_by,
+                     meta.get('added_at'), reason or default_reason))
+    return rows
+
+
+async def import_entries(
+    storage,
+    lines: Iterable[str],
+    list_type: str,
+    added_by: int,
+    default_reason: str,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Progress] = None,
+    progress_interval: float = 3.0,
+) -> ImportResult:
+    """Écrit les entrées de ``lines`` dans ``ip_lists`` par paquets de ``chunk_size`` (une transaction par paquet).
+
+    L'index mémoire n'est pas touché : à l'appelant de le reconstruire une fois l'import terminé.
+    """
+    loop = asyncio.get_running_loop()
+    result = ImportResult()
+    entries = iter_entries(lines)
+    last_report = time.monotonic()
+    while True:
+        lines_before = result.lines
+        rows = await loop.run_in_executor(
+            None, _next_chunk, entries, chunk_size, list_type, added_by, default_reason, result
+        )
+        if rows:
+            await storage.write(lambda conn: conn.executemany(IMPORT_SQL, rows))
+            result.imported += len(rows)
+        if result.lines == lines_before:
+            break
+        if progress is not None and time.monotonic() - last_report >= progress_interval:
+            last_report = time.monotonic()
+            await progress(result)
+    logging.info(f"📥 Import {list_type} : {result.summary()}")
+    return result
+
+
+def export_entries(conn, out: io.TextIOBase, list_type: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """Écrit les entrées (CSV, réimportable) au fil de l'eau ; à exécuter dans un thread lecteur."""
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    sql = "SELECT ip_address, reason, list_type, added_by, added_at FROM ip_lists"
+    params: tuple = ()
+    if list_type:
+        sql += " WHERE list_type = ?"
+        params = (list_type,)
+    cur = conn.execute(sql + " ORDER BY list_type, ip_address", params)
+    count = 0
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        writer.writerows(tuple(row) for row in rows)
+        count += len(rows)
+    return count
+
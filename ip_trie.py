@@ -0,0 +1,122 @@
+"""Index mémoire des listes blanche/noire : IP, plages CIDR et ASN.
+
+Les plages sont rangées dans un trie binaire (un par famille d'adresses) et
+recherchées par plus long préfixe : une entrée plus précise l'emporte sur une
+plage plus large, et les ASN ne s'appliquent qu'en l'absence de plage. Les IP
+seules (/32, /128), de loin les plus nombreuses dans les listes publiques, sont
+rangées à part dans un dict : une liste de centaines de milliers d'adresses ne
+crée pas des millions de nœuds.
+"""
+import ipaddress
+from typing import Dict, Optional, Tuple, Union
+
+from iputils import normalize_ip
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+_ZERO, _ONE, _VALUE = 0, 1, 2
+
+
+def parse_list_entry(text: str) -> Optional[Tuple[str, Union[int, Network]]]:
+    """Analyse une entrée de liste : ``('asn', 16276)`` ou ``('net', IPv4Network(...))``.
+
+    Accepte une IP seule, une plage CIDR (``10.0.0.0/8``) ou un ASN (``AS16276``).
+    """
+    text = (text or '').strip()
+    if text.upper().startswith('AS') and text[2:].isdigit():
+        return 'asn', int(text[2:])
+    addr = normalize_ip(text)
+    if addr is not None:
+        return 'net', ipaddress.ip_network(addr)
+    try:
+        net = ipaddress.ip_network(text, strict=False)
+    except ValueError:
+        return None
+    if net.version == 6 and net.network_address.ipv4_mapped is not None and net.prefixlen >= 96:
+        net = ipaddress.ip_network((net.network_address.ipv4_mapped, net.prefixlen - 96))
+    return 'net', net
+
+
+def format_list_entry(kind: str, key: Union[int, Network]) -> str:
+    """Forme canonique d'une entrée (clé primaire de ``ip_lists``)."""
+    if kind == 'asn':
+        return f"AS{key}"
+    if key.prefixlen == key.max_prefixlen:
+        return key.network_address.compressed
+    return key.compressed
+
+
+class IPListIndex:
+    def __init__(self):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._asns: Dict[int, dict] = {}
+        self._hosts: Dict[Tuple[int, int], dict] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count + len(self._hosts) + len(self._asns)
+
+    @property
+    def has_asn_entries(self) -> bool:
+        return bool(self._asns)
+
+    def add(self, kind: str, key: Union[int, Network], value: dict):
+        if kind == 'asn':
+            self._asns[key] = value
+            return
+        if key.prefixlen == key.max_prefixlen:
+            self._hosts[(key.version, int(key.network_address))] = value
+            return
+        node = self._roots[key.version]
+        bits = int(key.network_address)
+        width = key.max_prefixlen
+        for i in range(key.prefixlen):
+            bit = (bits >> (width - 1 - i)) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None]
+            node = child
+        if node[_VALUE] is None:
+            self._count += 1
+        node[_VALUE] = value
+
+    def remove(self, kind: str, key: Union[int, Network]) -> bool:
+        if kind == 'asn':
+            return self._asns.pop(key, None) is not None
+        if key.prefixlen == key.max_prefixlen:
+            return self._hosts.pop((key.version, int(key.network_address)), None) is not None
+        node = self._roots[key.version]
+        bits = int(key.network_address)
+        width = key.max_prefixlen
+        for i in range(key.prefixlen):
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                return False
+        if node[_VALUE] is None:
+            return False
+        node[_VALUE] = None
+        self._count -= 1
+        return True
+
+    def lookup(self, ip: str, asn: Optional[int] = None) -> Optional[dict]:
+        """Entrée la plus précise couvrant ``ip`` (puis son ASN), ou None."""
+        addr = normalize_ip(ip)
+        if addr is None:
+            return None
+        bits = int(addr)
+        exact = self._hosts.get((addr.version, bits))
+        if exact is not None:
+            return exact
+        node = self._roots[addr.version]
+        best = node[_VALUE]
+        shift = addr.max_prefixlen - 1
+        while shift >= 0:
+            node = node[(bits >> shift) & 1]
+            if node is None:
+                break
+            if node[_VALUE] is not None:
+                best = node[_VALUE]
+            shift -= 1
+        if best is None and asn is not None:
+            best = self._asns.get(asn)
+        return best
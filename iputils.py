@@ -0,0 +1,50 @@
+"""Fonctions utilitaires pour la manipulation des adresses IP.
+
+Les IP sont normalisées à l'entrée (IPv4-mapped déballée, IPv6 compressée en
+minuscules) puis stockées sous forme binaire (``packed``) avec leur préfixe de
+sous-réseau : /24 en IPv4, /64 en IPv6.
+"""
+import ipaddress
+from typing import Optional, Tuple, Union
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+SUBNET_PREFIX_V4 = 24
+SUBNET_PREFIX_V6 = 64
+
+
+def normalize_ip(ip: Optional[str]) -> Optional[IPAddress]:
+    """Retourne l'adresse normalisée, ou None si la chaîne n'est pas une IP valide."""
+    if not ip:
+        return None
+    try:
+        addr = ipaddress.ip_address(ip.strip())
+    except (ValueError, AttributeError):
+        return None
+    if addr.version == 6 and addr.ipv4_mapped is not None:
+        addr = addr.ipv4_mapped
+    return addr
+
+
+def canonical_ip(ip: Optional[str]) -> Optional[str]:
+    """Forme texte canonique d'une IP, ou None si elle est invalide."""
+    addr = normalize_ip(ip)
+    return addr.compressed if addr is not None else None
+
+
+def subnet_prefix(addr: IPAddress) -> bytes:
+    """Adresse réseau binaire du /24 (IPv4) ou /64 (IPv6) contenant ``addr``."""
+    prefix = SUBNET_PREFIX_V4 if addr.version == 4 else SUBNET_PREFIX_V6
+    return ipaddress.ip_network((addr, prefix), strict=False).network_address.packed
+
+
+def ip_columns(ip: Optional[str]) -> Optional[Tuple[str, bytes, bytes]]:
+    """(texte canonique, binaire, préfixe de sous-réseau) pour l'insertion en base."""
+    addr = normalize_ip(ip)
+    if addr is None:
+        return None
+    return addr.compressed, addr.packed, subnet_prefix(addr)
+
+
+def unpack_ip(packed: bytes) -> str:
+    return ipaddress.ip_address(packed).compressed
@@ -0,0 +1,63 @@
+"""Détection des hébergeurs / VPN par mots-clés, compilée une seule fois.
+
+Les mots-clés sont regroupés dans une unique expression régulière. Les mots
+génériques (``aws``, ``host``, ``vps``...) doivent former un mot entier pour
+éviter les faux positifs (``laws``, ``ghost``) ; les noms de fournisseurs
+peuvent être suivis d'autres lettres (``googleusercontent``). Pour le reverse
+DNS, les suffixes de domaine connus sont testés en premier, label par label.
+"""
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class KeywordMatcher:
+    def __init__(self, keywords: Iterable[str], strict: Iterable[str] = (), suffixes: Iterable[str] = ()):
+        strict = {kw.lower() for kw in strict}
+        keywords = {kw.lower() for kw in keywords} | strict
+        loose = keywords - strict
+
+        def _alternation(words):
+            # Les plus longs d'abord : 'proxyserver' avant 'proxy'
+            return '|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+        parts = []
+        if strict:
+            parts.append(rf'(?<![a-z])(?P<strict>{_alternation(strict)})(?![a-z])')
+        if loose:
+            parts.append(rf'(?<![a-z])(?P<loose>{_alternation(loose)})')
+        self._regex = re.compile('|'.join(parts)) if parts else None
+        self._suffixes = frozenset(s.lower().strip('.') for s in suffixes)
+
+    def match_text(self, text: Optional[str]) -> Optional[str]:
+        """Premier mot-clé trouvé dans ``text`` (nom d'organisation, hostname...)."""
+        if not text or self._regex is None:
+            return None
+        m = self._regex.search(text.lower())
+        if m is None:
+            return None
+        return m.group(m.lastgroup)
+
+    def match_hostname(self, hostname: Optional[str]) -> Optional[str]:
+        """Suffixe de domaine connu ou mot-clé présent dans un nom reverse DNS."""
+        if not hostname:
+            return None
+        host = hostname.lower().rstrip('.')
+        labels = host.split('.')
+        for i in range(len(labels) - 1):
+            suffix = '.'.join(labels[i:])
+            if suffix in self._suffixes:
+                return suffix
+        return self.match_text(host)
+
+
+def build_suspect_asns(records: Iterable[Tuple[int, str]], matcher: KeywordMatcher) -> Dict[int, str]:
+    """Table ASN → organisation pour les ASN dont l'organisation correspond à un mot-clé."""
+    seen = set()
+    suspects = {}
+    for asn, org in records:
+        if asn in seen:
+            continue
+        seen.add(asn)
+        if matcher.match_text(org):
+            suspects[asn] = org
+    return suspects
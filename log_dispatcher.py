@@ -0,0 +1,172 @@
+"""File d'envoi des logs Discord, découplée du chemin de /verify.
+
+Les embeds sont mis en file sans attendre, puis une tâche de fond les regroupe
+par salon (jusqu'à 10 par message). En cas de rafale, au-delà d'un seuil par
+catégorie, les événements ne sont plus détaillés mais comptés et résumés en un
+seul embed à la fin de la fenêtre. Un webhook peut être utilisé pour le salon
+principal afin de disposer d'un quota de rate-limit séparé.
+"""
+import asyncio
+import collections
+import datetime
+import logging
+import time
+from typing import Dict, List, Optional, Union
+
+import discord
+
+MAX_EMBEDS_PER_MESSAGE = 10
+
+CATEGORY_LABELS = {
+    'vpn_block': "blocages VPN/proxy",
+    'refus': "vérifications refusées",
+    'alt': "doubles comptes détectés",
+}
+
+
+class LogDispatcher:
+    def __init__(
+        self,
+        bot,
+        channel_id: int,
+        webhook_url: Optional[str] = None,
+        http_session_factory=None,
+        queue_size: int = 1000,
+        linger: float = 0.5,
+        flood_threshold: int = 15,
+        summary_window: float = 60,
+        min_send_interval: float = 1.0,
+    ):
+        self.bot = bot
+        self.channel_id = channel_id
+        self.webhook_url = webhook_url
+        self.http_session_factory = http_session_factory
+        self.linger = linger
+        self.flood_threshold = flood_threshold
+        self.summary_window = summary_window
+        self.min_send_interval = min_send_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._channels: Dict[int, object] = {}
+        self._webhook = None
+        self._last_send: Dict[int, float] = {}
+        self._window_start = time.monotonic()
+        self._counts = collections.Counter()
+        self._suppressed = collections.Counter()
+        self.sent = 0
+        self.dropped = 0
+        self.rate_limited = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    # ------------------------------------------------------------------ production
+
+    def post(self, embed: discord.Embed, category: str = 'general', channel: Union[int, object, None] = None):
+        """Met un embed en file sans bloquer. ``channel`` : id ou salon (par défaut le salon de logs)."""
+        target = self.channel_id if channel is None else channel
+        self._maybe_roll_window()
+        self._counts[category] += 1
+        if category in CATEGORY_LABELS and self._counts[category] > self.flood_threshold:
+            self._suppressed[(category, self._key(target))] += 1
+            self._channels.setdefault(self._key(target), target if not isinstance(target, int) else None)
+            return
+        self._enqueue(target, embed)
+
+    def post_text(self, text: str, category: str = 'general', channel: Union[int, object, None] = None):
+        self.post(discord.Embed(description=text, color=0x95A5A6), category=category, channel=channel)
+
+    def _enqueue(self, target, embed: discord.Embed):
+        try:
+            self._queue.put_nowait((target, embed))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logging.warning("File des logs pleine : embed ignoré")
+
+    @staticmethod
+    def _key(target) -> int:
+        return target if isinstance(target, int) else target.id
+
+    def _maybe_roll_window(self):
+        now = time.monotonic()
+        if now - self._window_start < self.summary_window:
+            return
+        for (category, key), count in self._suppressed.items():
+            embed = discord.Embed(
+                title="📊 Résumé des logs",
+                description=f"**{count}** {CATEGORY_LABELS[category]} supplémentaires au cours des "
+                            f"{int(self.summary_window)} dernières secondes (non détaillés).",
+                color=0xE67E22,
+                timestamp=datetime.datetime.utcnow(),
+            )
+            self._enqueue(self._channels.get(key) or key, embed)
+        self._suppressed.clear()
+        self._counts.clear()
+        self._window_start = now
+
+    # ------------------------------------------------------------------ consommation
+
+    async def _resolve(self, target):
+        if not isinstance(target, int):
+            return target
+        channel = self._channels.get(target)
+        if channel is None:
+            channel = self.bot.get_channel(target)
+            if channel is None:
+                channel = await self.bot.fetch_channel(target)
+            self._channels[target] = channel
+        return channel
+
+    async def _send(self, target, embeds: List[discord.Embed]):
+        key = self._key(target)
+        wait = self._last_send.get(key, 0) + self.min_send_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        for attempt in range(3):
+            try:
+                if self.webhook_url and key == self.channel_id:
+                    if self._webhook is None:
+                        self._webhook = discord.Webhook.from_url(self.webhook_url, session=self.http_session_factory())
+                    await self._webhook.send(embeds=embeds)
+                else:
+                    channel = await self._resolve(target)
+                    await channel.send(embeds=embeds)
+                self.sent += len(embeds)
+                break
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    logging.exception(f"Impossible d'envoyer {len(embeds)} log(s) dans le salon {key}")
+                    break
+                self.rate_limited += 1
+                retry_after = getattr(e, 'retry_after', None) or 2 ** attempt
+                logging.warning(f"Rate-limit sur le salon de logs {key}, nouvel essai dans {retry_after}s")
+                await asyncio.sleep(retry_after)
+            except Exception:
+                logging.exception(f"Impossible d'envoyer {len(embeds)} log(s) dans le salon {key}")
+                break
+        self._last_send[key] = time.monotonic()
+
+    async def run(self):
+        """Tâche de fond : regroupe et envoie les embeds en file."""
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=self.summary_window / 4)
+            except asyncio.TimeoutError:
+                self._maybe_roll_window()
+                continue
+            # Petite attente pour laisser les événements simultanés rejoindre le même message
+            await asyncio.sleep(self.linger)
+            batches: "collections.OrderedDict[int, list]" = collections.OrderedDict()
+            item = first
+            while item is not None:
+                target, embed = item
+                batches.setdefault(self._key(target), [target, []])[1].append(embed)
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    item = None
+            self._maybe_roll_window()
+            for target, embeds in batches.values():
+                for i in range(0, len(embeds), MAX_EMBEDS_PER_MESSAGE):
+                    await self._send(target, embeds[i:i + MAX_EMBEDS_PER_MESSAGE])
@@ -0,0 +1,259 @@
+"""Métriques au format texte Prometheus, sans dépendance externe.
+
+Compteurs et histogrammes sont mis à jour en mémoire sur le chemin de
+/verify (quelques opérations sur des dicts) ; les jauges sont calculées à la
+demande au moment du scrape, à partir des objets existants (caches, files).
+
+En mode multi-processus, chaque processus étiquette ses échantillons
+(``worker="…"``) et les processus web poussent périodiquement leurs familles
+de métriques à la gateway (``MetricsAggregator``), qui les sert toutes sur un
+seul /metrics.
+"""
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from aiohttp import web
+
+LabelValues = Tuple[str, ...]
+# (nom, lignes HELP/TYPE, échantillons) : forme sérialisable en JSON, échangée par l'IPC
+Family = Tuple[str, List[str], List[str]]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], *extra: str) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    parts.extend(e for e in extra if e)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.const = ''  # labels communs à tout le registre, déjà formatés
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key, self.const)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Par série : compte par seau (non cumulé), somme, nombre
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, self.const, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key, self.const)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key, self.const)} {count}"
+
+
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+class Gauge(_Metric):
+    """Jauge calculée au scrape : ``fn()`` retourne une valeur, ou un dict {valeurs de labels: valeur}."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, fn: Callable[[], GaugeValue], labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def samples(self) -> Iterable[str]:
+        value = self.fn()
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                yield f"{self.name}{_labels(self.labelnames, key, self.const)} {_number(v)}"
+        elif value is not None:
+            yield f"{self.name}{_labels((), (), self.const)} {_number(value)}"
+
+
+class CounterFunc(Gauge):
+    """Compteur monotone tenu ailleurs (attribut d'un objet existant), lu au scrape."""
+
+    kind = 'counter'
+
+
+class Registry:
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+        self._const = ''
+
+    def _register(self, metric: _Metric) -> _Metric:
+        metric.const = self._const
+        self._metrics.append(metric)
+        return metric
+
+    def set_const_labels(self, **labels: str):
+        """Labels ajoutés à tous les échantillons (ex. ``worker="2"`` en mode multi-processus)."""
+        self._const = ','.join(f'{n}="{_escape(v)}"' for n, v in labels.items())
+        for metric in self._metrics:
+            metric.const = self._const
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], GaugeValue], labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self.prefix + name, help, fn, labelnames))
+
+    def counter_func(self, name: str, help: str, fn: Callable[[], GaugeValue], labelnames: Sequence[str] = ()) -> CounterFunc:
+        return self._register(CounterFunc(self.prefix + name, help, fn, labelnames))
+
+    def collect(self) -> List[Family]:
+        families: List[Family] = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                logging.exception(f"Erreur lors du calcul de la métrique {metric.name}")
+                continue
+            families.append((metric.name, metric.header(), samples))
+        return families
+
+    def render(self) -> str:
+        return render_families([self.collect()])
+
+
+def render_families(sources: Iterable[Iterable[Family]]) -> str:
+    """Texte Prometheus de plusieurs processus : une seule fois HELP/TYPE par famille, échantillons regroupés."""
+    headers: Dict[str, List[str]] = {}
+    samples: Dict[str, List[str]] = {}
+    for families in sources:
+        for name, header, family_samples in families:
+            headers.setdefault(name, header)
+            samples.setdefault(name, []).extend(family_samples)
+    lines: List[str] = []
+    for name, header in headers.items():
+        lines.extend(header)
+        lines.extend(samples[name])
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsAggregator:
+    """Gateway : dernières familles poussées par chaque processus web ; un processus muet trop longtemps est oublié."""
+
+    def __init__(self, max_age: float = 60.0):
+        self.max_age = max_age
+        self._snapshots: Dict[str, Tuple[float, List[Family]]] = {}
+        self.pushes = 0
+
+    def push(self, source: str, families: List[Family]):
+        self._snapshots[source] = (time.monotonic(), families)
+        self.pushes += 1
+
+    def families(self) -> List[List[Family]]:
+        now = time.monotonic()
+        for source, (received, _) in list(self._snapshots.items()):
+            if now - received > self.max_age:
+                del self._snapshots[source]
+        return [families for _, families in self._snapshots.values()]
+
+    def stats(self) -> dict:
+        return {"sources": len(self._snapshots), "pushes": self.pushes}
+
+
+class LogRecordCounter(logging.Handler):
+    """Compte les enregistrements de log contenant ``marker`` (ex. les 429 gérés en interne par discord.py)."""
+
+    def __init__(self, marker: str, level: int = logging.WARNING):
+        super().__init__(level)
+        self.marker = marker
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            if self.marker in record.getMessage():
+                self.count += 1
+        except Exception:
+            pass
+
+
+REGISTRY = Registry(prefix='verifbot_')
+
+
+def metrics_handler(registry: Registry = REGISTRY, token: Optional[str] = None,
+                    aggregator: Optional[MetricsAggregator] = None):
+    """Route aiohttp pour /metrics ; si ``token`` est défini, exige ``Authorization: Bearer <token>``.
+
+    Avec ``aggregator``, les métriques poussées par les processus web sont servies avec celles du registre.
+    """
+    async def handle_metrics(request: web.Request) -> web.Response:
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            raise web.HTTPUnauthorized()
+        sources = [registry.collect()]
+        if aggregator is not None:
+            sources.extend(aggregator.families())
+        return web.Response(body=render_families(sources).encode('utf-8'), headers={
+            'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+            'Cache-Control': 'no-store',
+        })
+    return handle_metrics
@@ -0,0 +1,134 @@
+"""Migrations du schéma SQLite, suivies via ``PRAGMA user_version``.
+
+Chaque migration reçoit la connexion de l'écrivain et s'exécute dans une
+transaction ; ``schema.sql`` décrit l'état final pour une base neuve.
+"""
+import datetime
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+from iputils import ip_columns
+from storage import Storage
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str):
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _migrate_binary_ips(conn: sqlite3.Connection):
+    """IP canoniques + colonnes binaires (ip_bin) et préfixe /24 ou /64 (ip_subnet)."""
+    _add_column(conn, "verifications", "ip_bin", "BLOB")
+    _add_column(conn, "verifications", "ip_subnet", "BLOB")
+    _add_column(conn, "ip_lists", "ip_bin", "BLOB")
+
+    rows = conn.execute("SELECT id, ip_address FROM verifications WHERE ip_bin IS NULL").fetchall()
+    updates = []
+    for row_id, ip in rows:
+        cols = ip_columns(ip)
+        if cols is None:
+            logging.warning(f"Migration : IP invalide ignorée dans verifications (id={row_id}) : {ip!r}")
+            continue
+        updates.append((*cols, row_id))
+    conn.executemany("UPDATE verifications SET ip_address = ?, ip_bin = ?, ip_subnet = ? WHERE id = ?", updates)
+
+    rows = conn.execute("SELECT ip_address FROM ip_lists WHERE ip_bin IS NULL").fetchall()
+    for (ip,) in rows:
+        cols = ip_columns(ip)
+        if cols is None:
+            logging.warning(f"Migration : IP invalide ignorée dans ip_lists : {ip!r}")
+            continue
+        # OR REPLACE : deux écritures différentes de la même IP fusionnent en une entrée
+        conn.execute("UPDATE OR REPLACE ip_lists SET ip_address = ?, ip_bin = ? WHERE ip_address = ?", (cols[0], cols[1], ip))
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_verifications_ip_bin ON verifications(ip_bin)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_verifications_subnet ON verifications(ip_subnet)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ip_lists_ip_bin ON ip_lists(ip_bin)")
+    logging.info(f"Migration IP binaires : {len(updates)} vérifications converties")
+
+
+def _parse_iso(value) -> float:
+    try:
+        return datetime.datetime.fromisoformat(str(value).rstrip("Z")).replace(tzinfo=datetime.timezone.utc).timestamp()
+    except ValueError:
+        # Date illisible : le token sera considéré comme expiré
+        return 0.0
+
+
+def _migrate_token_issued_at(conn: sqlite3.Connection):
+    """Horodatage numérique (issued_at) des tokens en attente, pour l'expiration et la purge."""
+    _add_column(conn, "pending_tokens", "issued_at", "REAL")
+    rows = conn.execute("SELECT token, created_at FROM pending_tokens WHERE issued_at IS NULL").fetchall()
+    conn.executemany("UPDATE pending_tokens SET issued_at = ? WHERE token = ?",
+                     [(_parse_iso(created_at), token) for token, created_at in rows])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_tokens_issued ON pending_tokens(issued_at)")
+    logging.info(f"Migration tokens : {len(rows)} tokens horodatés")
+
+
+ALT_COUNTER_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS trg_verifications_ip_accounts
+AFTER INSERT ON verifications
+WHEN NEW.ip_bin IS NOT NULL
+BEGIN
+    INSERT OR IGNORE INTO ip_accounts (ip_bin, guild_id, user_id) VALUES (NEW.ip_bin, NEW.guild_id, NEW.user_id);
+    INSERT OR IGNORE INTO ip_accounts (ip_bin, guild_id, user_id) VALUES (NEW.ip_bin, 0, NEW.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ip_accounts_count
+AFTER INSERT ON ip_accounts
+BEGIN
+    INSERT INTO ip_account_counts (ip_bin, guild_id, accounts) VALUES (NEW.ip_bin, NEW.guild_id, 1)
+    ON CONFLICT (ip_bin, guild_id) DO UPDATE SET accounts = accounts + 1;
+END;
+"""
+
+
+def _migrate_alt_counters(conn: sqlite3.Connection):
+    """Compteurs de comptes distincts par IP (triggers) et index couvrant pour le détail des doubles comptes."""
+    for statement in ALT_COUNTER_TRIGGERS.split("END;"):
+        if statement.strip():
+            conn.execute(statement + "END;")
+    conn.execute("DELETE FROM ip_accounts")
+    conn.execute("DELETE FROM ip_account_counts")
+    # Les triggers de ip_accounts remplissent ip_account_counts au fil du rattrapage
+    conn.execute("""
+        INSERT OR IGNORE INTO ip_accounts (ip_bin, guild_id, user_id)
+        SELECT ip_bin, guild_id, user_id FROM verifications WHERE ip_bin IS NOT NULL
+        UNION
+        SELECT ip_bin, 0, user_id FROM verifications WHERE ip_bin IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_verifications_ip_bin_recent
+        ON verifications(ip_bin, created_at DESC, user_id, guild_id, verification_status)
+    """)
+    count = conn.execute("SELECT COUNT(*) FROM ip_account_counts WHERE guild_id = 0").fetchone()[0]
+    logging.info(f"Migration compteurs de doubles comptes : {count} IP indexées")
+
+
+MIGRATIONS: List[Tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _migrate_binary_ips),
+    (2, _migrate_token_issued_at),
+    (3, _migrate_alt_counters),
+]
+
+
+def migrate(storage: Storage) -> int:
+    """Applique les migrations manquantes (synchrone, au démarrage). Retourne la version finale."""
+    version = storage.read_sync(lambda conn: conn.execute("PRAGMA user_version").fetchone()[0])
+    for target, step in MIGRATIONS:
+        if target <= version:
+            continue
+
+        def _apply(conn, step=step, target=target):
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+
+        storage.write_sync(_apply)
+        logging.info(f"Base migrée vers la version {target}")
+        version = target
+    return version
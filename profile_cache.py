@@ -0,0 +1,76 @@
+"""Cache en mémoire des profils Discord (nom, avatar, date de création).
+
+Le profil est capturé dès l'émission du token (l'interaction fournit déjà
+l'utilisateur) afin que /verify n'ait normalement aucun appel REST à faire.
+La date de création d'un compte se déduit directement de son identifiant
+(snowflake), sans interroger l'API.
+"""
+import datetime
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+DISCORD_EPOCH_MS = 1420070400000
+DEFAULT_AVATAR_URL = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+
+def snowflake_created_at(snowflake: int) -> datetime.datetime:
+    """Date de création encodée dans un identifiant Discord (UTC)."""
+    ms = (int(snowflake) >> 22) + DISCORD_EPOCH_MS
+    return datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc)
+
+
+class Profile(NamedTuple):
+    username: str
+    avatar_url: str
+    created_at: datetime.datetime
+
+
+def profile_from_user(user) -> Profile:
+    """Construit un profil à partir d'un ``discord.User`` / ``discord.Member``."""
+    avatar = getattr(user, 'avatar', None)
+    avatar_url = avatar.url if avatar else user.default_avatar.url
+    username = getattr(user, 'global_name', None) or user.name
+    return Profile(username, avatar_url, snowflake_created_at(user.id))
+
+
+class ProfileCache:
+    def __init__(self, ttl: float = 6 * 3600, max_size: int = 50000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rest_calls = 0
+
+    def put(self, user_id: int, profile: Profile):
+        self._entries[user_id] = (profile, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def remember(self, user) -> Profile:
+        profile = profile_from_user(user)
+        self.put(user.id, profile)
+        return profile
+
+    def get(self, user_id: int) -> Optional[Profile]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            self._entries.pop(user_id, None)
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[0]
+
+    async def fetch(self, bot, user_id: int) -> Profile:
+        """Profil depuis le cache, puis le cache gateway du bot, puis (en dernier recours) l'API REST."""
+        profile = self.get(user_id)
+        if profile is not None:
+            self.hits += 1
+            return profile
+        self.misses += 1
+        user = bot.get_user(user_id)
+        if user is None:
+            self.rest_calls += 1
+            user = await bot.fetch_user(user_id)
+        return self.remember(user)
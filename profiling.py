@@ -0,0 +1,67 @@
+"""Captures de profilage à la demande sur le processus en cours d'exécution.
+
+``cpu_profile`` active cProfile sur le thread de la boucle d'événements pendant
+une durée bornée ; ``memory_profile`` compare deux instantanés tracemalloc.
+Une seule capture à la fois : le profilage ralentit le bot pendant la mesure.
+"""
+import asyncio
+import cProfile
+import io
+import pstats
+import tracemalloc
+
+MAX_SECONDS = 60
+MAX_TOP = 100
+
+_lock = asyncio.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _bounds(seconds: float, top: int):
+    return max(1.0, min(float(seconds), MAX_SECONDS)), max(1, min(int(top), MAX_TOP))
+
+
+async def cpu_profile(seconds: float = 10, top: int = 30, sort: str = 'cumulative') -> str:
+    """Profil CPU de la boucle d'événements pendant ``seconds`` ; retourne les ``top`` fonctions."""
+    seconds, top = _bounds(seconds, top)
+    if sort not in {key.value for key in pstats.SortKey}:
+        sort = 'cumulative'
+    if _lock.locked():
+        raise ProfilerBusy("Une capture est déjà en cours")
+    async with _lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    out = io.StringIO()
+    out.write(f"Profil CPU sur {seconds:.0f}s (tri : {sort})\n")
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats(sort).print_stats(top)
+    return out.getvalue()
+
+
+async def memory_profile(seconds: float = 10, top: int = 30) -> str:
+    """Allocations apparues pendant ``seconds`` (différence de deux instantanés tracemalloc)."""
+    seconds, top = _bounds(seconds, top)
+    if _lock.locked():
+        raise ProfilerBusy("Une capture est déjà en cours")
+    async with _lock:
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(10)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+    stats = after.compare_to(before, 'lineno')
+    lines = [f"Allocations sur {seconds:.0f}s — mémoire tracée : {current / 1024:.0f} Kio (pic {peak / 1024:.0f} Kio)"]
+    lines.extend(str(stat) for stat in stats[:top])
+    return '\n'.join(lines)
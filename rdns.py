@@ -0,0 +1,133 @@
+"""Résolveur reverse DNS asynchrone avec cache TTL.
+
+Utilise ``aiodns`` (c-ares) s'il est installé, ce qui permet de respecter le
+TTL des enregistrements PTR ; sinon repli sur ``socket.gethostbyaddr`` dans un
+pool de threads dédié (TTL par défaut). La concurrence est bornée, chaque
+requête a son propre délai et les requêtes simultanées pour la même IP sont
+fusionnées.
+"""
+import asyncio
+import concurrent.futures
+import ipaddress
+import logging
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+try:
+    import aiodns
+    AIODNS_AVAILABLE = True
+except Exception:
+    AIODNS_AVAILABLE = False
+
+
+class ReverseResolver:
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        timeout: float = 1.5,
+        forward_confirm: bool = False,
+        cache_size: int = 10000,
+        min_ttl: float = 60,
+        max_ttl: float = 24 * 3600,
+        negative_ttl: float = 300,
+        default_ttl: float = 3600,
+    ):
+        self.timeout = timeout
+        self.forward_confirm = forward_confirm
+        self.cache_size = cache_size
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.default_ttl = default_ttl
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._cache: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._resolver = None
+        self._executor = None
+        if not AIODNS_AVAILABLE:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="rdns")
+        self.hits = 0
+        self.misses = 0
+
+    def _get_resolver(self):
+        # Créé à la première utilisation, dans la boucle d'événements
+        if self._resolver is None:
+            self._resolver = aiodns.DNSResolver(timeout=self.timeout, tries=1)
+        return self._resolver
+
+    def _remember(self, ip: str, name: Optional[str], ttl: float):
+        ttl = self.negative_ttl if name is None else min(max(ttl, self.min_ttl), self.max_ttl)
+        self._cache[ip] = (name, time.monotonic() + ttl)
+        self._cache.move_to_end(ip)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def resolve(self, ip: str) -> Optional[str]:
+        """Nom PTR de ``ip`` (None si absent ou non confirmé). Lève asyncio.TimeoutError en cas de dépassement."""
+        entry = self._cache.get(ip)
+        if entry is not None and entry[1] > time.monotonic():
+            self._cache.move_to_end(ip)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+
+        fut = self._inflight.get(ip)
+        if fut is None:
+            fut = asyncio.ensure_future(self._resolve_uncached(ip))
+            self._inflight[ip] = fut
+            fut.add_done_callback(lambda f: self._done(ip, f))
+        # shield : l'annulation d'un appelant n'interrompt pas la requête partagée
+        return await asyncio.shield(fut)
+
+    def _done(self, ip: str, fut: asyncio.Future):
+        self._inflight.pop(ip, None)
+        if not fut.cancelled():
+            # Marque l'exception comme lue même si tous les appelants ont abandonné
+            fut.exception()
+
+    async def _resolve_uncached(self, ip: str) -> Optional[str]:
+        async with self._semaphore:
+            name, ttl = await asyncio.wait_for(self._lookup_ptr(ip), self.timeout)
+            if name and self.forward_confirm:
+                confirmed = await asyncio.wait_for(self._forward_confirms(name, ip), self.timeout)
+                if not confirmed:
+                    logging.info(f"PTR {name} de {ip} non confirmé par la résolution directe, ignoré")
+                    name = None
+        self._remember(ip, name, ttl)
+        return name
+
+    async def _lookup_ptr(self, ip: str) -> Tuple[Optional[str], float]:
+        if AIODNS_AVAILABLE:
+            try:
+                result = await self._get_resolver().query(ipaddress.ip_address(ip).reverse_pointer, 'PTR')
+            except aiodns.error.DNSError:
+                return None, self.negative_ttl
+            return result.name.rstrip('.'), getattr(result, 'ttl', self.default_ttl)
+        loop = asyncio.get_running_loop()
+        try:
+            name = (await loop.run_in_executor(self._executor, socket.gethostbyaddr, ip))[0]
+        except OSError:
+            return None, self.negative_ttl
+        return name, self.default_ttl
+
+    async def _forward_confirms(self, name: str, ip: str) -> bool:
+        addr = ipaddress.ip_address(ip)
+        if AIODNS_AVAILABLE:
+            try:
+                answers = await self._get_resolver().query(name, 'A' if addr.version == 4 else 'AAAA')
+            except aiodns.error.DNSError:
+                return False
+            return any(ipaddress.ip_address(a.host) == addr for a in answers)
+        loop = asyncio.get_running_loop()
+        family = socket.AF_INET if addr.version == 4 else socket.AF_INET6
+        try:
+            infos = await loop.run_in_executor(self._executor, socket.getaddrinfo, name, None, family)
+        except OSError:
+            return False
+        return any(ipaddress.ip_address(info[4][0]) == addr for info in infos)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -3,7 +3,9 @@ CREATE TABLE IF NOT EXISTS verifications (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id BIGINT NOT NULL,           -- Discord user ID
     guild_id BIGINT NOT NULL,          -- Discord server ID
-    ip_address TEXT NOT NULL,          -- IP de vérification
+    ip_address TEXT NOT NULL,          -- IP de vérification (forme canonique)
+    ip_bin BLOB,                       -- IP binaire (4 ou 16 octets)
+    ip_subnet BLOB,                    -- Préfixe /24 (IPv4) ou /64 (IPv6), binaire
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     account_created_at TIMESTAMP,      -- Date création compte Discord
     is_vpn BOOLEAN,                    -- Si détecté comme VPN
@@ -13,12 +15,76 @@ CREATE TABLE IF NOT EXISTS verifications (
 
 CREATE INDEX IF NOT EXISTS idx_ip_address ON verifications(ip_address);
 CREATE INDEX IF NOT EXISTS idx_user_guild ON verifications(user_id, guild_id);
+-- Index sur ip_bin / ip_subnet : créés par migrations.py (bases existantes comprises)
 
 -- Table pour les IPs en whitelist/blacklist
 CREATE TABLE IF NOT EXISTS ip_lists (
     ip_address TEXT PRIMARY KEY,
+    ip_bin BLOB,                      -- IP binaire (4 ou 16 octets)
     list_type TEXT NOT NULL,          -- 'whitelist' ou 'blacklist'
     added_by BIGINT,                  -- Discord ID de l'admin
     added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     reason TEXT
-);
\ No newline at end of file
+);
+
+-- Tokens de vérification en attente (usage unique)
+CREATE TABLE IF NOT EXISTS pending_tokens (
+    token TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    created_at TEXT NOT NULL,
+    issued_at REAL                    -- timestamp Unix d'émission (expiration / purge)
+);
+-- Index sur issued_at : créé par migrations.py
+
+-- Marqueurs d'usage unique des tokens signés (mode TOKEN_SECRET), supprimés à expiration
+CREATE TABLE IF NOT EXISTS used_tokens (
+    mac BLOB PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_used_tokens_expires ON used_tokens(expires_at);
+
+-- Comptes distincts vus par IP (guild_id = 0 : toutes guilds confondues), alimenté par trigger
+CREATE TABLE IF NOT EXISTS ip_accounts (
+    ip_bin BLOB NOT NULL,
+    guild_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    PRIMARY KEY (ip_bin, guild_id, user_id)
+) WITHOUT ROWID;
+
+-- Nombre de comptes distincts par (IP, guild) : la décision "double compte" est une lecture ponctuelle
+CREATE TABLE IF NOT EXISTS ip_account_counts (
+    ip_bin BLOB NOT NULL,
+    guild_id BIGINT NOT NULL,
+    accounts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (ip_bin, guild_id)
+) WITHOUT ROWID;
+-- Triggers et index couvrant de verifications : créés par migrations.py
+
+-- Verdicts VPN/proxy par IP (cache persistant), purgés à expiration
+CREATE TABLE IF NOT EXISTS ip_verdicts (
+    ip_address TEXT PRIMARY KEY,
+    is_vpn BOOLEAN NOT NULL,
+    verdict TEXT NOT NULL,            -- 'positive', 'negative' ou 'error'
+    details TEXT,                     -- JSON des détails (pour l'embed de logs)
+    checked_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_ip_verdicts_expires ON ip_verdicts(expires_at);
+
+-- Actions Discord en attente (rôles, expulsions, logs), rejouées au redémarrage
+CREATE TABLE IF NOT EXISTS discord_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,               -- 'grant_role', 'kick', 'log'...
+    guild_id INTEGER,
+    user_id INTEGER,
+    payload TEXT,                     -- JSON propre au type de travail
+    priority INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_run_at REAL NOT NULL,
+    dedup_key TEXT UNIQUE,            -- idempotence : un seul travail en attente par clé
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
@@ -0,0 +1,9 @@
+(function () {
+  var result = document.getElementById('result');
+  if (!result) return;
+  var delay = parseInt(result.getAttribute('data-delay') || '0', 10);
+  setTimeout(function () {
+    document.getElementById('analysis').classList.add('hidden');
+    result.classList.remove('hidden');
+  }, delay);
+})();
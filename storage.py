@@ -0,0 +1,187 @@
+"""Couche de stockage SQLite non bloquante pour le bot de vérification.
+
+Toutes les écritures passent par un unique thread écrivain qui regroupe les
+petites requêtes (tokens, vérifications) dans une même transaction (group
+commit). Les lectures sont servies par un petit pool de threads disposant
+chacun de sa propre connexion longue durée. Les méthodes ``async`` ne bloquent
+jamais la boucle d'événements.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # isolation_level=None : les transactions sont gérées explicitement (BEGIN/COMMIT)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class Storage:
+    """Connexions SQLite longue durée : un écrivain + un pool de lecteurs."""
+
+    def __init__(self, path: str, readers: int = 4, batch_window: float = 0.005, max_batch: int = 256):
+        self.path = path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Tuple[Callable, concurrent.futures.Future]]]" = queue.Queue()
+        self._local = threading.local()
+        self._reader_conns: List[sqlite3.Connection] = []
+        self._reader_lock = threading.Lock()
+        self._writer_conn = _connect(path)
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        self._readers = concurrent.futures.ThreadPoolExecutor(max_workers=readers, thread_name_prefix="sqlite-reader")
+        self._closed = False
+
+    # ------------------------------------------------------------------ écritures
+
+    def _writer_loop(self):
+        conn = self._writer_conn
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Group commit : on laisse une courte fenêtre aux autres écritures
+            # pour rejoindre la même transaction.
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    nxt = self._queue.get(timeout=self.batch_window)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._run_batch(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for fn, fut in batch:
+            # Un SAVEPOINT par opération : un échec n'annule pas le reste du lot.
+            conn.execute("SAVEPOINT op")
+            try:
+                res = fn(conn)
+                conn.execute("RELEASE op")
+                results.append((fut, res, None))
+            except Exception as e:
+                conn.execute("ROLLBACK TO op")
+                conn.execute("RELEASE op")
+                results.append((fut, None, e))
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            logging.exception("Échec du COMMIT groupé SQLite")
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            for fut, _, _ in results:
+                fut.set_exception(e)
+            return
+        for fut, res, err in results:
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(res)
+
+    def submit_write(self, fn: Callable[[sqlite3.Connection], Any]) -> concurrent.futures.Future:
+        """Planifie ``fn(conn)`` sur le thread écrivain (dans une transaction)."""
+        if self._closed:
+            raise RuntimeError("Storage fermé")
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        self._queue.put((fn, fut))
+        return fut
+
+    async def write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.wrap_future(self.submit_write(fn))
+
+    def write_sync(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Version bloquante, réservée à l'initialisation (hors boucle d'événements)."""
+        return self.submit_write(fn).result()
+
+    async def execute(self, sql: str, params: Sequence = ()) -> int:
+        """Exécute une requête d'écriture et retourne ``lastrowid``."""
+        return await self.write(lambda conn: conn.execute(sql, params).lastrowid)
+
+    async def executemany(self, sql: str, seq: Iterable[Sequence]) -> int:
+        rows = list(seq)
+        return await self.write(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def executescript_sync(self, script: str):
+        # executescript émet son propre COMMIT : on passe hors du lot transactionnel.
+        # « with conn » ne ferait que valider la transaction : closing() ferme vraiment la connexion.
+        with closing(_connect(self.path)) as conn:
+            conn.executescript(script)
+
+    # ------------------------------------------------------------------ lectures
+
+    def _reader_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _connect(self.path)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            with self._reader_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    async def read(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, lambda: fn(self._reader_conn()))
+
+    def read_sync(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return self._readers.submit(lambda: fn(self._reader_conn())).result()
+
+    async def fetchone(self, sql: str, params: Sequence = ()) -> Optional[sqlite3.Row]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: Sequence = ()) -> List[sqlite3.Row]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    # ------------------------------------------------------------------ cycle de vie
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=10)
+        self._readers.shutdown(wait=True)
+        with self._reader_lock:
+            for conn in self._reader_conns:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._reader_conns.clear()
+        logging.info(f"Stockage SQLite fermé : {self.path}")
@@ -0,0 +1,227 @@
+"""Tokens de vérification à usage unique, avec durée de vie.
+
+Chaque token est persisté dans ``pending_tokens`` (pour survivre à un
+redémarrage) et indexé en mémoire dans la limite de ``max_memory`` entrées ;
+au-delà, les plus anciens ne restent qu'en base. Un token expiré est refusé
+par /verify et une tâche de fond supprime les lignes expirées par lots.
+
+Mode signé (``secret`` fourni) : le token contient lui-même l'utilisateur, la
+guild et ses dates d'émission / d'expiration, authentifiés par un HMAC.
+L'émission ne fait aucune E/S et n'importe quel processus partageant le secret
+peut le valider ; seul un marqueur d'usage unique (``used_tokens``, purgé à
+l'expiration du token) est écrit lors de la vérification.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+import struct
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from storage import Storage
+
+
+class SignedTokenCodec:
+    """user_id, guild_id, émission et expiration (secondes Unix) + HMAC-SHA256 tronqué."""
+
+    _PAYLOAD = struct.Struct(">QQII")
+    MAC_SIZE = 16
+
+    def __init__(self, secret: str):
+        self._key = secret.encode() if isinstance(secret, str) else secret
+
+    def _mac(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()[:self.MAC_SIZE]
+
+    def encode(self, user_id: int, guild_id: Optional[int], issued_at: float, expires_at: float) -> str:
+        payload = self._PAYLOAD.pack(user_id, guild_id or 0, int(issued_at), int(expires_at))
+        return base64.urlsafe_b64encode(payload + self._mac(payload)).rstrip(b"=").decode()
+
+    def decode(self, token: str) -> Optional[Tuple[int, Optional[int], int, int, bytes]]:
+        """(user_id, guild_id, issued_at, expires_at, mac) si la signature est valide, sinon None."""
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (ValueError, TypeError):
+            return None
+        if len(raw) != self._PAYLOAD.size + self.MAC_SIZE:
+            return None
+        payload, mac = raw[:self._PAYLOAD.size], raw[self._PAYLOAD.size:]
+        if not hmac.compare_digest(mac, self._mac(payload)):
+            return None
+        user_id, guild_id, issued_at, expires_at = self._PAYLOAD.unpack(payload)
+        return user_id, guild_id or None, issued_at, expires_at, mac
+
+
+class TokenStore:
+    def __init__(
+        self,
+        storage: Storage,
+        ttl: float = 1800,
+        max_memory: int = 10000,
+        sweep_interval: float = 300,
+        sweep_batch: int = 500,
+        secret: Optional[str] = None,
+    ):
+        self.storage = storage
+        self.codec = SignedTokenCodec(secret) if secret else None
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self._entries: "OrderedDict[str, Tuple[int, Optional[int], float]]" = OrderedDict()
+        self.issued = 0
+        self.consumed = 0
+        self.expired = 0
+        self.swept = 0
+        self.replayed = 0
+        self.forged = 0
+
+    @property
+    def signed(self) -> bool:
+        return self.codec is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remember(self, token: str, user_id: int, guild_id: Optional[int], issued_at: float):
+        self._entries[token] = (user_id, guild_id, issued_at)
+        while len(self._entries) > self.max_memory:
+            # Les plus anciens restent consultables en base jusqu'à leur expiration
+            self._entries.popitem(last=False)
+
+    def load(self) -> int:
+        """Charge en mémoire les tokens encore valides (synchrone, au démarrage)."""
+        if self.signed:
+            return 0
+        cutoff = time.time() - self.ttl
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT token, user_id, guild_id, issued_at FROM pending_tokens WHERE issued_at > ? ORDER BY issued_at DESC LIMIT ?",
+            (cutoff, self.max_memory)
+        ).fetchall())
+        for row in reversed(rows):
+            self._remember(row["token"], row["user_id"], row["guild_id"], row["issued_at"])
+        logging.info(f"Tokens de vérification chargés : {len(self._entries)}")
+        return len(self._entries)
+
+    async def issue(self, user_id: int, guild_id: Optional[int]) -> str:
+        """Crée un nouveau token pour ``user_id`` (persisté, sauf en mode signé)."""
+        now = time.time()
+        if self.signed:
+            self.issued += 1
+            return self.codec.encode(user_id, guild_id, now, now + self.ttl)
+        token = secrets.token_urlsafe(16)
+        self._remember(token, user_id, guild_id, now)
+        await self.storage.execute(
+            "INSERT OR REPLACE INTO pending_tokens (token, user_id, guild_id, created_at, issued_at) VALUES (?, ?, ?, ?, ?)",
+            (token, user_id, guild_id, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)), now)
+        )
+        self.issued += 1
+        return token
+
+    async def consume(self, token: str) -> Optional[Tuple[int, Optional[int]]]:
+        """Retire le token et retourne (user_id, guild_id), ou None s'il est inconnu ou expiré."""
+        if self.signed:
+            return await self._consume_signed(token)
+        entry = self._entries.pop(token, None)
+
+        def _pop(conn):
+            row = conn.execute("SELECT user_id, guild_id, issued_at FROM pending_tokens WHERE token = ?", (token,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM pending_tokens WHERE token = ?", (token,))
+            return row
+
+        # La ligne est supprimée dans tous les cas : un token ne sert qu'une fois, même après redémarrage
+        row = await self.storage.write(_pop)
+        if entry is None and row is not None:
+            entry = (row["user_id"], row["guild_id"], row["issued_at"] or 0)
+        if entry is None:
+            return None
+        user_id, guild_id, issued_at = entry
+        if issued_at + self.ttl <= time.time():
+            self.expired += 1
+            logging.info(f"Token expiré présenté pour l'utilisateur {user_id}")
+            return None
+        self.consumed += 1
+        return user_id, guild_id
+
+    async def _consume_signed(self, token: str) -> Optional[Tuple[int, Optional[int]]]:
+        decoded = self.codec.decode(token)
+        if decoded is None:
+            self.forged += 1
+            return None
+        user_id, guild_id, _, expires_at, mac = decoded
+        if expires_at <= time.time():
+            self.expired += 1
+            logging.info(f"Token signé expiré présenté pour l'utilisateur {user_id}")
+            return None
+        # Marqueur d'usage unique : l'INSERT échoue (rowcount 0) si le token a déjà servi
+        inserted = await self.storage.write(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO used_tokens (mac, expires_at) VALUES (?, ?)", (mac, expires_at)
+        ).rowcount)
+        if not inserted:
+            self.replayed += 1
+            logging.warning(f"Token signé déjà utilisé, présenté à nouveau pour l'utilisateur {user_id}")
+            return None
+        self.consumed += 1
+        return user_id, guild_id
+
+    async def sweep(self) -> int:
+        """Supprime les tokens expirés, par lots pour ne pas monopoliser l'écrivain."""
+        cutoff = time.time() - self.ttl
+        while self._entries:
+            token, (_, _, issued_at) = next(iter(self._entries.items()))
+            if issued_at > cutoff:
+                break
+            self._entries.popitem(last=False)
+        total = 0
+        while True:
+            deleted = await self.storage.write(lambda conn: conn.execute(
+                "DELETE FROM pending_tokens WHERE token IN "
+                "(SELECT token FROM pending_tokens WHERE COALESCE(issued_at, 0) <= ? LIMIT ?)",
+                (cutoff, self.sweep_batch)
+            ).rowcount)
+            total += deleted
+            if deleted < self.sweep_batch:
+                break
+        now = time.time()
+        while True:
+            deleted = await self.storage.write(lambda conn: conn.execute(
+                "DELETE FROM used_tokens WHERE mac IN (SELECT mac FROM used_tokens WHERE expires_at <= ? LIMIT ?)",
+                (now, self.sweep_batch)
+            ).rowcount)
+            total += deleted
+            if deleted < self.sweep_batch:
+                break
+        if total:
+            self.swept += total
+            logging.info(f"🧹 {total} tokens de vérification expirés supprimés")
+        return total
+
+    async def run(self, also: Sequence[Callable[[], Awaitable[int]]] = ()):
+        """Tâche de fond : purge périodique des tokens expirés, puis des autres tables passées dans ``also``."""
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logging.exception("Erreur lors de la purge des tokens expirés")
+            for purge in also:
+                try:
+                    await purge()
+                except Exception:
+                    logging.exception(f"Erreur lors de la purge périodique ({purge.__qualname__})")
+            await asyncio.sleep(self.sweep_interval)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_memory": len(self._entries),
+            "issued": self.issued,
+            "consumed": self.consumed,
+            "expired": self.expired,
+            "swept": self.swept,
+            "replayed": self.replayed,
+            "forged": self.forged,
+        }
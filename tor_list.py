@@ -0,0 +1,154 @@
+"""Liste des nœuds de sortie Tor, rafraîchie en tâche de fond.
+
+Les adresses sont stockées sous forme d'entiers triés (``array`` 32 bits pour
+l'IPv4, tuple d'entiers pour l'IPv6) et recherchées par dichotomie. Le
+téléchargement utilise ETag / If-Modified-Since et la dernière copie valide
+est sauvegardée sur disque pour un démarrage à chaud.
+"""
+import asyncio
+import bisect
+import ipaddress
+import json
+import logging
+import os
+import time
+from array import array
+from typing import Iterable, Optional
+
+import aiohttp
+
+from http_client import HttpClient
+
+
+def _parse_exit_list(text: str) -> Iterable[str]:
+    """Accepte le format ``exit-addresses`` (lignes ExitAddress) ou une IP par ligne."""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('ExitAddress'):
+            parts = line.split()
+            if len(parts) >= 2:
+                yield parts[1]
+        elif ' ' not in line:
+            yield line
+
+
+class TorExitList:
+    def __init__(self, url: str, http: HttpClient, cache_path: Optional[str] = None, interval: float = 3600):
+        self.url = url
+        self.http = http
+        self.cache_path = cache_path
+        self.interval = interval
+        self._v4 = array('I')
+        self._v6: tuple = ()
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.updated = 0.0
+
+    def __len__(self) -> int:
+        return len(self._v4) + len(self._v6)
+
+    def __contains__(self, ip: str) -> bool:
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        if addr.version == 6 and addr.ipv4_mapped is not None:
+            addr = addr.ipv4_mapped
+        seq = self._v4 if addr.version == 4 else self._v6
+        value = int(addr)
+        i = bisect.bisect_left(seq, value)
+        return i < len(seq) and seq[i] == value
+
+    def _replace(self, ips: Iterable[str]):
+        v4, v6 = set(), set()
+        for ip in ips:
+            try:
+                addr = ipaddress.ip_address(ip)
+            except ValueError:
+                continue
+            if addr.version == 6 and addr.ipv4_mapped is not None:
+                addr = addr.ipv4_mapped
+            (v4 if addr.version == 4 else v6).add(int(addr))
+        # Réaffectation en bloc : les lecteurs voient l'ancienne ou la nouvelle liste, jamais un mélange
+        self._v4 = array('I', sorted(v4))
+        self._v6 = tuple(sorted(v6))
+
+    def _addresses(self) -> Iterable[str]:
+        for value in self._v4:
+            yield str(ipaddress.IPv4Address(value))
+        for value in self._v6:
+            yield str(ipaddress.IPv6Address(value))
+
+    def load_cache(self) -> bool:
+        """Charge la dernière copie sauvegardée (démarrage à chaud)."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._replace(data.get('ips', []))
+            self.etag = data.get('etag')
+            self.last_modified = data.get('last_modified')
+            self.updated = data.get('updated', 0.0)
+        except Exception:
+            logging.exception(f"Impossible de lire la copie locale de la liste Tor ({self.cache_path})")
+            return False
+        logging.info(f"Liste Tor chargée depuis le disque : {len(self)} adresses")
+        return True
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        data = {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'updated': self.updated,
+            'ips': list(self._addresses()),
+        }
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        # Fichier temporaire propre au processus : plusieurs processus web peuvent rafraîchir en même temps
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.cache_path)
+
+    async def refresh(self) -> bool:
+        """Télécharge la liste si elle a changé. Retourne True si la liste a été remplacée."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        async with self.http.session.get(self.url, headers=headers, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+            if resp.status == 304:
+                self.updated = time.time()
+                logging.info("Liste Tor inchangée (304)")
+                return False
+            if resp.status != 200:
+                raise RuntimeError(f"Liste Tor HTTP {resp.status}")
+            text = await resp.text()
+            self.etag = resp.headers.get('ETag')
+            self.last_modified = resp.headers.get('Last-Modified')
+        self._replace(_parse_exit_list(text))
+        self.updated = time.time()
+        logging.info(f"Liste Tor rafraîchie : {len(self)} adresses")
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._save_cache)
+        except Exception:
+            logging.exception("Impossible de sauvegarder la liste Tor sur disque")
+        return True
+
+    async def run(self):
+        """Tâche de fond : rafraîchit la liste à intervalle régulier, sans jamais bloquer /verify."""
+        while True:
+            delay = self.interval - (time.time() - self.updated)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except Exception:
+                logging.exception("Impossible de rafraîchir la liste Tor (nouvel essai plus tard)")
+                # En cas d'échec on réessaie plus tôt, sans marteler le serveur
+                self.updated = time.time() - self.interval + min(300, self.interval)
@@ -0,0 +1,137 @@
+"""Traçage léger des requêtes /verify par spans imbriqués.
+
+Une trace est attachée à la tâche courante via ``contextvars`` : les tâches
+créées pendant la requête (étapes VPN parallèles) héritent du span parent.
+Les traces plus lentes que le seuil sont journalisées avec leur arbre complet
+et conservées dans un petit tampon circulaire ; une fraction des autres peut
+être échantillonnée.
+"""
+import collections
+import contextvars
+import functools
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Deque, List, Optional
+
+
+class Span:
+    __slots__ = ('name', 'parent', 'start', 'end', 'attrs', 'error')
+
+    def __init__(self, name: str, parent: Optional['Span'], attrs: dict):
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attrs = attrs
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+
+class Trace:
+    def __init__(self, name: str, **attrs):
+        self.root = Span(name, None, attrs)
+        self.spans: List[Span] = [self.root]
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def _depth(self, span: Span) -> int:
+        depth = 0
+        while span.parent is not None:
+            span, depth = span.parent, depth + 1
+        return depth
+
+    def format(self) -> str:
+        """Arbre des spans, décalages et durées en ms relatifs au début de la requête."""
+        origin = self.root.start
+        lines = []
+        for span in sorted(self.spans, key=lambda s: (s.start, self._depth(s))):
+            attrs = ' '.join(f"{k}={v}" for k, v in span.attrs.items())
+            status = f" ❌ {span.error}" if span.error else ("" if span.end is not None else " (inachevé)")
+            lines.append(
+                f"{'  ' * self._depth(span)}{span.name} +{(span.start - origin) * 1000:.1f}ms "
+                f"{span.duration_ms:.1f}ms{(' ' + attrs) if attrs else ''}{status}"
+            )
+        return '\n'.join(lines)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('current_trace', default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Span enfant du span courant ; sans effet (ou presque) hors d'une trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    s = Span(name, _current_span.get() or trace.root, attrs)
+    trace.spans.append(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+class Tracer:
+    def __init__(self, slow_ms: float = 1000, sample_rate: float = 0.0, keep: int = 20):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.recent_slow: Deque[Trace] = collections.deque(maxlen=keep)
+        self.slow_count = 0
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        trace = Trace(name, **attrs)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(trace.root)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.root.error = type(e).__name__
+            raise
+        finally:
+            trace.root.end = time.perf_counter()
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            self._finish(trace)
+
+    def _finish(self, trace: Trace):
+        if trace.duration_ms >= self.slow_ms:
+            self.slow_count += 1
+            self.recent_slow.append(trace)
+            logging.warning(f"🐢 Requête lente ({trace.duration_ms:.0f} ms) :\n{trace.format()}")
+        elif self.sample_rate and random.random() < self.sample_rate:
+            logging.info(f"Trace échantillonnée ({trace.duration_ms:.0f} ms) :\n{trace.format()}")
+
+    def traced(self, name: str):
+        """Décorateur pour un handler aiohttp : une trace par requête."""
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(request, *args, **kwargs):
+                with self.trace(name, path=request.path) as trace:
+                    response = await handler(request, *args, **kwargs)
+                    trace.root.attrs['status'] = response.status
+                    return response
+            return wrapper
+        return decorator
+
+
+def annotate(**attrs):
+    """Ajoute des attributs au span courant (ex. verdict, source du cache)."""
+    s = _current_span.get()
+    if s is not None:
+        s.attrs.update(attrs)
@@ -0,0 +1,140 @@
+"""Cache LRU + TTL des verdicts VPN/proxy, persisté dans SQLite.
+
+Les verdicts positifs, négatifs et en erreur ont chacun leur propre durée de
+vie. Le cache mémoire est borné ; les entrées évincées restent consultables
+dans la table ``ip_verdicts`` tant qu'elles ne sont pas expirées.
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from iputils import canonical_ip
+from storage import Storage
+
+
+class VerdictCache:
+    def __init__(
+        self,
+        storage: Storage,
+        max_size: int = 10000,
+        ttl_positive: float = 24 * 3600,
+        ttl_negative: float = 6 * 3600,
+        ttl_error: float = 300,
+        purge_batch: int = 500,
+    ):
+        self.storage = storage
+        self.max_size = max_size
+        self.ttls = {"positive": ttl_positive, "negative": ttl_negative, "error": ttl_error}
+        self.purge_batch = purge_batch
+        self._entries: "OrderedDict[str, Tuple[bool, dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db_hits = 0
+        self.iphub_saved = 0
+        self.purged = 0
+
+    @staticmethod
+    def classify(is_vpn: bool, details: dict) -> str:
+        # Un refus dû uniquement à des étapes hors délai (politique « deny ») n'est pas un vrai positif :
+        # il doit être réévalué aussi vite qu'une erreur
+        degraded = any(check.startswith("degraded_deny:") for check in details.get("checks", ()))
+        if is_vpn and not degraded:
+            return "positive"
+        if degraded or details.get("errors") or details.get("timeouts"):
+            return "error"
+        return "negative"
+
+    def load(self) -> int:
+        """Charge en mémoire les verdicts encore valides les plus récents (synchrone, au démarrage)."""
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT ip_address, is_vpn, details, expires_at FROM ip_verdicts WHERE expires_at > ? "
+            "ORDER BY checked_at DESC LIMIT ?",
+            (time.time(), self.max_size)
+        ).fetchall())
+        for row in reversed(rows):
+            self._remember(row["ip_address"], bool(row["is_vpn"]), json.loads(row["details"] or "{}"), row["expires_at"])
+        logging.info(f"Cache de verdicts IP chargé : {len(self._entries)} entrées")
+        return len(self._entries)
+
+    def _remember(self, ip: str, is_vpn: bool, details: dict, expires_at: float):
+        self._entries[ip] = (is_vpn, details, expires_at)
+        self._entries.move_to_end(ip)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, ip: str) -> Optional[Tuple[bool, dict]]:
+        key = canonical_ip(ip) or ip
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is None:
+            row = await self.storage.fetchone(
+                "SELECT is_vpn, details, expires_at FROM ip_verdicts WHERE ip_address = ? AND expires_at > ?",
+                (key, now)
+            )
+            if row:
+                entry = (bool(row["is_vpn"]), json.loads(row["details"] or "{}"), row["expires_at"])
+                self._remember(key, *entry)
+                self.db_hits += 1
+        if entry is None or entry[2] <= now:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        is_vpn, details, _ = entry
+        if "iphub" in details:
+            self.iphub_saved += 1
+        return is_vpn, dict(details, cached=True)
+
+    async def put(self, ip: str, is_vpn: bool, details: dict):
+        key = canonical_ip(ip) or ip
+        verdict = self.classify(is_vpn, details)
+        now = time.time()
+        expires_at = now + self.ttls[verdict]
+        self._remember(key, is_vpn, details, expires_at)
+        try:
+            await self.storage.execute(
+                "INSERT OR REPLACE INTO ip_verdicts (ip_address, is_vpn, verdict, details, checked_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, is_vpn, verdict, json.dumps(details, default=str), now, expires_at)
+            )
+        except Exception:
+            logging.exception(f"Impossible de persister le verdict pour {key}")
+
+    async def purge_expired(self) -> int:
+        """Supprime les verdicts expirés de la table, par lots pour ne pas monopoliser l'écrivain."""
+        now = time.time()
+        total = 0
+        while True:
+            deleted = await self.storage.write(lambda conn: conn.execute(
+                "DELETE FROM ip_verdicts WHERE ip_address IN "
+                "(SELECT ip_address FROM ip_verdicts WHERE expires_at <= ? LIMIT ?)",
+                (now, self.purge_batch)
+            ).rowcount)
+            total += deleted
+            if deleted < self.purge_batch:
+                break
+        self.purged += total
+        return total
+
+    async def get_or_check(self, ip: str, check: Callable[[str], Awaitable[Tuple[bool, dict]]]) -> Tuple[bool, dict]:
+        cached = await self.get(ip)
+        if cached is not None:
+            return cached
+        is_vpn, details = await check(ip)
+        await self.put(ip, is_vpn, details)
+        return is_vpn, details
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "db_hits": self.db_hits,
+            "iphub_saved": self.iphub_saved,
+            "purged": self.purged,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
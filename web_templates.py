@@ -0,0 +1,257 @@
+"""Pages HTML de /verify : gabarits précompilés, fichiers statiques et compression.
+
+Les gabarits sont découpés une seule fois au chargement ; un rendu ne fait
+qu'intercaler les champs dynamiques (échappés) entre les morceaux fixes. Le
+CSS et le JS sont servis depuis ``/static`` avec un ETag, un cache long et des
+versions gzip / brotli précalculées.
+"""
+import datetime
+import gzip
+import hashlib
+import html
+import mimetypes
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+from aiohttp import web
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except Exception:
+    BROTLI_AVAILABLE = False
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DEFAULT_LOGO = "https://i.imgur.com/8Km9tLL.png"
+# En dessous de cette taille la compression coûte plus qu'elle ne rapporte
+MIN_COMPRESS_SIZE = 512
+
+
+class StaticAsset:
+    def __init__(self, name: str, body: bytes):
+        self.name = name
+        self.body = body
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        digest = hashlib.sha1(body).hexdigest()
+        self.version = digest[:12]
+        self.etag = f'"{digest}"'
+        self.encoded = {'gzip': gzip.compress(body, compresslevel=9)}
+        if BROTLI_AVAILABLE:
+            self.encoded['br'] = brotli.compress(body, quality=11)
+
+
+def load_static_assets(directory: str = STATIC_DIR) -> Dict[str, StaticAsset]:
+    assets = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                assets[name] = StaticAsset(name, f.read())
+    return assets
+
+
+ASSETS = load_static_assets()
+
+
+def asset_url(name: str) -> str:
+    """URL versionnée : le contenu change ⇒ l'URL change, on peut donc cacher indéfiniment."""
+    return f"/static/{name}?v={ASSETS[name].version}"
+
+
+def accepted_encodings(header: Optional[str]) -> List[str]:
+    """Encodages acceptés par le client (q=0 exclus), sans ordre de préférence."""
+    accepted = []
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        if not token:
+            continue
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.append(token.strip().lower())
+    return accepted
+
+
+def _pick_encoding(header: Optional[str], available: Iterable[str]) -> Optional[str]:
+    accepted = accepted_encodings(header)
+    for encoding in ('br', 'gzip'):
+        if encoding in available and (encoding in accepted or '*' in accepted):
+            return encoding
+    return None
+
+
+class PageTemplate:
+    """Gabarit ``{{champ}}`` découpé une fois pour toutes en morceaux fixes et champs."""
+
+    _FIELD = re.compile(r'{{(\w+)}}')
+
+    def __init__(self, source: str, raw_fields: Iterable[str] = ()):
+        pieces = self._FIELD.split(source)
+        self._literals = pieces[0::2]
+        self._fields = pieces[1::2]
+        self._raw = frozenset(raw_fields)
+
+    def render(self, **values) -> str:
+        out = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            value = str(values.get(field, ''))
+            out.append(value if field in self._raw else html.escape(value))
+            out.append(literal)
+        return ''.join(out)
+
+
+_HEAD = f"""<!doctype html>
+<html lang="fr">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width,initial-scale=1">
+  <title>{{{{title}}}}</title>
+  <link rel="stylesheet" href="{asset_url('verify.css')}">
+</head>
+<body style="--accent:{{{{accent_color}}}}">
+  <div class="card">"""
+
+PAGE_TEMPLATE = PageTemplate(_HEAD + """
+    <div class="fadeIn">
+      <img src="{{guild_logo}}" class="logo" alt="Logo serveur">
+      <h1>{{heading}}</h1>
+      <p>{{message}}</p>
+      {{details_block}}
+      <a class="btn" href="/">Retour</a>
+      <footer>{{guild_name}} — {{timestamp}}Z</footer>
+    </div>
+  </div>
+</body>
+</html>
+""", raw_fields=('details_block',))
+
+DELAY_TEMPLATE = PageTemplate(_HEAD + f"""
+    <div id="analysis" class="fadeIn">
+      <img src="{{{{guild_logo}}}}" class="logo" alt="Logo serveur">
+      <h1>Analyse en cours...</h1>
+      <div class="spinner"></div>
+      <p class="muted">Le système vérifie votre identité, cela prend quelques secondes...</p>
+    </div>
+
+    <div id="result" class="fadeIn hidden" data-delay="{{{{delay_ms}}}}">
+      <img src="{{{{guild_logo}}}}" class="logo" alt="Logo serveur">
+      <h1>{{{{heading}}}}</h1>
+      <p>{{{{message}}}}</p>
+      {{{{details_block}}}}
+      <a class="btn" href="/">Retour</a>
+      <footer>{{{{guild_name}}}} — {{{{timestamp}}}}Z</footer>
+    </div>
+  </div>
+  <script src="{asset_url('verify.js')}" defer></script>
+</body>
+</html>
+""", raw_fields=('details_block',))
+
+
+def _details_block(details: Optional[str]) -> str:
+    return f"<p class='details'>{html.escape(details)}</p>" if details else ""
+
+
+def render_html_page(
+    title: str,
+    heading: str,
+    message: str,
+    details: Optional[str] = None,
+    guild_name: str = "Serveur Discord",
+    guild_logo: str = DEFAULT_LOGO,
+    accent_color: str = "#2ECC71"
+) -> str:
+    """Page statique moderne et responsive avec thème dynamique."""
+    return PAGE_TEMPLATE.render(
+        title=title, heading=heading, message=message,
+        details_block=_details_block(details),
+        guild_name=guild_name, guild_logo=guild_logo, accent_color=accent_color,
+        timestamp=datetime.datetime.utcnow().isoformat(),
+    )
+
+
+def render_html_with_delay(
+    title: str,
+    heading: str,
+    message: str,
+    details: Optional[str] = None,
+    delay_ms: int = 6000,
+    guild_name: str = "Serveur Discord",
+    guild_logo: str = DEFAULT_LOGO,
+    accent_color: str = "#2ECC71"
+) -> str:
+    """Page dynamique avec spinner + transition douce du résultat."""
+    return DELAY_TEMPLATE.render(
+        title=title, heading=heading, message=message,
+        details_block=_details_block(details),
+        delay_ms=int(delay_ms),
+        guild_name=guild_name, guild_logo=guild_logo, accent_color=accent_color,
+        timestamp=datetime.datetime.utcnow().isoformat(),
+    )
+
+
+def prerender_page(name: str, title: str, heading: str, message: str, accent_color: str = "#E74C3C") -> StaticAsset:
+    """Page rendue une seule fois au démarrage, avec ses versions compressées (réponses de rejet)."""
+    return StaticAsset(name, render_html_page(title, heading, message, accent_color=accent_color).encode('utf-8'))
+
+
+def prerendered_response(request: web.Request, page: StaticAsset, status: int = 200,
+                         headers: Optional[Dict[str, str]] = None) -> web.Response:
+    """Sert une page précalculée : ni rendu ni compression à la requête."""
+    headers = dict(headers or {})
+    headers.update({'Cache-Control': 'no-store', 'Vary': 'Accept-Encoding'})
+    encoding = _pick_encoding(request.headers.get('Accept-Encoding'), page.encoded)
+    body = page.body
+    if encoding:
+        body = page.encoded[encoding]
+        headers['Content-Encoding'] = encoding
+    return web.Response(body=body, status=status, content_type='text/html', charset='utf-8', headers=headers)
+
+
+async def handle_static(request: web.Request) -> web.Response:
+    """Sert /static/{name} depuis la mémoire, avec ETag et cache long (URL versionnée)."""
+    asset = ASSETS.get(request.match_info['name'])
+    if asset is None:
+        raise web.HTTPNotFound()
+    headers = {
+        'ETag': asset.etag,
+        'Cache-Control': 'public, max-age=31536000, immutable',
+        'Vary': 'Accept-Encoding',
+    }
+    if asset.etag in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers=headers)
+    encoding = _pick_encoding(request.headers.get('Accept-Encoding'), asset.encoded)
+    body = asset.body
+    if encoding:
+        body = asset.encoded[encoding]
+        headers['Content-Encoding'] = encoding
+    return web.Response(body=body, content_type=asset.content_type, headers=headers)
+
+
+@web.middleware
+async def compression_middleware(request: web.Request, handler):
+    """Compresse les pages HTML dynamiques (brotli si disponible, sinon gzip)."""
+    response = await handler(request)
+    if (
+        not isinstance(response, web.Response)
+        or response.headers.get('Content-Encoding')
+        or not response.content_type.startswith('text/')
+        or response.body is None
+        or len(response.body) < MIN_COMPRESS_SIZE
+    ):
+        return response
+    available = ('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',)
+    encoding = _pick_encoding(request.headers.get('Accept-Encoding'), available)
+    if encoding is None:
+        return response
+    body = bytes(response.body)
+    response.body = brotli.compress(body, quality=4) if encoding == 'br' else gzip.compress(body, compresslevel=6)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -0,0 +1,73 @@
+"""Supervision des processus web (mode multi-processus).
+
+Le processus gateway lance ``count`` copies de ``argv`` ; chaque copie reçoit
+``WEB_WORKER_ID`` dans son environnement et écoute sur le même port
+(SO_REUSEPORT : le noyau répartit les connexions). Un processus qui meurt est
+relancé, avec un délai croissant s'il meurt en boucle.
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import Dict, List, Optional
+
+WORKER_ENV = "WEB_WORKER_ID"
+
+
+class WorkerSupervisor:
+    def __init__(self, count: int, argv: List[str], max_backoff: float = 30.0, stop_timeout: float = 10.0):
+        self.count = count
+        self.argv = argv
+        self.max_backoff = max_backoff
+        self.stop_timeout = stop_timeout
+        self._procs: Dict[int, asyncio.subprocess.Process] = {}
+        self._stopping = False
+        self.restarts = 0
+
+    async def _spawn(self, worker_id: int) -> asyncio.subprocess.Process:
+        env = dict(os.environ, **{WORKER_ENV: str(worker_id)})
+        proc = await asyncio.create_subprocess_exec(*self.argv, env=env)
+        self._procs[worker_id] = proc
+        logging.info(f"🧵 Processus web {worker_id} démarré (pid {proc.pid})")
+        return proc
+
+    async def _keep_alive(self, worker_id: int):
+        backoff = 1.0
+        while not self._stopping:
+            started = time.monotonic()
+            proc = await self._spawn(worker_id)
+            code = await proc.wait()
+            if self._stopping:
+                return
+            # Un processus qui a tenu une minute repart immédiatement ; sinon on espace les relances
+            backoff = 1.0 if time.monotonic() - started > 60 else min(backoff * 2, self.max_backoff)
+            self.restarts += 1
+            logging.error(f"❌ Processus web {worker_id} arrêté (code {code}), relance dans {backoff:.0f}s")
+            await asyncio.sleep(backoff)
+
+    async def run(self):
+        await asyncio.gather(*(self._keep_alive(i) for i in range(self.count)))
+
+    async def stop(self):
+        """SIGTERM à tous les processus web, puis SIGKILL à ceux qui traînent."""
+        self._stopping = True
+        procs = [p for p in self._procs.values() if p.returncode is None]
+        for proc in procs:
+            proc.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in procs)), self.stop_timeout)
+        except asyncio.TimeoutError:
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+
+    def stats(self) -> dict:
+        alive = sum(1 for p in self._procs.values() if p.returncode is None)
+        return {"workers": self.count, "alive": alive, "restarts": self.restarts}
+
+
+def worker_id() -> Optional[int]:
+    """Identifiant du processus web courant, ou None dans le processus gateway."""
+    value = os.getenv(WORKER_ENV)
+    return int(value) if value is not None else None